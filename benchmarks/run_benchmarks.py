@@ -0,0 +1,190 @@
+from fasma.core import file_reader as fr
+from fasma.core import spectrum as sp
+from fasma.core import boxes as bx
+from fasma.gaussian import parse_basic
+from fasma.gaussian import parse_td
+from fasma.gaussian import parse_cas
+from fasma.gaussian import parse_pop
+from fasma.gaussian import parse_gaussian as pg
+from benchmarks import synthetic_logs as sl
+from importlib import metadata
+import numpy as np
+import statistics
+import tracemalloc
+import argparse
+import platform
+import tempfile
+import json
+import time
+import os
+
+# The logs of every benchmark case, each given as the keyword arguments of synthetic_logs.generate_log
+CASES = {
+    "water_td_small": dict(template="water_td-rhf"),
+    "water_td_medium": dict(template="water_td-rhf", n_basis=130, n_excited_state=50),
+    "water_td_large": dict(template="water_td-rhf", n_basis=390, n_excited_state=150),
+    "water_td_jobs": dict(template="water_td-rhf", n_basis=130, n_excited_state=50, n_job=4),
+    "water_cas_medium": dict(template="water_td-rhf", n_basis=130, n_cas_root=20),
+    "na_uhf_medium": dict(template="Na_uhf", n_basis=160),
+    "ammonia_ghf_medium": dict(template="ammonia_casscf_pop", n_basis=75),
+}
+DEFAULT_CASES = ["water_td_small", "water_td_medium", "water_cas_medium", "na_uhf_medium", "ammonia_ghf_medium"]
+
+
+def get_stages(filename: str) -> list:
+    """
+    Returns every stage of parsing and analyzing the first job of a log as (name, function) pairs. Every function
+    takes the results of the previous stages as a dict and returns its own result, which is added to the dict under
+    its name. A stage returning None ends the benchmark of the stages depending on it.
+    """
+    def run_spectrum(results):
+        excitation_matrix = results["check_cas"].excitation_matrix
+        spectrum = sp.SimulatedSpectrum(x=excitation_matrix[:, 2], y=excitation_matrix[:, 3])
+        spectrum.gen_spect(broad=0.5, wlim=(0, 30), res=100)
+        return spectrum
+
+    return [
+        ("read_gaussian", lambda results: fr.read_gaussian(filename, pg.get_words())),
+        ("get_basic", lambda results: parse_basic.get_basic(results["read_gaussian"][0][0], results["read_gaussian"][1][0])),
+        ("check_td", lambda results: parse_td.check_td(results["get_basic"], results["read_gaussian"][0][0],
+                                                       results["read_gaussian"][1][0])),
+        # Only CAS jobs are parsed by check_cas, so TD results are carried over to the stages using the spectra
+        ("check_cas", lambda results: results["check_td"] or parse_cas.check_cas(
+            results["get_basic"], results["read_gaussian"][0][0], results["read_gaussian"][1][0])),
+        ("check_pop", lambda results: parse_pop.check_pop(
+            results["get_basic"], results["read_gaussian"][0][0], results["read_gaussian"][1][0],
+            results["check_cas"] is not None and results["check_cas"].methodology == "CAS")),
+        ("box", lambda results: bx.Box(basic_data=results["get_basic"], spectra_data=results["check_cas"],
+                                       pop_data=results["check_pop"])),
+        ("generate_mo_analysis", lambda results: results["check_pop"] and results["box"].generate_mo_analysis()),
+        ("generate_mo_transition_analysis",
+         lambda results: results["check_cas"] and results["box"].generate_mo_transition_analysis()),
+        ("generate_ao_transition_analysis",
+         lambda results: results["check_cas"] and results["check_pop"] and results["box"].generate_ao_transition_analysis()),
+        ("gen_spect", lambda results: results["check_cas"] and run_spectrum(results)),
+    ]
+
+
+def time_stages(stages: list, repeat: int) -> dict:
+    """
+    Times every stage the given number of times, using the results of the first run of the previous stages.
+    :return: a dict of the min, median and max run time of every stage in seconds
+    """
+    results = {}
+    timings = {}
+    for name, function in stages:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function(results)
+            times.append(time.perf_counter() - start)
+        results[name] = result
+        timings[name] = {"min": min(times), "median": statistics.median(times), "max": max(times)}
+    return timings
+
+
+def measure_stages(stages: list) -> dict:
+    """
+    Measures the memory allocated by every stage in a separate run, since tracing allocations slows down the stages.
+    :return: a dict of the peak and retained memory of every stage in bytes
+    """
+    results = {}
+    memory = {}
+    tracemalloc.start()
+    try:
+        for name, function in stages:
+            tracemalloc.reset_peak()
+            start_size = tracemalloc.get_traced_memory()[0]
+            results[name] = function(results)
+            size, peak = tracemalloc.get_traced_memory()
+            memory[name] = {"peak": peak - start_size, "retained": size - start_size}
+    finally:
+        tracemalloc.stop()
+    return memory
+
+
+def run_case(name: str, directory: str, repeat: int) -> dict:
+    """
+    Generates the log of a benchmark case (see CASES) in the given directory and benchmarks every stage on it.
+    :return: a dict holding the parameters, the size of the log and the timings and memory of every stage
+    """
+    parameters = CASES[name]
+    filename = os.path.join(directory, name + ".log")
+    if not os.path.exists(filename):
+        sl.write_log(filename, **parameters)
+    stages = get_stages(filename)
+    timings = time_stages(stages, repeat)
+    memory = measure_stages(stages)
+    return {
+        "parameters": parameters,
+        "file_size": os.path.getsize(filename),
+        "stages": {stage_name: {**timings[stage_name], **memory[stage_name]} for stage_name, _ in stages},
+    }
+
+
+def get_metadata(repeat: int) -> dict:
+    try:
+        version = metadata.version("fasma")
+    except metadata.PackageNotFoundError:
+        version = None
+    return {
+        "fasma": version,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results: dict, previous_results: dict) -> dict:
+    """
+    Compares the median run time of every stage with a previous run of the benchmarks.
+    :return: a dict of the ratio of the new to the previous median time of every stage found in both runs
+    """
+    ratios = {}
+    for case_name, case in results["cases"].items():
+        previous_case = previous_results.get("cases", {}).get(case_name)
+        if previous_case is None:
+            continue
+        for stage_name, stage in case["stages"].items():
+            previous_stage = previous_case["stages"].get(stage_name)
+            if previous_stage is not None and previous_stage["median"] > 0:
+                ratios.setdefault(case_name, {})[stage_name] = stage["median"] / previous_stage["median"]
+    return ratios
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Times and memory-profiles fasma on synthetic Gaussian logs.")
+    parser.add_argument("cases", nargs="*", default=DEFAULT_CASES,
+                        help="the benchmark cases to run (" + ", ".join(CASES) + ")")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="the JSON file of the results")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="the number of timed runs of every stage")
+    parser.add_argument("-d", "--log-dir", help="a directory keeping the generated logs between runs")
+    parser.add_argument("-c", "--compare", help="the JSON file of a previous run to compare the results with")
+    args = parser.parse_args(argv)
+    unknown_cases = [case_name for case_name in args.cases if case_name not in CASES]
+    if unknown_cases:
+        parser.error("unknown cases " + ", ".join(unknown_cases))
+
+    results = {"metadata": get_metadata(args.repeat), "cases": {}}
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        directory = args.log_dir or temporary_directory
+        os.makedirs(directory, exist_ok=True)
+        for case_name in args.cases:
+            results["cases"][case_name] = run_case(case_name, directory, args.repeat)
+            for stage_name, stage in results["cases"][case_name]["stages"].items():
+                print("{:20s} {:32s} {:10.4f} s {:10.1f} MiB".format(case_name, stage_name, stage["median"],
+                                                                     stage["peak"] / 2 ** 20))
+    if args.compare:
+        with open(args.compare) as previous_file:
+            results["comparison"] = compare(results, json.load(previous_file))
+        for case_name, ratios in results["comparison"].items():
+            for stage_name, ratio in ratios.items():
+                print("{:20s} {:32s} {:10.2f}x".format(case_name, stage_name, ratio))
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+from collections import Counter
+import numpy as np
+import math as m
+import re
+import os
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "doc", "data")
+TEMPLATES = ["water_td-rhf", "Na_uhf", "ammonia_casscf_pop"]
+
+NUMBER_PATTERN = re.compile(r"-?\d*\.\d+(?:[DE][-+]\d+)?")
+LABEL_PATTERN = re.compile(r"(\s*)(\d+)(.*)", re.S)
+ATOM_LABEL_PATTERN = re.compile(r"(\s+)(\d+)(\s+)(?=[A-Z][a-z]?\s)")
+ATOM_LINE_PATTERN = re.compile(r" [A-Z][a-z]?[\s,]")
+AMPLITUDE_PATTERN = re.compile(r"(\d+)([AB]?)(\s*)(->|<-)(\s*)(\d+)([AB]?)")
+HEADER_TOKEN_PATTERN = re.compile(r"\d+[a-z]?")
+SPIN_ORBITAL_PATTERN = re.compile(r"\s*\d+[ab](?:[\s-]|$)")
+# Lines holding the size of the calculation, some of which start with a number like the rows of a matrix
+SIZE_LINE_MARKERS = ["primitive gaussians", "alpha electrons", "NAtoms="]
+
+
+def generate_log(template: str = "water_td-rhf", n_basis: int = None, n_excited_state: int = None,
+                 n_cas_root: int = None, n_job: int = 1, seed: int = 0) -> str:
+    """
+    Generates the text of a synthetic Gaussian .log file by scaling one of the sample logs in doc/data.
+
+    Every matrix printout indexed by basis function (overlap and other integrals, MO coefficients, density and
+    Mulliken matrices) is rewritten for the new basis size in the layout of the template with random values, the
+    molecule is repeated as many times as needed to hold the basis functions, and the TD output (excited states
+    and the tables of every state) is repeated for the new number of excited states. The values are random, so
+    only the size and layout of the output is realistic.
+
+    :param template: the name of the sample log (see TEMPLATES)
+    :param n_basis: the number of basis functions, the number of the template by default
+    :param n_excited_state: the number of TD excited states (water_td-rhf only), the number of the template by default
+    :param n_cas_root: if given, the TD output is replaced by the output of a CAS calculation with this many roots
+        in the layout parse_cas reads (water_td-rhf only, no sample CAS log is available)
+    :param n_job: the number of Link1 jobs in the file
+    :param seed: the seed of the random values
+    :return: the text of the synthetic log
+    """
+    if template not in TEMPLATES:
+        raise ValueError("Unknown template " + template + ". Valid templates are: " + ", ".join(TEMPLATES))
+    with open(os.path.join(DATA_DIR, template + ".log"), "r") as f:
+        template_lines = f.read().split("\n")
+    if template_lines[-1] == "":
+        template_lines.pop()
+    generator = LogGenerator(template_lines, n_basis, n_excited_state, n_cas_root, np.random.default_rng(seed))
+    job_lines = generator.generate()
+    return "\n".join(job_lines * n_job) + "\n"
+
+
+def write_log(filename, **kwargs):
+    """
+    Writes a synthetic Gaussian .log file (see generate_log for the keyword arguments).
+    :return: the path of the written file
+    """
+    text = generate_log(**kwargs)
+    with open(filename, "w") as f:
+        f.write(text)
+    return filename
+
+
+class LogGenerator:
+    """
+    Rewrites the lines of a template log for a new basis size and number of excited states.
+
+    Attributes:
+        lines: the lines of the template log
+        n_basis0: the number of basis functions of the template
+        n_basis: the number of basis functions of the generated log
+        n_copy: the number of times the molecule of the template is repeated
+        n_state0: the number of excited states of the template, 0 if it isn't a TD calculation
+        n_state: the number of excited states of the generated log
+    """
+    def __init__(self, lines: list, n_basis: int = None, n_excited_state: int = None, n_cas_root: int = None, rng=None):
+        self.lines = lines
+        self.rng = np.random.default_rng(0) if rng is None else rng
+        basis_line = self.find_line("primitive gaussians")
+        self.n_basis0 = int(lines[basis_line].split()[0])
+        self.n_basis = self.n_basis0 if n_basis is None else n_basis
+        self.n_copy = m.ceil(self.n_basis / self.n_basis0)
+        self.n_atom0 = int(lines[self.find_line("NAtoms=")].split("NAtoms=")[1].split()[0])
+        electron_line = lines[self.find_line("alpha electrons")].split()
+        self.n_alpha0, self.n_beta0 = int(electron_line[0]), int(electron_line[3])
+        self.n_alpha = self.n_alpha0 * self.n_copy
+        self.n_beta = self.n_beta0 * self.n_copy
+        if max(self.n_alpha, self.n_beta) >= self.n_basis:
+            raise ValueError("n_basis is too small to hold the electrons of the repeated molecule.")
+        self.n_state0 = sum("Excited State" in line for line in lines)
+        self.n_state = self.n_state0 if n_excited_state is None else n_excited_state
+        self.n_cas_root = n_cas_root
+        if (n_excited_state is not None or n_cas_root is not None) and self.n_state0 == 0:
+            raise ValueError("Only TD templates (water_td-rhf) can change the excited states or add CAS roots.")
+        self.homo0 = self.n_alpha0
+        self.homo = self.n_alpha
+
+    def find_line(self, text: str) -> int:
+        for current_index, line in enumerate(self.lines):
+            if text in line:
+                return current_index
+        raise ValueError(text + " is missing from the template.")
+
+    def generate(self) -> list:
+        new_lines = []
+        lines = self.lines
+        current_index = 0
+        while current_index < len(lines):
+            line = lines[current_index]
+            if is_block_line(line):
+                end = current_index
+                while end < len(lines) and is_block_line(lines[end]):
+                    end += 1
+                block = lines[current_index: end]
+                previous_line = lines[current_index - 1] if current_index > 0 else ""
+                new_block = self.rescale_block(block, previous_line)
+                new_lines.extend(block if new_block is None else new_block)
+                current_index = end
+            elif "eigenvalues --" in line:
+                end = current_index
+                while end < len(lines) and "eigenvalues --" in lines[end]:
+                    end += 1
+                new_lines.extend(self.generate_eigenvalue_lines(lines[current_index: end]))
+                current_index = end
+            elif "Excited State" in line:
+                end = current_index
+                while end < len(lines) and not lines[end].startswith(" SavETr"):
+                    end += 1
+                if self.n_cas_root is None:
+                    new_lines.extend(self.generate_excited_states(lines[current_index: end]))
+                current_index = end
+            elif "Symbolic Z-matrix:" in line or "Z-Matrix found in chk file" in line:
+                new_lines.append(line)
+                current_index += 1
+                atom_lines = []
+                while current_index < len(lines) and not lines[current_index].strip() == "":
+                    if ATOM_LINE_PATTERN.match(lines[current_index]):
+                        atom_lines.append(lines[current_index])
+                    elif atom_lines:
+                        break
+                    else:
+                        new_lines.append(lines[current_index])
+                    current_index += 1
+                new_lines.extend(atom_lines * self.n_copy)
+            else:
+                new_lines.append(self.rewrite_line(line))
+                current_index += 1
+        if self.n_cas_root is not None:
+            new_lines = self.replace_td_with_cas(new_lines)
+        return new_lines
+
+    def rewrite_line(self, line: str) -> str:
+        if "primitive gaussians" in line:
+            counts = [int(word) for word in re.findall(r"\d+", line)]
+            scaled = [self.n_basis] + [m.ceil(count * self.n_basis / self.n_basis0) for count in counts[1:]]
+            return replace_numbers(line, scaled)
+        if "alpha electrons" in line:
+            return replace_numbers(line, [self.n_alpha, self.n_beta])
+        if "NAtoms=" in line:
+            head, tail = line.split("NAtoms=", 1)
+            return head + "NAtoms=" + replace_numbers(tail, [self.n_atom0 * self.n_copy])
+        if line.startswith(" 9/") and self.n_state0 > 0:
+            if self.n_cas_root is not None:
+                return " 9/6=4,7=4,13=1,17=" + str(self.n_cas_root) + ",19=1/14;"
+            return re.sub(r"41=\d+", "41=" + str(self.n_state), line)
+        if "nstates=" in line and self.n_state0 > 0:
+            return re.sub(r"nstates=\d+", "nstates=" + str(self.n_state), line)
+        return line
+
+    def rescale_block(self, block: list, previous_line: str):
+        """
+        Rewrites a matrix printout for the new basis size (or number of excited states for the tables of every state).
+        :return: the new lines of the printout, None if its size doesn't depend on the basis or the excited states
+        """
+        sub_blocks = split_sub_blocks(block)
+        if sub_blocks is None:
+            return None
+        if previous_line.split()[:1] == ["state"]:
+            if self.n_state0 == 0 or self.n_cas_root is not None:
+                return None
+            unit0, unit, atom_shift = self.n_state0, self.n_state, 0
+        else:
+            unit0, unit, atom_shift = self.n_basis0, self.n_basis, self.n_atom0
+        return rescale_sub_blocks(sub_blocks, unit0, unit, atom_shift, self.rng)
+
+    def generate_eigenvalue_lines(self, template_lines: list) -> list:
+        new_lines = []
+        for spin in ["Alpha", "Beta", ""]:
+            spin_lines = [line for line in template_lines if line.split()[0] == spin] if spin else \
+                [line for line in template_lines if line.split()[0] in ["occ.", "virt."]]
+            if not spin_lines:
+                continue
+            occupied_prefix = next((line for line in spin_lines if "occ." in line), None)
+            virtual_prefix = next((line for line in spin_lines if "virt." in line), None)
+            n_occupied0 = sum(len(NUMBER_PATTERN.findall(line)) for line in spin_lines if "occ." in line)
+            n_total0 = sum(len(NUMBER_PATTERN.findall(line)) for line in spin_lines)
+            n_occupied = n_occupied0 * self.n_copy
+            n_total = n_total0 * self.n_basis // self.n_basis0
+            values = np.sort(self.rng.uniform(-20, 5, n_total))
+            row_format = RowFormat(spin_lines)
+            for prefix, part in [(occupied_prefix, values[:n_occupied]), (virtual_prefix, values[n_occupied:])]:
+                if prefix is None:
+                    continue
+                label = prefix[:prefix.index("--") + 2]
+                for start in range(0, len(part), 5):
+                    new_lines.append(row_format.format_row(label, part[start: start + 5]))
+        return new_lines
+
+    def generate_excited_states(self, template_lines: list) -> list:
+        state_blocks = []
+        for line in template_lines:
+            if "Excited State" in line:
+                state_blocks.append([line])
+            else:
+                state_blocks[-1].append(line)
+        first_extra_lines = [line for line in state_blocks[0][1:] if not AMPLITUDE_PATTERN.search(line) and line.strip()]
+        new_lines = []
+        for current_state in range(1, self.n_state + 1):
+            state_block = state_blocks[(current_state - 1) % self.n_state0]
+            new_lines.append(re.sub(r"Excited State\s+\d+:", "Excited State {:3d}:".format(current_state), state_block[0]))
+            for line in state_block[1:]:
+                if AMPLITUDE_PATTERN.search(line):
+                    new_lines.append(AMPLITUDE_PATTERN.sub(self.shift_amplitude, line))
+            if current_state == 1:
+                new_lines.extend(first_extra_lines)
+            if current_state != self.n_state:
+                new_lines.append(" ")
+        return new_lines
+
+    def shift_amplitude(self, match) -> str:
+        from_mo = self.homo - (self.homo0 - int(match.group(1)))
+        to_mo = self.homo + (int(match.group(6)) - self.homo0)
+        return "{}{}{}{}{}{:{}d}{}".format(from_mo, match.group(2), match.group(3), match.group(4), match.group(5),
+                                         to_mo, len(match.group(6)), match.group(7))
+
+    def replace_td_with_cas(self, lines: list) -> list:
+        start = next(current_index for current_index, line in enumerate(lines) if "SCF Done" in line) + 1
+        end = next(current_index for current_index, line in enumerate(lines) if "Population analysis using" in line) - 2
+        return lines[:start] + self.generate_cas_lines() + lines[end:]
+
+    def generate_cas_lines(self, n_active_space_mo: int = 4) -> list:
+        cas_lines = [" NDet=     36"]
+        ground_energy = -75.5 + self.rng.uniform(-0.1, 0.1)
+        energies = ground_energy + np.concatenate([[0.0], np.sort(self.rng.uniform(0.1, 1.5, self.n_cas_root - 1))])
+        for current_root in range(1, self.n_cas_root + 1):
+            occupations = np.clip(np.array([2.0, 2.0, 0.0, 0.0]) + self.rng.normal(0, 0.05, n_active_space_mo), 0, 2)
+            cas_lines.append(" Root {:4d} Energy (Hartree) {:18.10f}".format(current_root, energies[current_root - 1]))
+            cas_lines.append(" diagonals of 1PDM for State: {:4d}".format(current_root))
+            cas_lines.append("                1")
+            for current_mo, occupation in enumerate(occupations):
+                cas_lines.append("{:7d}  {}".format(current_mo + 1, format_d(occupation, 6)))
+        for current_root in range(2, self.n_cas_root + 1):
+            cas_lines.append(" Oscillator Strength For States {:4d} : {:4d}   f= {:12.8f}".format(1, current_root, self.rng.uniform(0, 0.5)))
+        return cas_lines
+
+
+def replace_numbers(line: str, numbers: list) -> str:
+    """
+    Replaces the first integers of a line with the given numbers, keeping the width of the line where possible.
+    """
+    numbers = iter(numbers)
+
+    def replace(match):
+        number = next(numbers, None)
+        if number is None:
+            return match.group(0)
+        return "{:>{}}".format(number, len(match.group(0)))
+    return re.sub(r"(?<![\w.])\s*\d+(?![\w.])", replace, line)
+
+
+def is_matrix_line(line: str) -> bool:
+    # Rows of a matrix printout start with their index, column headers are indices and MO printouts also hold
+    # orbital symmetries like "(A1)--O" and an "Eigenvalues --" line per block
+    words = line.split(None, 1)
+    return len(words) > 0 and (words[0].isdigit() or words[0].startswith("(") or words[0] == "Eigenvalues")
+
+
+def is_block_line(line: str) -> bool:
+    # GHF printouts label their rows and columns with spin orbitals like "1a" and "1b"
+    if SPIN_ORBITAL_PATTERN.match(line):
+        return True
+    return is_matrix_line(line) and not any(marker in line for marker in SIZE_LINE_MARKERS)
+
+
+def is_column_header(line: str) -> bool:
+    words = line.split()
+    return "." not in line and len(words) > 0 and all(HEADER_TOKEN_PATTERN.fullmatch(word) for word in words)
+
+
+def split_sub_blocks(block: list):
+    """
+    Splits a matrix printout into sub-blocks of (column header, extra header lines, rows).
+    :return: a list of sub-blocks, None if the printout doesn't have the expected layout
+    """
+    sub_blocks = []
+    for line in block:
+        if is_column_header(line):
+            sub_blocks.append((line, [], []))
+        else:
+            if not sub_blocks:
+                sub_blocks.append((None, [], []))
+            header, extra_lines, rows = sub_blocks[-1]
+            if line.split()[0][0].isdigit():
+                rows.append(line)
+            elif rows:
+                return None
+            else:
+                extra_lines.append(line)
+    if not sub_blocks or any(len(rows) == 0 for _, _, rows in sub_blocks):
+        return None
+    if len({len(extra_lines) for _, extra_lines, _ in sub_blocks}) != 1:
+        return None
+    return sub_blocks
+
+
+def rescale_sub_blocks(sub_blocks: list, unit0: int, unit: int, atom_shift: int, rng):
+    n_row0 = len(sub_blocks[0][2])
+    if n_row0 % unit0 != 0:
+        return None
+    row_per_unit = n_row0 // unit0
+    rows0 = sub_blocks[0][2]
+    if sub_blocks[0][0] is None:
+        column_counts = [len(NUMBER_PATTERN.findall(rows0[0]))]
+    else:
+        column_counts = [len(header.split()) for header, _, _ in sub_blocks]
+    n_col_block = column_counts[0]
+    n_column0 = sum(column_counts)
+    triangular = len(sub_blocks) > 1 and len(sub_blocks[1][2]) == n_row0 - n_col_block
+    if triangular and n_column0 != n_row0:
+        return None
+    if not triangular and any(len(rows) != n_row0 for _, _, rows in sub_blocks):
+        return None
+
+    n_row = row_per_unit * unit
+    # Columns are basis functions (or states) too in square and triangular printouts, and fixed quantities otherwise
+    scale_columns = triangular or (sub_blocks[0][0] is not None and n_column0 % unit0 == 0 and len(sub_blocks) > 1)
+    n_column = n_column0 // unit0 * unit if scale_columns else n_column0
+
+    row_format = RowFormat(rows0 + [row for _, _, rows in sub_blocks[1:] for row in rows])
+    header_tokens = [token for header, _, _ in sub_blocks if header is not None for token in header.split()]
+    extra_columns = [[line for _, extra_lines, _ in sub_blocks for line in [extra_lines[extra_index]]]
+                     for extra_index in range(len(sub_blocks[0][1]))]
+    eigenvalues = np.sort(rng.uniform(-20, 5, n_column))
+
+    new_lines = []
+    for column_start in range(0, n_column, n_col_block):
+        columns = range(column_start, min(column_start + n_col_block, n_column))
+        template_columns = [current_column % n_column0 for current_column in columns]
+        column_copies = [current_column // n_column0 for current_column in columns]
+        if sub_blocks[0][0] is not None:
+            header0 = sub_blocks[0][0]
+            labels = [shift_label(header_tokens[template_column], copy * unit0 if scale_columns else 0).strip()
+                      for template_column, copy in zip(template_columns, column_copies)]
+            new_lines.append(format_columns(header0, labels))
+        for extra_index, extra_lines in enumerate(extra_columns):
+            extra0 = extra_lines[0]
+            if NUMBER_PATTERN.search(extra0):
+                new_lines.append(row_format.format_row(extra0[:extra0.index("--") + 2], eigenvalues[list(columns)]))
+            else:
+                tokens = [token for line in extra_lines for token in line.split()]
+                new_lines.append(format_columns(extra0, [tokens[template_column % len(tokens)] for template_column in template_columns]))
+        first_row = column_start if triangular else 0
+        for current_row in range(first_row, n_row):
+            template_row = rows0[current_row % n_row0]
+            copy = current_row // n_row0
+            label = shift_label(row_format.get_label(template_row), copy * unit0, copy * atom_shift)
+            n_value = min(len(columns), current_row - column_start + 1) if triangular else len(columns)
+            new_lines.append(row_format.format_row(label, row_format.random_values(rng, n_value)))
+    return new_lines
+
+
+class RowFormat:
+    """
+    The fixed-width layout of the rows of a matrix printout, measured from the rows of a template.
+
+    Attributes:
+        first_end: the column where the first value ends
+        width: the width of every value after the first
+        d_format: true if values are printed like 0.123456D+01
+        decimals: the number of decimals of a value
+    """
+    def __init__(self, rows: list):
+        first_ends = Counter()
+        widths = Counter()
+        longest = 0
+        for row in rows:
+            matches = list(NUMBER_PATTERN.finditer(row))
+            ends = [match.end() for match in matches]
+            if ends:
+                first_ends[ends[0]] += 1
+            widths.update(np.diff(ends).tolist())
+            longest = max([longest] + [len(match.group(0).lstrip("-")) for match in matches])
+        self.first_end = first_ends.most_common(1)[0][0]
+        # Single column printouts leave room for a sign in front of the longest value
+        self.width = widths.most_common(1)[0][0] if widths else longest + 2
+        sample = NUMBER_PATTERN.search(rows[0]).group(0)
+        self.d_format = "D" in sample or "E" in sample
+        self.exponent_character = "E" if "E" in sample else "D"
+        self.decimals = len(sample.split(".")[1].split(self.exponent_character)[0])
+
+    def get_label(self, row: str) -> str:
+        # Spaces in front of the first value belong to its field so every new value lines up, including negative
+        # values that fill the whole field like in "2a-0.703963D-01"
+        return row[:NUMBER_PATTERN.search(row).start()].rstrip()
+
+    def random_values(self, rng, n_value: int) -> np.ndarray:
+        return rng.uniform(-1, 1, n_value)
+
+    def format_value(self, value: float) -> str:
+        if self.d_format:
+            return format_d(value, self.decimals, self.exponent_character)
+        return format(value, "." + str(self.decimals) + "f")
+
+    def format_row(self, label: str, values) -> str:
+        parts = [label]
+        first_width = self.first_end - len(label)
+        for value_index, value in enumerate(values):
+            parts.append(self.format_value(value).rjust(first_width if value_index == 0 else self.width))
+        return "".join(parts)
+
+
+def format_d(value: float, decimals: int, exponent_character: str = "D") -> str:
+    """
+    Formats a number like Gaussian prints double precision values, for example 0.123456D+01.
+    """
+    if value == 0:
+        return "0." + "0" * decimals + exponent_character + "+00"
+    exponent = m.floor(m.log10(abs(value))) + 1
+    mantissa = round(abs(value) / 10.0 ** exponent * 10 ** decimals)
+    if mantissa >= 10 ** decimals:
+        mantissa //= 10
+        exponent += 1
+    sign = "-" if value < 0 else ""
+    return "{}0.{:0{}d}{}{:+03d}".format(sign, mantissa, decimals, exponent_character, exponent)
+
+
+def format_columns(template_line: str, tokens: list) -> str:
+    # Tokens are right-aligned to the same column ends as the tokens of the template line
+    ends = [match.end() for match in re.finditer(r"\S+", template_line)]
+    first_end = ends[0]
+    width = ends[1] - ends[0] if len(ends) > 1 else 10
+    line = ""
+    for token_index, token in enumerate(tokens):
+        end = first_end + token_index * width
+        line += token.rjust(end - len(line))
+    return line + template_line[len(template_line.rstrip()):]
+
+
+def shift_label(label: str, row_shift: int, atom_shift: int = 0) -> str:
+    """
+    Adds the given shifts to the row (basis function or state) number and the atom number of a row label,
+    keeping the width of the label.
+    """
+    match = LABEL_PATTERN.match(label)
+    if match is None:
+        return label
+    number_width = len(match.group(1)) + len(match.group(2))
+    rest = match.group(3)
+    if atom_shift:
+        rest = ATOM_LABEL_PATTERN.sub(lambda atom_match: "{}{:<{}}".format(
+            atom_match.group(1), int(atom_match.group(2)) + atom_shift,
+            len(atom_match.group(2)) + len(atom_match.group(3)) - 1) + " ", rest, count=1)
+    return "{:>{}}".format(int(match.group(2)) + row_shift, number_width) + rest
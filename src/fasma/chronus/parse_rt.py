@@ -0,0 +1,105 @@
+from fasma.core import boxes as bx
+from fasma.core import messages as msg
+from fasma.core import file_reader as fr
+import numpy as np
+import re
+import io
+import os
+
+# The real-time step table of a ChronusQ .out file starts after its header line and holds one row per time step,
+# laid out as "Step  Time (AU)  Energy (Eh)  Dipole X  Dipole Y  Dipole Z" (in atomic units)
+RT_HEADER = b"Time (AU)"
+RT_TIME_COLUMN = 1
+RT_DIPOLE_COLUMNS = [3, 4, 5]
+RT_COLUMNS = [RT_TIME_COLUMN] + RT_DIPOLE_COLUMNS
+# Blank or ruled lines between the header and the first step
+RT_SEPARATOR_PATTERN = re.compile(rb"(?:[ \t=-]*\n)*")
+# The step rows, the table ends at the first line that does not start with a number
+RT_ROWS_PATTERN = re.compile(rb"(?:[ \t]*[-+]?\.?\d[^\n]*\n)*")
+# Size of the pieces the .out file is read in, so the trajectory is never held as text all at once
+READ_CHUNK_SIZE = 1 << 24
+
+
+def parse(filename, every_step: int = 1):
+    """
+    Parses the real-time trajectory of a ChronusQ .out file into a Box without basic data.
+    :param filename: the path of the file, which may be compressed (.gz, .bz2 or .xz)
+    :param every_step: only every every_step-th time step is kept, starting with the first
+    :return: a Box holding a RealTimeData object
+    """
+    n_step, time, dipole = read_rt_steps(filename, every_step)
+    return bx.Box(basic_data=None, spectra_data=bx.RealTimeData(n_step=n_step, time=time, dipole=dipole,
+                                                                every_step=every_step))
+
+
+def read_rt_steps(filename, every_step: int = 1, chunk_size: int = READ_CHUNK_SIZE):
+    """
+    Streams the step table of a ChronusQ .out file. The time and dipole columns of the rows of every piece of the
+    file read are converted at once and copied into arrays that are preallocated from the size of the file and
+    only grown if needed, so no line is ever kept as a Python string.
+    :param filename: the path of the file, which may be compressed (.gz, .bz2 or .xz)
+    :param every_step: only every every_step-th time step is kept, starting with the first
+    :param chunk_size: the number of bytes read at a time
+    :raise ValueError: the file holds no step table
+    :return: the number of time steps in the file, a numpy array of the kept times and a numpy array of the kept
+        dipole moments with one row per step
+    """
+    if every_step < 1:
+        raise ValueError("every_step must be a positive integer.")
+    opener = fr.get_opener(filename) or open
+    # Compressed files are not read through this estimate, their arrays are grown as the steps arrive
+    file_size = None if opener is not open else os.path.getsize(filename)
+    time = np.empty(0)
+    dipole = np.empty((0, len(RT_DIPOLE_COLUMNS)))
+    n_step = 0
+    n_kept = 0
+    table_started = False
+    header_found = False
+    rest = b""
+    try:
+        stream = opener(filename, "rb")
+    except FileNotFoundError:
+        raise OSError("The file with the given path cannot be opened. Please try again.")
+    with stream:
+        while True:
+            chunk = stream.read(chunk_size)
+            if chunk:
+                # Only complete lines are converted, the last partial line is kept for the next piece
+                text = rest + chunk
+                end = text.rfind(b"\n") + 1
+                text, rest = text[:end], text[end:]
+            else:
+                text = rest + b"\n" if rest else b""
+            position = 0
+            if not header_found:
+                header = text.find(RT_HEADER)
+                if header != -1:
+                    header_found = True
+                    position = text.find(b"\n", header) + 1
+            if header_found and not table_started:
+                position = RT_SEPARATOR_PATTERN.match(text, position).end()
+            rows_end = RT_ROWS_PATTERN.match(text, position).end() if header_found else position
+            if rows_end > position:
+                table_started = True
+                try:
+                    rows = np.loadtxt(io.BytesIO(text[position: rows_end]), usecols=RT_COLUMNS, ndmin=2)
+                except ValueError:
+                    raise ValueError("A complete time step table" + msg.chronus_missing_msg())
+                kept_rows = rows[(-n_step) % every_step::every_step]
+                if n_kept + len(kept_rows) > len(time):
+                    capacity = max(2 * len(time), n_kept + len(kept_rows))
+                    if file_size is not None and len(time) == 0:
+                        # Rows are about as long as the first ones, so the size of the file bounds the number of steps
+                        capacity = max(capacity, int(file_size * len(rows) / (rows_end - position) / every_step) + 1)
+                    time = np.resize(time, capacity)
+                    dipole = np.resize(dipole, (capacity, len(RT_DIPOLE_COLUMNS)))
+                time[n_kept: n_kept + len(kept_rows)] = kept_rows[:, 0]
+                dipole[n_kept: n_kept + len(kept_rows)] = kept_rows[:, 1:]
+                n_step += len(rows)
+                n_kept += len(kept_rows)
+            # The table ends at the first line after it that is not a step
+            if not chunk or (header_found and rows_end < len(text)):
+                break
+    if n_step == 0:
+        raise ValueError("The time step table" + msg.chronus_missing_msg())
+    return n_step, time[:n_kept].copy(), dipole[:n_kept].copy()
@@ -1,11 +1,17 @@
 from fasma.gaussian import parse_matrices
 from fasma.core import df_generators as dfg
-from dataclasses import dataclass, field
+from fasma.core import spectrum as sp
+from fasma.core import precision
+from dataclasses import dataclass, field, fields, MISSING
 from typing import Optional
 from abc import ABC
+from scipy import sparse as sps
 import pandas as pd
 import numpy as np
 
+# Number of MOs whose AO projections are computed together by PopData.get_ao_projection_columns
+AO_PROJECTION_BLOCK_SIZE = 32
+
 
 @dataclass(frozen=True)
 class BasicData:
@@ -51,17 +57,237 @@ class BetaData(ElectronData):
             self.eigenvalues = data
 
 
+@dataclass
+class AOTable:
+    """
+    The labels of the AOs of a population calculation (see COLUMNS). Every label is stored as an integer code into
+    the distinct labels of its column, so the table takes a few bytes per AO, tiling it only repeats the codes and
+    its DataFrame (see get_dataframe) holds pandas categoricals.
+    """
+    # A row for every AO and a column for every label
+    codes: np.ndarray
+    # The distinct labels of every column, in the order they first appear
+    labels: list
+
+    COLUMNS = ("Atom Number", "Atom Type", "Principal Quantum Number", "Subshell", "Atomic Orbital")
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Builds the table of a list of rows with a label for every column.
+        """
+        codes = np.empty((len(rows), len(cls.COLUMNS)), dtype=np.int32)
+        labels = []
+        for column in range(len(cls.COLUMNS)):
+            column_codes, column_labels = pd.factorize(np.array([row[column] for row in rows], dtype=str))
+            codes[:, column] = column_codes
+            labels.append(np.asarray(column_labels, dtype=str))
+        return cls(codes, labels)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def shape(self) -> tuple:
+        return self.codes.shape
+
+    def get_column(self, column) -> pd.Categorical:
+        """
+        Returns the labels of a column, given by its position or name, as a pandas categorical.
+        """
+        if isinstance(column, str):
+            column = self.COLUMNS.index(column)
+        return pd.Categorical.from_codes(self.codes[:, column], categories=self.labels[column])
+
+    def get_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame({name: self.get_column(column) for column, name in enumerate(self.COLUMNS)})
+
+    def tile(self, n_repeat: int):
+        """
+        Returns the table repeated n_repeat times, for example once for every excitation.
+        """
+        return AOTable(np.tile(self.codes, (n_repeat, 1)), self.labels)
+
+    def to_array(self) -> np.ndarray:
+        """
+        Returns the labels as a numpy array of strings with a row for every AO.
+        """
+        if len(self.labels) == 0:
+            return np.empty((len(self), 0), dtype=str)
+        return np.column_stack([column_labels[self.codes[:, column]] for column, column_labels in enumerate(self.labels)])
+
+
 @dataclass
 class PopData:
-    ao_matrix: np.ndarray
+    ao_matrix: AOTable
+    # The overlap of the basis functions, which is not expanded to the spin orbitals for GHF
     overlap_matrix: np.ndarray
     electron_data: ElectronData
     beta_electron_data: Optional[BetaData] = None
 
+    def __post_init__(self):
+        # The AO projections of blocks of MOs computed by get_ao_projection_columns, keyed by (beta, block index).
+        # They are dropped once the whole projection matrix of their spin is computed and are never pickled
+        self._ao_projection_blocks = {}
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop("_ao_projection_blocks", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__post_init__()
+
     def add_beta_electron_data(self, data: BetaData):
         if self.beta_electron_data is None:
             self.beta_electron_data = data
 
+    def get_spin_orbital_overlap_matrix(self) -> np.ndarray:
+        """
+        Returns the overlap of the GHF spin orbitals (alpha and beta of every basis function in turn), the form
+        overlap_matrix held for GHF before it was kept spin-free.
+        :return: a complex numpy array with two rows and columns for every basis function
+        """
+        identity = np.eye(2, dtype=precision.get_complex_dtype(self.overlap_matrix.dtype))
+        return np.kron(self.overlap_matrix, identity)
+
+    def get_ao_projection_columns(self, mo_indices, beta: bool = False) -> np.ndarray:
+        """
+        Returns the columns of the AO projection matrix of the given MOs. The whole matrix is only sliced if it was
+        already computed. Otherwise only the blocks of AO_PROJECTION_BLOCK_SIZE MOs holding the given MOs are
+        computed from the matching columns of the MO coefficients, and they are kept for later calls.
+        :param mo_indices: the indices of the MOs (based on Python, starting at 0)
+        :param beta: if true, the projections of the beta electrons are returned
+        :return: a numpy array with a row for every AO and a column for every given MO
+        """
+        electron_data = self.beta_electron_data if beta else self.electron_data
+        mo_indices = np.asarray(mo_indices, dtype=int)
+        # A projection matrix still waiting for its loader (see LazyData) is not computed here
+        if "ao_projection_matrix" in vars(electron_data) or self.overlap_matrix is None:
+            self.drop_ao_projection_blocks(beta)
+            return electron_data.ao_projection_matrix[:, mo_indices]
+        mo_coefficient_matrix = electron_data.mo_coefficient_matrix
+        blocks = self._ao_projection_blocks
+        block_indices = np.unique(mo_indices // AO_PROJECTION_BLOCK_SIZE).tolist()
+        for block_index in block_indices:
+            if (beta, block_index) not in blocks:
+                block_start = block_index * AO_PROJECTION_BLOCK_SIZE
+                blocks[(beta, block_index)] = parse_matrices.get_ao_projection(
+                    self.overlap_matrix, mo_coefficient_matrix[:, block_start: block_start + AO_PROJECTION_BLOCK_SIZE])
+        projection_columns = np.concatenate([blocks[(beta, block_index)] for block_index in block_indices], axis=1)
+        # The position of every MO among the columns of its blocks
+        block_offsets = np.searchsorted(block_indices, mo_indices // AO_PROJECTION_BLOCK_SIZE) * AO_PROJECTION_BLOCK_SIZE
+        return projection_columns[:, block_offsets + mo_indices % AO_PROJECTION_BLOCK_SIZE]
+
+    def drop_ao_projection_blocks(self, beta: bool = False):
+        """
+        Drops the blocks of AO projections of a spin kept by get_ao_projection_columns.
+        """
+        for key in [key for key in self._ao_projection_blocks if key[0] == beta]:
+            del self._ao_projection_blocks[key]
+
+
+class LazyField:
+    """
+    A non-data descriptor that loads a field of a LazyData object the first time it is accessed. The loaded value
+    is stored on the instance, where it shadows this descriptor for every later access.
+    """
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        loader = instance._loaders.pop(self.name, None)
+        value = loader() if loader is not None else get_default(instance.__dataclass_fields__[self.name])
+        instance.__dict__[self.name] = value
+        return value
+
+
+def get_default(data_field):
+    if data_field.default_factory is not MISSING:
+        return data_field.default_factory()
+    return None if data_field.default is MISSING else data_field.default
+
+
+class LazyData:
+    """
+    Base class of the lazy versions of the data classes above, whose fields are only parsed when they are first
+    accessed. Every field is either given as a value or as a loader (a function without arguments returning
+    the value), fields given neither way take their default value.
+
+    A lazy object is pickled (for example by the parse cache or to send it between processes) as an instance
+    of its eager data class with every field loaded, except for the derived fields that aren't loaded yet (see
+    set_loader): the object then stays lazy and those fields are pickled as their loaders.
+    """
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for data_field in fields(cls):
+            lazy_field = LazyField()
+            lazy_field.__set_name__(cls, data_field.name)
+            setattr(cls, data_field.name, lazy_field)
+
+    def __init__(self, loaders: dict = None, **values):
+        self._loaders = {} if loaders is None else dict(loaders)
+        self._derived_fields = set()
+        self.__dict__.update(values)
+
+    def set_loader(self, name: str, loader, derived: bool = False):
+        """
+        Sets the loader of a field that isn't loaded yet.
+        :param derived: if true, the field is computed from other fields instead of being parsed, so the loader
+            can be pickled and is pickled in its place as long as the field isn't loaded
+        """
+        if name in self.__dict__:
+            return
+        self._loaders[name] = loader
+        if derived:
+            self._derived_fields.add(name)
+
+    def __reduce__(self):
+        pending_loaders = {name: loader for name, loader in self._loaders.items() if name in self._derived_fields}
+        state = {}
+        for data_field in fields(self):
+            if data_field.name in pending_loaders:
+                continue
+            state[data_field.name] = getattr(self, data_field.name)
+        # The object is created before its state is pickled, so the loaders can refer back to it
+        if pending_loaders:
+            state.update(_loaders=pending_loaders, _derived_fields=set(pending_loaders))
+            return new_data, (type(self),), state
+        # The eager data class is the first data class after LazyData in the method resolution order
+        mro = type(self).__mro__
+        eager_class = next(base for base in mro[mro.index(LazyData) + 1:] if "__dataclass_fields__" in base.__dict__)
+        return new_data, (eager_class,), state
+
+    def load(self):
+        """
+        Loads every field that hasn't been accessed yet.
+        """
+        for name in list(self._loaders):
+            getattr(self, name)
+
+
+def new_data(data_class):
+    return data_class.__new__(data_class)
+
+
+class LazyElectronData(LazyData, ElectronData):
+    "Electron Data parsed on first access"
+
+
+class LazyBetaData(LazyData, BetaData):
+    "Beta Electron Data parsed on first access"
+
+
+class LazyPopData(LazyData, PopData):
+    "Population Data parsed on first access"
+
+    def __init__(self, loaders: dict = None, **values):
+        super().__init__(loaders, **values)
+        self.__post_init__()
+
 
 class MethodologyData(ABC):
     "Methodology Data"
@@ -96,6 +322,7 @@ class ExcitationData(SpectraData):
     active_space_start: int
     active_space_end: int
     active_space: np.ndarray
+    # The delta diagonal matrices are scipy.sparse CSR matrices when parsed with sparse=True
     delta_diagonal_matrix: np.ndarray = None
     beta_delta_diagonal_matrix: Optional[np.ndarray] = None
     excitation_matrix: Optional[np.ndarray] = None
@@ -122,7 +349,13 @@ class ExcitationData(SpectraData):
 @dataclass
 class RealTimeData(SpectraData):
     n_step: int
-    steps: pd.DataFrame
+    # The time and dipole moment (one row of x, y and z per step) of every every_step-th step, in atomic units
+    time: np.ndarray
+    dipole: np.ndarray
+    every_step: int = 1
+
+    def get_spectrum(self):
+        return sp.RTimeSpectrum(x=self.time, y=self.dipole)
 
 
 @dataclass
@@ -157,6 +390,112 @@ class CASData(ExcitationData):
         self.methodology = "CAS"
 
 
+@dataclass
+class AOTransitionTensor:
+    """
+    The AO transitions of every excitation as a 3-D (excitation, AO, active space MO) tensor that is only held as its
+    two factors: the value of every entry is ao_projection_matrix[AO, MO] * delta_diagonal_matrix[excitation, MO].
+    Entries are computed by broadcasting when they are indexed, and sums over MOs or AOs are computed from the
+    factors, so the tensor itself is never built unless asked for (see to_array and to_matrix).
+    """
+    # A row for every AO (or group of AOs, see group_aos) and a column for every active space MO
+    ao_projection_matrix: np.ndarray
+    # A row for every excitation, a numpy array or a scipy.sparse matrix
+    delta_diagonal_matrix: np.ndarray
+
+    @property
+    def shape(self) -> tuple:
+        return (self.delta_diagonal_matrix.shape[0],) + self.ao_projection_matrix.shape
+
+    def __getitem__(self, excitation):
+        """
+        Returns the AO transitions of an excitation as an (AO, MO) matrix, or the AOTransitionTensor of a slice of
+        excitations.
+        """
+        if isinstance(excitation, slice):
+            return AOTransitionTensor(self.ao_projection_matrix, self.delta_diagonal_matrix[excitation])
+        delta_diagonals = self.delta_diagonal_matrix[excitation]
+        if sps.issparse(delta_diagonals):
+            delta_diagonals = delta_diagonals.toarray()[0]
+        return np.multiply(self.ao_projection_matrix, delta_diagonals)
+
+    def to_array(self) -> np.ndarray:
+        """
+        Builds the whole (excitation, AO, MO) tensor.
+        """
+        delta_diagonal_matrix = self.delta_diagonal_matrix
+        if sps.issparse(delta_diagonal_matrix):
+            delta_diagonal_matrix = delta_diagonal_matrix.toarray()
+        return np.multiply(self.ao_projection_matrix, delta_diagonal_matrix[:, np.newaxis, :])
+
+    def to_matrix(self):
+        """
+        Builds the tensor as a matrix with a row for every (excitation, AO) pair, the layout of
+        Box.generate_ao_transition_matrix. A sparse delta diagonal matrix gives a scipy.sparse CSR matrix.
+        """
+        if sps.issparse(self.delta_diagonal_matrix):
+            return parse_matrices.get_sparse_ao_transition_matrix(self.ao_projection_matrix, self.delta_diagonal_matrix)
+        return self.to_array().reshape((-1, self.shape[2]))
+
+    def summarize(self) -> np.ndarray:
+        """
+        Returns the sum, the sum of the positive entries (particle) and the sum of the negative entries (hole) over
+        the MOs of every (excitation, AO) pair, the same as parse_matrices.summarize_matrix(self.to_matrix()).
+        An entry is positive when both of its factors have the same sign, so every sum is a product of the positive
+        and negative parts of the factors.
+        :return: a numpy array with a row for every (excitation, AO) pair and 3 columns
+        """
+        accumulator_dtype = precision.get_accumulator_dtype(self.ao_projection_matrix.dtype)
+        ao_projection_matrix = self.ao_projection_matrix.astype(accumulator_dtype)
+        positive_projection = np.where(ao_projection_matrix > 0, ao_projection_matrix, 0).T
+        negative_projection = np.where(ao_projection_matrix < 0, ao_projection_matrix, 0).T
+        delta_diagonal_matrix = self.delta_diagonal_matrix
+        if sps.issparse(delta_diagonal_matrix):
+            delta_diagonal_matrix = sps.csr_matrix(delta_diagonal_matrix, dtype=accumulator_dtype)
+            positive_delta = delta_diagonal_matrix.copy()
+            positive_delta.data = np.where(delta_diagonal_matrix.data > 0, delta_diagonal_matrix.data, 0)
+            negative_delta = delta_diagonal_matrix.copy()
+            negative_delta.data = np.where(delta_diagonal_matrix.data < 0, delta_diagonal_matrix.data, 0)
+        else:
+            delta_diagonal_matrix = delta_diagonal_matrix.astype(accumulator_dtype)
+            positive_delta = np.where(delta_diagonal_matrix > 0, delta_diagonal_matrix, 0)
+            negative_delta = np.where(delta_diagonal_matrix < 0, delta_diagonal_matrix, 0)
+        particle = np.asarray(positive_delta @ positive_projection + negative_delta @ negative_projection)
+        hole = np.asarray(positive_delta @ negative_projection + negative_delta @ positive_projection)
+        summary_matrix = np.ndarray((particle.size, 3))
+        summary_matrix[:, 0] = (particle + hole).ravel()
+        summary_matrix[:, 1] = particle.ravel()
+        summary_matrix[:, 2] = hole.ravel()
+        return summary_matrix
+
+    def sum_mos(self) -> np.ndarray:
+        """
+        Returns the sum over the MOs of every (excitation, AO) pair as an (excitation, AO) matrix.
+        """
+        accumulator_dtype = precision.get_accumulator_dtype(self.ao_projection_matrix.dtype)
+        return np.asarray(self.delta_diagonal_matrix @ self.ao_projection_matrix.T.astype(accumulator_dtype))
+
+    def group_aos(self, labels):
+        """
+        Sums the AO transitions over groups of AOs, for example over the AOs of every atom or subshell. Only the
+        projection factor is summed, which gives the tensor of the groups.
+        :param labels: the group of every AO, an array with an entry for every AO or a 2-D array with a row for every
+            AO (for example columns of PopData.ao_matrix.codes)
+        :return: the labels of the groups in the order they first appear and an AOTransitionTensor with a row of
+            its projection factor for every group
+        """
+        labels = np.asarray(labels)
+        if labels.ndim == 1:
+            codes, groups = pd.factorize(labels)
+        else:
+            codes, groups = pd.MultiIndex.from_arrays(list(labels.T)).factorize()
+        accumulator_dtype = precision.get_accumulator_dtype(self.ao_projection_matrix.dtype)
+        grouped_projection_matrix = np.zeros((len(groups), self.ao_projection_matrix.shape[1]), dtype=accumulator_dtype)
+        np.add.at(grouped_projection_matrix, codes, self.ao_projection_matrix)
+        grouped_projection_matrix = grouped_projection_matrix.astype(self.ao_projection_matrix.dtype, copy=False)
+        return groups, AOTransitionTensor(grouped_projection_matrix, self.delta_diagonal_matrix)
+
+
 @dataclass
 class Box:
     basic_data: BasicData
@@ -171,32 +510,61 @@ class Box:
         if self.pop_data is None:
             self.pop_data = data
 
-    def generate_mo_analysis(self, electron: str = "alpha"):
-        if self.pop_data is None:
-            raise ValueError(
-                "Cannot perform an MO Analysis. Please check that this object has population calculation.")
-        if electron == "beta" and self.basic_data.scf_type == "UHF":
+    def check_sections(self, analysis: str, sections: list, electron: str = "alpha"):
+        """
+        Raises a ValueError naming the first of the given sections whose matrices this object doesn't hold, for
+        example because they weren't parsed (see the sections of file_compressor.parse).
+        :param analysis: the name of the analysis, for the error message
+        :param sections: the sections the analysis needs (see parse_gaussian.SECTIONS), "td" stands for the delta
+            diagonals of any excited state calculation
+        :param electron: the spin whose delta diagonals and MO coefficients are needed
+        """
+        for section in sections:
+            if section == "td":
+                missing = self.spectra_data is None or (self.spectra_data.beta_delta_diagonal_matrix if electron == "beta"
+                                                        else self.spectra_data.delta_diagonal_matrix) is None
+                section = "td or cas"
+            elif self.pop_data is None:
+                missing = True
+            elif section == "pop.mo":
+                electron_data = self.pop_data.beta_electron_data if electron == "beta" else self.pop_data.electron_data
+                missing = (self.pop_data.ao_matrix is None or electron_data is None
+                           or electron_data.mo_coefficient_matrix is None)
+            else:
+                missing = self.pop_data.overlap_matrix is None
+            if missing:
+                raise ValueError(f"Cannot perform an {analysis}. Please check that this object has the {electron} "
+                                 f"matrices of the {section} section.")
+
+    def generate_mo_analysis(self, electron: str = "alpha", long_format: bool = False):
+        if electron == "beta" and self.basic_data.scf_type != "UHF":
+            electron = "alpha"
+        self.check_sections("MO Analysis", ["pop.mo", "pop.overlap"], electron)
+        if electron == "beta":
             ao_projection_matrix = self.pop_data.beta_electron_data.ao_projection_matrix
         else:
             ao_projection_matrix = self.pop_data.electron_data.ao_projection_matrix
         ao_matrix = self.pop_data.ao_matrix
         ao_df = dfg.get_ao_dataframe(ao_matrix)
+        index_list = ['Atom Number', 'Atom Type', 'Principal Quantum Number', 'Subshell', 'Atomic Orbital']
+        if long_format:
+            return dfg.get_long_mo_dataframe(ao_projection_matrix, ao_df.set_index(index_list), 'MO')
         df = dfg.get_mo_dataframe(ao_projection_matrix, 'MO ')
         df = pd.concat([ao_df, df], axis=1)
-        df.set_index(
-            ['Atom Number', 'Atom Type', 'Principal Quantum Number', 'Subshell', 'Atomic Orbital'], inplace=True)
+        df.set_index(index_list, inplace=True)
         return df
 
-    def generate_mo_transition_analysis(self, electron: str = "alpha"):
-        if self.spectra_data is None:
-            raise ValueError(
-                "Cannot perform an MO Transition Analysis. Please check that this object has an excited state calculation.")
+    def generate_mo_transition_analysis(self, electron: str = "alpha", long_format: bool = False):
+        self.check_sections("MO Transition Analysis", ["td"], electron)
         if electron == "beta":
             delta_diagonal_matrix = self.spectra_data.beta_delta_diagonal_matrix
         else:
             delta_diagonal_matrix = self.spectra_data.delta_diagonal_matrix
         excitation_matrix = self.spectra_data.excitation_matrix
         excitation_df = dfg.get_excitations_dataframe(self.spectra_data.methodology, excitation_matrix)
+        if long_format:
+            row_df = excitation_df.set_index(['Starting State', 'Ending State'])
+            return dfg.get_long_mo_dataframe(delta_diagonal_matrix, row_df, 'AS MO')
         summary_df = dfg.get_summary_dataframe(parse_matrices.summarize_matrix(delta_diagonal_matrix))
         df = dfg.get_mo_dataframe(delta_diagonal_matrix, 'AS MO ')
         df = pd.concat([excitation_df, summary_df, df], axis=1)
@@ -204,9 +572,7 @@ class Box:
         return df
 
     def generate_merged_mo_transition_analysis(self):
-        if self.spectra_data is None:
-            raise ValueError(
-                "Cannot perform an MO Transition Analysis. Please check that this object has an excited state calculation.")
+        self.check_sections("MO Transition Analysis", ["td"])
         alpha_delta_diagonal_matrix = self.spectra_data.delta_diagonal_matrix
         alpha_delta_mo_transition_df = dfg.get_mo_dataframe(alpha_delta_diagonal_matrix, 'AS MO ')
         #alpha_summary_df = dfg.get_summary_dataframe(parse_matrices.summarize_matrix(alpha_delta_diagonal_matrix))
@@ -222,41 +588,62 @@ class Box:
         df.set_index(['Starting State', 'Ending State'], inplace=True)
         return df
 
-    def generate_ao_transition_analysis(self, electron: str = "alpha"):
-        if self.pop_data is None and self.spectra_data is None:
-            raise ValueError(
-                "Cannot perform an AO Projection Transition Analysis. Please check this object has both a population calculation and an excited state calculation.")
-        ao_matrix = self.pop_data.ao_matrix
-        ao_matrix = parse_matrices.convert_ao_projection_to_mo_transition(self.spectra_data.n_excitation, ao_matrix)
-        ao_df = dfg.get_ao_dataframe(ao_matrix)
-
-        excitation_matrix = self.spectra_data.excitation_matrix
-        excitation_matrix = parse_matrices.convert_mo_transition_to_ao_projection(self.basic_data.n_mo, self.spectra_data.n_excitation,  excitation_matrix)
-        excitation_df = dfg.get_excitations_dataframe(self.spectra_data.methodology, excitation_matrix)
-        ao_transition_matrix = self.generate_ao_transition_matrix(electron)
-        summary_df = dfg.get_summary_dataframe(parse_matrices.summarize_matrix(ao_transition_matrix))
-        df = dfg.get_mo_dataframe(ao_transition_matrix, 'AS MO ')
-        df = pd.concat([excitation_df, ao_df, summary_df, df], axis=1)
-        index_list = ['Starting State', 'Ending State', 'Atom Number', 'Atom Type', 'Principal Quantum Number',
-             'Subshell', 'Atomic Orbital']
-        df.set_index(index_list, inplace=True)
-        return df
+    def generate_ao_transition_analysis(self, electron: str = "alpha", long_format: bool = False):
+        """
+        :param long_format: if true, the MOs are given in long format (see df_generators.get_long_mo_dataframe)
+        """
+        ao_transition_tensor = self.generate_ao_transition_tensor(electron)
+        return dfg.get_ao_transition_dataframe(self.spectra_data.methodology, self.spectra_data.excitation_matrix,
+                                               self.pop_data.ao_matrix, ao_transition_tensor, long_format)
+
+    def iterate_ao_transition_analysis(self, electron: str = "alpha", batch_size: int = 1, long_format: bool = False):
+        """
+        Yields the AO transition analysis (see generate_ao_transition_analysis) of batch_size excitations at a time,
+        so only the rows of a single batch are ever built.
+        :param batch_size: the number of excitations in every DataFrame, the last one may hold fewer
+        :return: a generator of DataFrames with the index and columns of generate_ao_transition_analysis
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer.")
+        ao_transition_tensor = self.generate_ao_transition_tensor(electron)
+        for start in range(0, self.spectra_data.n_excitation, batch_size):
+            excitations = slice(start, start + batch_size)
+            yield dfg.get_ao_transition_dataframe(self.spectra_data.methodology,
+                                                  self.spectra_data.excitation_matrix[excitations],
+                                                  self.pop_data.ao_matrix, ao_transition_tensor[excitations],
+                                                  long_format)
+
+    def write_ao_transition_analysis(self, filename, electron: str = "alpha", batch_size: int = 1,
+                                     long_format: bool = False):
+        """
+        Writes the AO transition analysis (see generate_ao_transition_analysis) to a CSV file one batch of
+        excitations at a time (see iterate_ao_transition_analysis).
+        :param filename: the path of the CSV file, which is overwritten
+        """
+        with open(filename, "w", newline="") as stream:
+            for batch_index, df in enumerate(self.iterate_ao_transition_analysis(electron, batch_size, long_format)):
+                df.to_csv(stream, header=batch_index == 0)
 
     def generate_ao_transition_matrix(self, electron: str = "alpha", swap_orbitals: bool = False):
-        if self.pop_data is None and self.spectra_data is None:
-            raise ValueError("Cannot perform an AO Projection Transition Analysis. Please check this object has both a population calculation and an excited state calculation.")
+        return self.generate_ao_transition_tensor(electron, swap_orbitals).to_matrix()
+
+    def generate_ao_transition_tensor(self, electron: str = "alpha", swap_orbitals: bool = False) -> AOTransitionTensor:
+        """
+        Returns the AO transitions of every excitation as an AOTransitionTensor, which only holds the AO projections
+        of the active space MOs and the delta diagonal matrix.
+        """
+        self.check_sections("AO Projection Transition Analysis", ["td", "pop.mo", "pop.overlap"], electron)
         if electron == "beta":
-            ao_projection_matrix = np.copy(self.pop_data.beta_electron_data.ao_projection_matrix).real
             delta_diagonal_matrix = self.spectra_data.beta_delta_diagonal_matrix
         else:
-            ao_projection_matrix = np.copy(self.pop_data.electron_data.ao_projection_matrix).real
             delta_diagonal_matrix = self.spectra_data.delta_diagonal_matrix
+        mo_indices = self.spectra_data.active_space
         if self.spectra_data.methodology == "CAS" and self.spectra_data.methodology_data.switched_orbitals is not None and swap_orbitals:
-            ao_projection_matrix = parse_matrices.swap_ao_projection_orbitals(ao_projection_matrix, self.spectra_data.methodology_data.switched_orbitals)
-        ao_projection_matrix = ao_projection_matrix[:, self.spectra_data.active_space_start: self.spectra_data.active_space_end]
-        ao_projection_matrix = parse_matrices.convert_ao_projection_to_mo_transition(self.spectra_data.n_excitation, ao_projection_matrix)
-        delta_diagonal_matrix = parse_matrices.convert_mo_transition_to_ao_projection(self.basic_data.n_mo, self.spectra_data.n_excitation, delta_diagonal_matrix)
-        return np.multiply(ao_projection_matrix, delta_diagonal_matrix)
+            # Only the projections of the MOs that end up in the active space once swapped are computed
+            mo_order = parse_matrices.swap_ao_projection_orbitals(np.arange(self.basic_data.n_mo)[np.newaxis, :], self.spectra_data.methodology_data.switched_orbitals)
+            mo_indices = mo_order[0, mo_indices]
+        ao_projection_matrix = self.pop_data.get_ao_projection_columns(mo_indices, electron == "beta").real
+        return AOTransitionTensor(ao_projection_matrix, delta_diagonal_matrix)
 
 
 
@@ -1,10 +1,17 @@
+from fasma.core import precision
+from scipy import sparse as sps
 import pandas as pd
+import numpy as np
+
+# Up to this many groups, the indicator matrix is multiplied as a dense matrix, which BLAS does faster than the
+# sparse product even though most of its entries are zero
+DENSE_INDICATOR_GROUPS = 64
 
 
 def filter_mo_analysis(dataframe: pd.DataFrame, index: list = [], mo_list: list = []):
     columns = [i for i in list(dataframe) if 'sum' in i or 'MO' in i]
     if index:
-        dataframe = dataframe.groupby(index, sort=False)[columns].sum()
+        dataframe = sum_groups(dataframe, index, columns)
     if mo_list:
         kept_mo = ['MO ' + str(number) for number in mo_list]
         dataframe = dataframe[kept_mo]
@@ -16,60 +23,234 @@ def filter_transition_rows(dataframe: pd.DataFrame, index: list = [], attributes
         dataframe = dataframe[(dataframe['transition energy'] >= energy_range[0]) & (dataframe['transition energy'] <= energy_range[1])]
     columns = [i for i in list(dataframe) if 'sum' in i or 'MO' in i]
     group_list = ["Starting State", "Ending State"] + index + attributes
-    dataframe = dataframe.groupby(group_list, sort=False)[columns].sum()
+    dataframe = sum_groups(dataframe, group_list, columns)
+    dataframe.reset_index(level=attributes, inplace=True)
+    return dataframe
+
+
+def filter_long_mo_analysis(dataframe: pd.DataFrame, index: list = [], mo_list: list = []):
+    """
+    filter_mo_analysis for an analysis in long format (see df_generators.get_long_mo_dataframe). The MOs are
+    selected by their numbers and kept as the last index level.
+    """
+    if mo_list:
+        dataframe = dataframe[get_long_mo_numbers(dataframe).isin(mo_list)]
+    if index:
+        dataframe = sum_groups(dataframe, index + [dataframe.index.names[-1]], ["value"])
+    return dataframe
+
+
+def filter_long_transition_rows(dataframe: pd.DataFrame, index: list = [], attributes: list = ["transition energy", "oscillator strength"], energy_range: tuple = None):
+    """
+    filter_transition_rows for a transition analysis in long format (see df_generators.get_long_mo_dataframe).
+    """
+    if energy_range is not None:
+        dataframe = dataframe[(dataframe['transition energy'] >= energy_range[0]) & (dataframe['transition energy'] <= energy_range[1])]
+    group_list = ["Starting State", "Ending State"] + index + attributes + [dataframe.index.names[-1]]
+    dataframe = sum_groups(dataframe, group_list, ["value"])
     dataframe.reset_index(level=attributes, inplace=True)
     return dataframe
 
 
+def filter_long_transition_columns(dataframe: pd.DataFrame, custom_mo_dict, basic_data):
+    """
+    filter_transition_columns for a transition analysis in long format (see df_generators.get_long_mo_dataframe).
+    The MO level is replaced by a categorical "MO Group" level with the categories core, the labels of
+    custom_mo_dict (or the MOs of a list, which are kept apart) and valence, in that order.
+    """
+    mo_level = dataframe.index.names[-1]
+    if isinstance(custom_mo_dict, list):
+        custom_mo_dict = {mo_level + " " + str(mo): [mo] for mo in custom_mo_dict}
+    custom_mo = np.array([mo for mo_list in custom_mo_dict.values() for mo in mo_list], dtype=int)
+    out_of_range_mo = custom_mo[(custom_mo < 1) | (custom_mo > basic_data.n_mo)]
+    if len(out_of_range_mo) > 0:
+        raise ValueError("The MOs " + str(out_of_range_mo.tolist()) + " are not between 1 and "
+                         + str(basic_data.n_mo) + ".")
+    mo_numbers = get_long_mo_numbers(dataframe).to_numpy()
+    n_mo = max(basic_data.n_mo, mo_numbers.max(initial=0))
+    # The group of every MO number, core up to the HOMO and valence above it unless it is a custom MO
+    group_codes = np.where(np.arange(n_mo + 1) <= basic_data.homo, 0, len(custom_mo_dict) + 1)
+    for code, mo_list in enumerate(custom_mo_dict.values(), start=1):
+        group_codes[mo_list] = code
+    categories = ["core"] + list(custom_mo_dict) + ["valence"]
+    mo_groups = pd.Categorical.from_codes(group_codes[mo_numbers], categories=categories)
+    attribute_columns = [column for column in dataframe.columns if column != "value"]
+    group_list = list(dataframe.index.names[:-1]) + attribute_columns + ["MO Group"]
+    dataframe = dataframe.droplevel(mo_level).assign(**{"MO Group": mo_groups})
+    dataframe = sum_groups(dataframe, group_list, ["value"])
+    dataframe.reset_index(level=attribute_columns, inplace=True)
+    return dataframe
+
+
+def get_long_mo_numbers(dataframe: pd.DataFrame) -> pd.Index:
+    """
+    Returns the MO number of every row of an analysis in long format, read from the codes of its last index level.
+    """
+    return dataframe.index.levels[-1].take(dataframe.index.codes[-1])
+
+
+def get_long_nonzero_mo(dataframe: pd.DataFrame) -> list:
+    """
+    get_nonzero_mo for an analysis in long format, which only holds the non-zero entries of its MOs.
+    """
+    return np.unique(get_long_mo_numbers(dataframe)).tolist()
+
+
+def get_group_indicator_matrix(dataframe: pd.DataFrame, keys: list):
+    """
+    Builds the indicator matrix of the groups of rows that share the same values of the keys, which sums the rows of
+    every group in a single sparse matrix product. Index levels are grouped by their integer codes, so no label is
+    hashed or compared. The matrix can be reused for every DataFrame with the same rows, for example the MO analysis
+    of both spins.
+    :param keys: the names of index levels or columns, rows with a missing key are left out like pandas groupby does
+    :return: the labels of the groups in the order they first appear and a scipy.sparse CSR matrix with a row for
+        every group and a column for every row of the dataframe
+    """
+    key_codes = []
+    key_labels = []
+    for key in keys:
+        if key in dataframe.index.names and isinstance(dataframe.index, pd.MultiIndex):
+            level = dataframe.index.names.index(key)
+            codes, labels = dataframe.index.codes[level], dataframe.index.levels[level]
+        elif key in dataframe.index.names:
+            codes, labels = pd.factorize(dataframe.index)
+        else:
+            codes, labels = pd.factorize(dataframe[key])
+        key_codes.append(np.asarray(codes, dtype=np.int64))
+        key_labels.append(pd.Index(labels))
+    kept_rows = np.flatnonzero(np.all(np.asarray(key_codes) >= 0, axis=0))
+    key_codes = [codes[kept_rows] for codes in key_codes]
+    row_codes = np.ravel_multi_index(key_codes, [max(len(labels), 1) for labels in key_labels])
+    _, first_rows, group_codes = np.unique(row_codes, return_index=True, return_inverse=True)
+    # Groups are numbered in the order they first appear, as with groupby(sort=False)
+    group_order = np.argsort(first_rows, kind="stable")
+    group_rank = np.empty_like(group_order)
+    group_rank[group_order] = np.arange(len(group_order))
+    first_rows = first_rows[group_order]
+    group_labels = [labels.take(codes[first_rows]) for codes, labels in zip(key_codes, key_labels)]
+    if len(keys) == 1:
+        group_index = pd.Index(group_labels[0], name=keys[0])
+    else:
+        group_index = pd.MultiIndex.from_arrays(group_labels, names=keys)
+    indicator_matrix = sps.csr_matrix((np.ones(len(kept_rows)), (group_rank[group_codes.ravel()], kept_rows)),
+                                      shape=(len(group_index), len(dataframe)))
+    return group_index, indicator_matrix
+
+
+def sum_groups(dataframe: pd.DataFrame, keys: list, columns: list, group_indicator=None) -> pd.DataFrame:
+    """
+    Sums the columns over the groups of rows that share the same values of the keys, the same as
+    dataframe.groupby(keys, sort=False, observed=True)[columns].sum().
+    :param group_indicator: the labels and indicator matrix of the groups (see get_group_indicator_matrix), built
+        from the dataframe if not given
+    :return: a DataFrame with a row for every group
+    """
+    group_index, indicator_matrix = group_indicator or get_group_indicator_matrix(dataframe, keys)
+    column_dtypes = dataframe[columns].dtypes
+    accumulator_dtype = precision.get_accumulator_dtype(np.result_type(*column_dtypes))
+    values = dataframe[columns].to_numpy(dtype=accumulator_dtype)
+    # Missing values are skipped like pandas sum does, the values can be a view of the dataframe so they are copied
+    if np.isnan(values).any():
+        values = np.nan_to_num(values)
+    if indicator_matrix.shape[0] <= DENSE_INDICATOR_GROUPS:
+        group_values = indicator_matrix.toarray() @ values
+    else:
+        group_values = indicator_matrix @ values
+    if column_dtypes.nunique() == 1:
+        return pd.DataFrame(group_values.astype(column_dtypes.iloc[0], copy=False), index=group_index, columns=columns)
+    group_df = pd.DataFrame(group_values, index=group_index, columns=columns)
+    return group_df.astype(column_dtypes[column_dtypes != accumulator_dtype].to_dict())
+
+
 def filter_transition_columns(dataframe, custom_mo_dict, basic_data):
-    new_df = dataframe.copy()
-    mo_dict = {}
+    """
+    Sums the MO columns of a transition analysis into a core column (the occupied MOs), a column for every custom
+    group and a valence column (the virtual MOs). Every column is mapped to its label once and all the sums are
+    computed in a single matrix product, so the new frame is put together in one go.
+    :param custom_mo_dict: a dict of labels to the MO numbers summed into a column of that label, or a list of MO
+        numbers whose columns are kept apart
+    """
     if isinstance(custom_mo_dict, list):
         mo_list = custom_mo_dict
         custom_mo_dict = {}
-    elif isinstance(custom_mo_dict, dict):
-        mo_list = []
-        for label, mo in custom_mo_dict.items():
-            mo_list += mo
-            custom_mo_dict[label] = ['AS MO ' + str(number) for number in mo]
-    core_column = ['AS MO ' + str(mo) for mo in range(1, basic_data.homo + 1) if mo not in mo_list]
-    mo_dict["core"] = core_column
+    else:
+        mo_list = [mo for mo_group in custom_mo_dict.values() for mo in mo_group]
+    excluded_mo = set(mo_list)
+    mo_dict = {"core": [mo for mo in range(1, basic_data.homo + 1) if mo not in excluded_mo]}
     mo_dict.update(custom_mo_dict)
-    valence_column = ['AS MO ' + str(mo) for mo in range(basic_data.homo + 1, basic_data.n_mo + 1) if mo not in mo_list]
-    mo_dict["valence"] = valence_column
-    for label, column_list in mo_dict.items():
-        combine_mo_columns(new_df, label, column_list)
-    return new_df
+    mo_dict["valence"] = [mo for mo in range(basic_data.homo + 1, basic_data.n_mo + 1) if mo not in excluded_mo]
+    labels = list(mo_dict)
+    column_lists = [['AS MO ' + str(mo) for mo in mo_group] for mo_group in mo_dict.values()]
+    summed_columns = pd.Index(list(dict.fromkeys(column for column_list in column_lists for column in column_list)))
+    missing_columns = summed_columns[~summed_columns.isin(dataframe.columns)]
+    if len(missing_columns) > 0:
+        raise KeyError(str(list(missing_columns)) + " not in index")
+    column_positions = dataframe.columns.get_indexer(summed_columns)
+
+    # The label of every summed column as a (column, label) indicator matrix
+    indicator_matrix = np.zeros((len(summed_columns), len(labels)))
+    for label_index, column_list in enumerate(column_lists):
+        indicator_matrix[summed_columns.get_indexer(column_list), label_index] = 1
+    summed_dtypes = dataframe.dtypes.iloc[column_positions]
+    label_dtype = np.result_type(*summed_dtypes) if len(summed_dtypes) > 0 else np.float64
+    values = dataframe.iloc[:, column_positions].to_numpy(dtype=precision.get_accumulator_dtype(label_dtype))
+    # Missing values are skipped like pandas sum does
+    if np.isnan(values).any():
+        values = np.nan_to_num(values)
+    label_df = pd.DataFrame((values @ indicator_matrix).astype(label_dtype, copy=False), index=dataframe.index,
+                            columns=labels)
+
+    # The core column takes the place of the first MO column and the other labels are appended
+    kept_columns = np.ones(len(dataframe.columns), dtype=bool)
+    kept_columns[column_positions] = False
+    before_core = np.arange(len(dataframe.columns)) < dataframe.columns.get_loc("AS MO 1")
+    return pd.concat([dataframe.iloc[:, np.flatnonzero(kept_columns & before_core)], label_df.iloc[:, :1],
+                      dataframe.iloc[:, np.flatnonzero(kept_columns & ~before_core)], label_df.iloc[:, 1:]], axis=1)
+
+
+def get_mo_values(dataframe):
+    """
+    Returns the names and values of the MO columns of an analysis: every column from the first MO column (or "core"
+    once filter_transition_columns was called) to the last.
+    """
+    columns = dataframe.columns
+    if "core" in columns:
+        first_column = "core"
+    else:
+        first_column = next(column for column in columns if 'MO' in column and column != "non-zero MOs")
+    start = columns.get_loc(first_column)
+    return columns.to_numpy()[start:], dataframe.iloc[:, start:].to_numpy()
+
+
+def get_nonzero_mo_matrix(dataframe):
+    """
+    Finds the non-zero MOs of every row of an analysis.
+    :return: a numpy array of the names of the MO columns (see get_mo_values) and a scipy.sparse CSR boolean matrix
+        with a row for every row of the dataframe and a column for every MO column, true where the MO is non-zero.
+        Its indices and indptr give the non-zero MOs of every row
+    """
+    columns, values = get_mo_values(dataframe)
+    return columns, sps.csr_matrix(values != 0)
 
 
 def show_nonzero_mo(dataframe):
+    """
+    Inserts a "non-zero MOs" column holding the list of the names of the non-zero MO columns of every row in front
+    of the MO columns, a rendering of get_nonzero_mo_matrix.
+    """
     new_df = dataframe.copy()
-    if "core" in dataframe.columns:
-        columns = ['core', 'valence']
-    else:
-        columns = [i for i in list(dataframe) if 'MO' in i]
-    column_index = new_df.columns.get_indexer([columns[0], columns[-1]])
-    cols = new_df.columns.values[column_index[0]:]
-    mask = new_df.ne(0).values[:, column_index[0]:]
-    out = [cols[x].tolist() for x in mask]
-    new_df.insert(new_df.columns.get_loc(columns[0]), "non-zero MOs", out)
+    columns, nonzero_matrix = get_nonzero_mo_matrix(dataframe)
+    nonzero_columns = np.split(columns[nonzero_matrix.indices], nonzero_matrix.indptr[1:-1])
+    new_df.insert(new_df.columns.get_loc(columns[0]), "non-zero MOs", [row.tolist() for row in nonzero_columns])
     return new_df
 
 
 def get_nonzero_mo(dataframe):
-    non_zero_mo_per_excitation = dataframe["non-zero MOs"].to_list()
-    mo_list = set()
-    for current_mo_list in non_zero_mo_per_excitation:
-        mo_list.update(current_mo_list)
-    mo_list = [int(mo.strip("AS MO")) for mo in mo_list]
+    """
+    Returns the sorted numbers of the MOs that are non-zero in any row of an analysis.
+    """
+    columns, values = get_mo_values(dataframe)
+    mo_list = [int(mo.strip("AS MO")) for mo in columns[(values != 0).any(axis=0)]]
     mo_list.sort()
     return mo_list
 
-
-def combine_mo_columns(dataframe, label, column_list):
-    sum_column = dataframe.loc[:, column_list].sum(axis=1)
-    if label == "core":
-        dataframe.insert(dataframe.columns.get_loc("AS MO 1"), label, sum_column)
-    else:
-        dataframe[label] = sum_column
-    dataframe.drop(column_list, axis=1, inplace=True)
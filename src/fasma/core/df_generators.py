@@ -1,4 +1,6 @@
 from fasma.core import spectrum as sp
+from fasma.core import df_filters as dff
+from scipy import sparse as sps
 import pandas as pd
 import numpy as np
 import warnings
@@ -28,39 +30,54 @@ def get_plotting_dataframe(dataframe, root="oscillator strength", state_breakdow
         index_list.remove("Starting State")
     if len(index_list) == 0:
         index_list = np.arange(len(dataframe)) // len(dataframe)
-    return dataframe.groupby(index_list, sort=False)[columns].agg(list)
+    # The AO levels are categorical, only the combinations of their labels that occur are kept
+    return dataframe.groupby(index_list, sort=False, observed=True)[columns].agg(list)
 
 
-def get_spectra_dict(dataframe, spectra_name="", keep_all=False):
-    absorption = False
-    if "core" in dataframe.columns:
-        column_index = dataframe.columns.get_indexer(['core', 'valence'])
-        mo_columns = list(dataframe.columns[column_index[0]: column_index[1] + 1].values)
-    else:
-        mo_columns = [i for i in list(dataframe) if 'sum' in i or 'MO' in i]
-        if len(mo_columns) == 0:
-            mo_columns = [list(dataframe)[1]]
-            absorption = True
+def drop_subshell_level(dataframe):
     if "Subshell" in dataframe.index.names and "Atomic Orbital" in dataframe.index.names:
         warnings.warn("The provided dataframe is broken down by Atomic Orbital and not Subshell. If a subshell breakdown was desired, drop 'Atomic Orbital' from the index list when calling extract_dataframe_plotting data().")
         dataframe = dataframe.reset_index(level='Subshell', drop=True)
+    return dataframe
+
+
+def get_spectra_label(index_names, mo_label: bool) -> str:
+    """
+    Returns the format string of the names of the spectra of get_spectra_dict and get_long_spectra_dict, filled
+    with the starting state (if it is an index level), the MO (if mo_label) and then the other index levels.
+    """
     label = ""
-    if "Starting State" in dataframe.index.names:
-            label += " State {} "
-    if "total sum" not in mo_columns and not absorption:
+    if "Starting State" in index_names:
+        label += " State {} "
+    if mo_label:
         label += "{} "
-    if "Atom Number" in dataframe.index.names:
-        if "Atom Type" not in dataframe.index.names:
+    if "Atom Number" in index_names:
+        if "Atom Type" not in index_names:
             label += "Atom "
         label += "{}"
-    if "Atom Type" in dataframe.index.names:
+    if "Atom Type" in index_names:
         label += "{} "
-    if "Principal Quantum Number" in dataframe.index.names:
-        if "Subshell" not in dataframe.index.names and "Atomic Orbital" not in dataframe.index.names:
+    if "Principal Quantum Number" in index_names:
+        if "Subshell" not in index_names and "Atomic Orbital" not in index_names:
             label += "PQN "
         label += "{}"
-    if "Subshell" in dataframe.index.names or "Atomic Orbital" in dataframe.index.names:
+    if "Subshell" in index_names or "Atomic Orbital" in index_names:
         label += "{}"
+    return label
+
+
+def get_spectra_dict(dataframe, spectra_name="", keep_all=False):
+    absorption = False
+    if "core" in dataframe.columns:
+        column_index = dataframe.columns.get_indexer(['core', 'valence'])
+        mo_columns = list(dataframe.columns[column_index[0]: column_index[1] + 1].values)
+    else:
+        mo_columns = [i for i in list(dataframe) if 'sum' in i or 'MO' in i]
+        if len(mo_columns) == 0:
+            mo_columns = [list(dataframe)[1]]
+            absorption = True
+    dataframe = drop_subshell_level(dataframe)
+    label = get_spectra_label(dataframe.index.names, "total sum" not in mo_columns and not absorption)
     spectra_dict = {}
     index_list = list(dataframe.index)
     for current_row in range(len(dataframe)):
@@ -102,19 +119,18 @@ def get_excitations_dataframe(methodology, excitation_matrix):
     return df
 
 
-def get_ao_dataframe(ao_matrix) -> np.array:
+def get_ao_dataframe(ao_matrix) -> pd.DataFrame:
     """
-    Returns a numpy matrix containing the oscillation strength of every excited state from each ground state.
-    :raise ValueError: incorrect number of oscillation strengths found
-    :return: a numpy array containing the oscillation strength of every excited state from each ground state.
+    Returns the labels of the AOs as a DataFrame, of categorical columns for an AOTable.
+    :param ao_matrix: an AOTable, or a numpy array of labels with a row for every AO and a column for every label
+        of AOTable.COLUMNS (the ao_matrix of earlier versions), which gives string columns
     """
-    data_dict = {"Atom Number": ao_matrix[:, 0], "Atom Type": ao_matrix[:, 1],
-                 "Principal Quantum Number": ao_matrix[:, 2], "Subshell": ao_matrix[:, 3],
-                 "Atomic Orbital": ao_matrix[:, 4]}
-
-    df = pd.DataFrame(data_dict)
-
-    return df
+    if isinstance(ao_matrix, np.ndarray):
+        data_dict = {"Atom Number": ao_matrix[:, 0], "Atom Type": ao_matrix[:, 1],
+                     "Principal Quantum Number": ao_matrix[:, 2], "Subshell": ao_matrix[:, 3],
+                     "Atomic Orbital": ao_matrix[:, 4]}
+        return pd.DataFrame(data_dict)
+    return ao_matrix.get_dataframe()
 
 
 def get_summary_dataframe(summary_matrix) -> np.array:
@@ -125,7 +141,101 @@ def get_summary_dataframe(summary_matrix) -> np.array:
 
 
 def get_mo_dataframe(delta_diagonal_matrix, title):
+    # Sparse matrices are only made dense here, where a DataFrame is asked for
+    if sps.issparse(delta_diagonal_matrix):
+        delta_diagonal_matrix = delta_diagonal_matrix.toarray()
     mo_transition_df = pd.DataFrame(delta_diagonal_matrix)
     mo_transition_df.columns += 1
     df = mo_transition_df.add_prefix(title)
     return df
+
+
+def get_ao_transition_dataframe(methodology, excitation_matrix, ao_matrix, ao_transition_tensor,
+                                long_format: bool = False):
+    """
+    Returns the AO transition analysis of a number of excitations, with a row for every (excitation, AO) pair.
+    :param excitation_matrix: the rows of the excitation matrix of the excitations
+    :param ao_matrix: the AO labels of the population calculation, an AOTable or a numpy array (see get_ao_dataframe)
+    :param ao_transition_tensor: the AOTransitionTensor of the excitations
+    :param long_format: if true, the MOs are given in long format (see get_long_mo_dataframe)
+    """
+    n_excitation, n_ao = ao_transition_tensor.shape[:2]
+    excitation_df = get_excitations_dataframe(methodology, np.repeat(excitation_matrix, n_ao, axis=0))
+    if isinstance(ao_matrix, np.ndarray):
+        ao_df = get_ao_dataframe(np.tile(ao_matrix, (n_excitation, 1)))
+    else:
+        ao_df = get_ao_dataframe(ao_matrix.tile(n_excitation))
+    index_list = ['Starting State', 'Ending State', 'Atom Number', 'Atom Type', 'Principal Quantum Number',
+                  'Subshell', 'Atomic Orbital']
+    if long_format:
+        row_df = pd.concat([excitation_df, ao_df], axis=1).set_index(index_list)
+        return get_long_mo_dataframe(ao_transition_tensor.to_matrix(), row_df, 'AS MO')
+    summary_df = get_summary_dataframe(ao_transition_tensor.summarize())
+    df = get_mo_dataframe(ao_transition_tensor.to_matrix(), 'AS MO ')
+    df = pd.concat([excitation_df, ao_df, summary_df, df], axis=1)
+    df.set_index(index_list, inplace=True)
+    return df
+
+
+def get_long_mo_dataframe(mo_matrix, row_df, mo_level):
+    """
+    Returns the MO columns of an analysis in long format: a row for every non-zero entry of the matrix, indexed by
+    the index of its row followed by its MO number, holding the columns of its row and the entry as "value". MOs
+    are selected and grouped by their integer numbers (see df_filters.filter_long_mo_analysis), so the frame never
+    has a column per MO and MOs that do not take part in a row take no space.
+    :param mo_matrix: a numpy array or scipy.sparse matrix with a row for every row of row_df and a column per MO
+    :param row_df: a DataFrame indexed by the rows of the analysis, holding the columns repeated for every entry
+    :param mo_level: the name of the MO number index level, "MO" or "AS MO"
+    :return: a DataFrame indexed by the levels of row_df and mo_level
+    """
+    if sps.issparse(mo_matrix):
+        mo_matrix = sps.coo_matrix(mo_matrix)
+        mo_matrix.sum_duplicates()
+        order = np.lexsort((mo_matrix.col, mo_matrix.row))
+        rows, columns, values = mo_matrix.row[order], mo_matrix.col[order], mo_matrix.data[order]
+        kept = values != 0
+        rows, columns, values = rows[kept], columns[kept], values[kept]
+    else:
+        rows, columns = np.nonzero(mo_matrix)
+        values = mo_matrix[rows, columns]
+    long_df = row_df.iloc[rows]
+    row_index = long_df.index
+    if isinstance(row_index, pd.MultiIndex):
+        index_arrays = [row_index.get_level_values(level) for level in range(row_index.nlevels)]
+    else:
+        index_arrays = [row_index]
+    long_df.index = pd.MultiIndex.from_arrays(index_arrays + [columns + 1], names=list(row_index.names) + [mo_level])
+    long_df = long_df.assign(value=values)
+    return long_df
+
+
+def get_long_spectra_dict(dataframe, root="oscillator strength", spectra_name="", keep_all=False,
+                          state_breakdown=False):
+    """
+    Returns the spectra of a long format transition analysis (see df_filters.filter_long_transition_rows): a
+    SimulatedSpectrum for every MO (or MO Group) and combination of the other index levels but the states, with
+    sticks at the transition energies as high as value times root. The spectra are named as by get_spectra_dict.
+    :param state_breakdown: if true, the spectra of every starting state are kept apart
+    """
+    dataframe = drop_subshell_level(dataframe)
+    mo_level = dataframe.index.names[-1]
+    ao_levels = [name for name in dataframe.index.names[:-1] if name not in ("Starting State", "Ending State")]
+    state_levels = ["Starting State"] if state_breakdown else []
+    label = get_spectra_label(state_levels + ao_levels, True)
+    energies = dataframe["transition energy"].to_numpy()
+    sticks = dataframe["value"].to_numpy() * dataframe[root].to_numpy()
+    group_index, indicator_matrix = dff.get_group_indicator_matrix(dataframe, state_levels + [mo_level] + ao_levels)
+    indicator_matrix = sps.csr_matrix(indicator_matrix)
+    spectra_dict = {}
+    for group, parameter_list in enumerate(group_index):
+        rows = indicator_matrix.indices[indicator_matrix.indptr[group]: indicator_matrix.indptr[group + 1]]
+        if not isinstance(parameter_list, tuple):
+            parameter_list = (parameter_list,)
+        parameter_list = list(parameter_list)
+        # MO numbers are named after their level as the MO columns are, "AS MO 5" rather than "5"
+        if mo_level.endswith("MO"):
+            parameter_list[len(state_levels)] = mo_level + " " + str(parameter_list[len(state_levels)])
+        current_spectra_name = (spectra_name + " " + label.format(*parameter_list)).strip()
+        if sticks[rows].any() or keep_all:
+            spectra_dict[current_spectra_name] = sp.SimulatedSpectrum(energies[rows], sticks[rows])
+    return spectra_dict
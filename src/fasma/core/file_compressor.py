@@ -1,23 +1,209 @@
 from fasma.gaussian import parse_gaussian as pg
 from fasma.core import file_reader as fr
+from fasma.core import parse_cache as pc
+from fasma.core import precision
+from fasma.core import log_follower as lf
+from fasma.chronus import parse_rt
 from fasma.core import boxes as bx
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from itertools import islice
 import numpy as np
 import pandas as pd
 import pickle
+import glob
+import os
 
-def parse(filename):
-    key_trie_list, file_lines_list, file_type = fr.read(filename)
-    if file_type == "Gaussian":
-        parse_meth = pg.parse
-    box_list = []
-    for current_key_trie, current_file_lines in zip(key_trie_list, file_lines_list):
-        current_box = pg.parse(current_key_trie, current_file_lines)
-        box_list.append(current_box)
+
+def parse(filename, n_workers: int = None, cache=None, lazy: bool = False, sections=None, sparse: bool = False,
+          dtype=None):
+    """
+    Parses every job of a .log file into a Box, or the real-time trajectory of a ChronusQ .out file into a Box
+    holding a RealTimeData object (see parse_rt.parse).
+    :param filename: the path of the file, which may be compressed (.gz, .bz2 or .xz)
+    :param n_workers: the number of worker processes parsing separate jobs (Link1 sections) of the file at
+        the same time, jobs are parsed one after another in this process by default. Compressed files are
+        always parsed in this process since every worker would have to decompress the whole file
+    :param cache: True to reuse results cached on disk by the content of the file (see parse_cache.ParseCache),
+        a cache directory or ParseCache to use a specific cache, no caching by default
+    :param lazy: if true, the population matrices (pop_data) are only parsed when they are first accessed, which
+        keeps the file mapped until then. Results that are cached or parsed by worker processes are always complete
+    :param sections: the sections to parse, for example {"basic", "td"} (see parse_gaussian.SECTIONS). The parsers
+        of the other sections are skipped and the keys only they look up are left out of the keyword index.
+        Every section by default
+    :param sparse: if true, the delta diagonal matrices of the excited states are scipy.sparse CSR matrices, which
+        are only made dense when a DataFrame is generated from them
+    :param dtype: the floating point type of the parsed matrices and of the matrices computed from them, np.float32
+        to halve their memory (complex matrices use the matching complex type). Sums over them are still
+        accumulated in double precision. The default set with precision.set_default_dtype by default, np.float64
+        unless changed
+    :return: a Box if the file holds a single job, a list of Box objects in file order otherwise
+    """
+    sections = pg.get_sections(sections)
+    dtype = precision.get_dtype(dtype)
+    parse_cache = pc.get_cache(cache)
+    if parse_cache is not None:
+        options = {"sections": None if sections is None else sorted(sections)}
+        if sparse:
+            options["sparse"] = True
+        if dtype != np.float64:
+            options["dtype"] = dtype.name
+        cache_key = parse_cache.get_key(filename, **options)
+        box_list = parse_cache.load(cache_key)
+        if box_list is not None:
+            return box_list
+
+    if fr.strip_compression(filename).endswith('.out'):
+        # ChronusQ real-time trajectories are streamed, never split into indexed lines
+        box_list = [parse_rt.parse(filename)]
+    elif n_workers is not None and n_workers > 1 and filename.endswith('.log'):
+        box_list = parse_parallel(filename, n_workers, sections, sparse, dtype)
+    else:
+        key_trie_list, file_lines_list, file_type = fr.read(filename, pg.get_words(sections))
+        box_list = []
+        for current_key_trie, current_file_lines in zip(key_trie_list, file_lines_list):
+            current_box = pg.parse(current_key_trie, current_file_lines, lazy=lazy, sections=sections, sparse=sparse,
+                                   dtype=dtype)
+            box_list.append(current_box)
     if len(box_list) == 1:
         box_list = box_list[0]
+    if parse_cache is not None:
+        parse_cache.store(cache_key, box_list)
     return box_list
 
 
+def follow(filename, interval: float = 10.0, timeout: float = None, sections=None, sparse: bool = False,
+           dtype=None):
+    """
+    Follows a .log file that Gaussian is still writing, parsing only the output appended since the previous poll.
+    :param filename: the path of the uncompressed .log file
+    :param interval: the number of seconds between two polls of the file
+    :param timeout: the number of seconds without new output after which following stops, never by default
+    :param sections: the sections to parse from every job (see parse), every section by default
+    :param sparse: if true, the delta diagonal matrices are scipy.sparse CSR matrices (see parse)
+    :param dtype: the floating point type of the parsed matrices (see parse)
+    :return: a generator yielding a list of Box objects every time new output is read: one for every finished job,
+        followed by the partial Box of the running job holding the excited states and CAS roots printed so far
+        (see log_follower.LogFollower)
+    """
+    return lf.LogFollower(filename, sections, sparse, dtype).follow(interval, timeout)
+
+
+def parse_parallel(filename, n_workers: int, sections=None, sparse: bool = False, dtype=None):
+    job_list = fr.find_gaussian_jobs(filename)
+    if len(job_list) == 1:
+        return [parse_job((filename, *job_list[0], sections, sparse, dtype))]
+    with ProcessPoolExecutor(min(n_workers, len(job_list))) as executor:
+        return list(executor.map(parse_job, ((filename, start, end, sections, sparse, dtype) for start, end in job_list)))
+
+
+def parse_job(arg):
+    filename, start, end, sections, sparse, dtype = arg
+    key_trie, file_lines = fr.read_gaussian_job(filename, start, end, pg.get_words(sections))
+    return pg.parse(key_trie, file_lines, sections=sections, sparse=sparse, dtype=dtype)
+
+
+def parse_many(paths, n_workers: int = None, chunksize: int = 1, max_in_flight: int = None, sections=None,
+               sparse: bool = False, dtype=None):
+    """
+    Parses many files in worker processes and yields the results as they finish (not in input order).
+    A file that fails to parse does not stop the batch; its exception is yielded in place of its Box. A file that
+    kills its worker process (for example when it runs out of memory) doesn't either: the pool is started again,
+    the chunks that were in flight are run again one at a time to find the one that killed it, and a
+    BrokenProcessPool is yielded for every file of that chunk.
+    :param paths: a directory (every .log file in it is parsed, compressed or not), a glob pattern, or an iterable of paths
+    :param n_workers: the number of worker processes, the number of CPUs by default
+    :param chunksize: the number of files handed to a worker at a time
+    :param max_in_flight: the maximum number of chunks submitted but not yet yielded, which bounds the memory
+        held by finished results waiting to be consumed, twice the number of workers by default
+    :param sections: the sections to parse from every file (see parse), every section by default
+    :param sparse: if true, the delta diagonal matrices are scipy.sparse CSR matrices (see parse)
+    :param dtype: the floating point type of the parsed matrices (see parse)
+    :return: a generator of (path, Box or list of Box objects or exception) tuples
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    if max_in_flight is None:
+        max_in_flight = 2 * n_workers
+    sections = pg.get_sections(sections)
+    # The type is resolved here since worker processes may not share the default of this process
+    dtype = precision.get_dtype(dtype)
+    paths = iter(expand_paths(paths))
+    # Chunks that were not submitted because the pool broke, submitted first once it is started again
+    queued = deque()
+    # Chunks that were in flight when a worker process died, any of which may have killed it
+    suspects = deque()
+    executor = ProcessPoolExecutor(n_workers)
+    pending = {}
+    try:
+        while True:
+            broken = False
+            # A suspect is run alone, so if the pool breaks again it is the one killing its worker
+            isolated = bool(suspects)
+            if isolated:
+                chunk = suspects.popleft()
+                pending[executor.submit(parse_chunk, chunk, sections, sparse, dtype)] = chunk
+            while not isolated and len(pending) < max_in_flight:
+                chunk = queued.popleft() if queued else list(islice(paths, chunksize))
+                if not chunk:
+                    break
+                try:
+                    pending[executor.submit(parse_chunk, chunk, sections, sparse, dtype)] = chunk
+                except BrokenProcessPool:
+                    queued.appendleft(chunk)
+                    broken = True
+                    break
+            if not pending and not broken:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            while done:
+                for future in done:
+                    chunk = pending.pop(future)
+                    try:
+                        results = future.result()
+                    except BrokenProcessPool as e:
+                        broken = True
+                        if isolated:
+                            for path in chunk:
+                                yield path, e
+                        else:
+                            suspects.append(chunk)
+                    except Exception as e:
+                        # The worker itself failed (or its result could not be sent back), blame every file of the chunk
+                        for path in chunk:
+                            yield path, e
+                    else:
+                        yield from results
+                # Every chunk still pending fails once the pool is broken, they are all collected before it is replaced
+                done = wait(pending)[0] if broken else ()
+            if broken:
+                executor.shutdown()
+                executor = ProcessPoolExecutor(n_workers)
+    finally:
+        executor.shutdown()
+
+
+def expand_paths(paths):
+    if isinstance(paths, (str, os.PathLike)):
+        paths = os.fspath(paths)
+        if os.path.isdir(paths):
+            return sorted(path for pattern in ["*.log"] + ["*.log" + extension for extension in fr.COMPRESSED_OPENERS]
+                          for path in glob.glob(os.path.join(paths, pattern)))
+        return sorted(glob.glob(paths))
+    return paths
+
+
+def parse_chunk(chunk, sections=None, sparse: bool = False, dtype=None):
+    results = []
+    for path in chunk:
+        try:
+            results.append((path, parse(os.fspath(path), sections=sections, sparse=sparse, dtype=dtype)))
+        except Exception as e:
+            results.append((path, e))
+    return results
+
+
 # Function for merging two box object containing separate excited state and pop calculation
 def merge(box1, box2):
     if box1.spectra_data is None:
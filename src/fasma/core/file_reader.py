@@ -1,104 +1,312 @@
-from fasma.core.keyword_trie import KeywordTrie as kt
+from fasma.core.keyword_trie import KeywordIndex as kt
+from fasma.core import line_store as ls
+from functools import lru_cache
+import numpy as np
 import warnings
+import gzip
+import bz2
+import lzma
+import os
 
+# Lines of a Gaussian job standardized before indexing: read-in coordinates (iop 1/29 = 6 or 7) are given the
+# header of the usual Z-matrix printout and the connectivity data line is blanked
+GAUSSIAN_REPLACED_LINES = {
+    b"Redundant internal coordinates found in file": "Symbolic Z-matrix:",
+    b"Z-Matrix found in chk file": "Symbolic Z-matrix:",
+    b"Recover connectivity data from disk": "",
+}
 
-def check_line(line, current_kt, current_lines):
-    current_lines.append(line)
-    temp_line = line.strip().split()
-    valid_line = False
-    for current_word in temp_line:
+# Bytes separating the tokens of a line, the ASCII whitespace that str.split splits on
+WHITESPACE = np.zeros(256, dtype=bool)
+WHITESPACE[list(b" \t\n\r\v\f")] = True
+
+# Openers of the compressed files that are decompressed while they are read
+COMPRESSED_OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+
+def is_keyword_line(words) -> bool:
+    # Only lines with a word of letters or a word holding "=" or ":" are indexed, which leaves out most matrix rows
+    for current_word in words:
         if not current_word.isnumeric():
             if current_word.isalpha() or (
                     current_word.__contains__("=") or current_word.__contains__(":")):
-                valid_line = True
-                break
-    if valid_line:
+                return True
+    return False
+
+
+def check_line(line, current_kt, line_number):
+    temp_line = line.strip().split()
+    if is_keyword_line(temp_line):
         for current_word in temp_line:
-            current_kt.insert(current_word, len(current_lines))
+            current_kt.insert(current_word, line_number)
+
+
+class KeywordMatcher:
+    """
+    Finds every token of a byte buffer that starts with one of a set of words in a single pass. Token starts are
+    filtered with numpy lookup tables of the first byte and the first two bytes of every word, so only the few tokens
+    left are compared with the words in Python.
+
+    Attributes:
+        words: a frozenset of the words being searched for
+        lengths: the distinct lengths of the words from the longest to the shortest
+        first_bytes: a table of the first bytes of the words
+        one_byte_words: a table of the words made of a single byte
+        byte_pairs: a table of the first two bytes of the longer words, indexed by a 16-bit code
+    """
+    def __init__(self, words: frozenset):
+        self.words = words
+        self.lengths = sorted({len(word) for word in words}, reverse=True)
+        self.first_bytes = np.zeros(256, dtype=bool)
+        self.one_byte_words = np.zeros(256, dtype=bool)
+        self.byte_pairs = np.zeros(1 << 16, dtype=bool)
+        for word in words:
+            encoded_word = word.encode()
+            self.first_bytes[encoded_word[0]] = True
+            if len(encoded_word) == 1:
+                self.one_byte_words[encoded_word[0]] = True
+            else:
+                self.byte_pairs[encoded_word[0] << 8 | encoded_word[1]] = True
+
+    def get_matched_words(self, token: str) -> list:
+        return [token[:length] for length in self.lengths if token[:length] in self.words]
+
+    def find_token_starts(self, buffer, start: int, end: int) -> np.ndarray:
+        """
+        Finds the byte offsets of the tokens within a range of a buffer whose first two bytes match a word.
+        :return: a sorted numpy array of byte offsets
+        """
+        token_starts = []
+        for chunk_start in range(start, end, ls.SCAN_CHUNK_SIZE):
+            n_byte = min(ls.SCAN_CHUNK_SIZE, end - chunk_start)
+            # The chunk is read with the byte before it (a space at the start of the buffer) and the byte after it so
+            # tokens on its edges are checked like the others
+            after = 1 if chunk_start + n_byte < len(buffer) else 0
+            if chunk_start > 0:
+                chunk = np.frombuffer(buffer, dtype=np.uint8, count=n_byte + 1 + after, offset=chunk_start - 1)
+            else:
+                chunk = np.concatenate([np.array([ord(" ")], dtype=np.uint8),
+                                        np.frombuffer(buffer, dtype=np.uint8, count=n_byte + after)])
+            # Every control character is taken for whitespace by the cheap comparisons finding the token starts,
+            # the few positions left are then checked exactly
+            is_start = np.less_equal(chunk[:n_byte], ord(" "))
+            np.logical_and(is_start, chunk[1: n_byte + 1] > ord(" "), out=is_start)
+            positions = np.flatnonzero(is_start) + 1
+            positions = positions[self.first_bytes[chunk[positions]] & WHITESPACE[chunk[positions - 1]]]
+            next_bytes = chunk[np.minimum(positions + 1, len(chunk) - 1)]
+            next_bytes[positions + 1 >= len(chunk)] = ord(" ")
+            first_bytes = chunk[positions].astype(np.int64)
+            matched = self.one_byte_words[first_bytes] | self.byte_pairs[first_bytes << 8 | next_bytes]
+            token_starts.append(positions[matched] - 1 + chunk_start)
+        if not token_starts:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(token_starts)
+
+
+@lru_cache(maxsize=None)
+def get_keyword_matcher(words: frozenset) -> KeywordMatcher:
+    return KeywordMatcher(words)
+
+
+def index_keywords(file_lines, words: frozenset, current_kt: kt = None, start: int = 0, end: int = None):
+    """
+    Builds a KeywordIndex of the tokens of the given lines that start with one of the given words, each inserted as
+    the words it starts with. The buffer of the lines is searched for every word at once (see KeywordMatcher), so
+    only the lines holding a match are decoded.
+    :param file_lines: the lines being indexed
+    :param words: a frozenset of the words being searched for (see keyword_trie.get_registered_words)
+    :param current_kt: a KeywordIndex of the lines before start to add the new line numbers to, a new one by default
+    :param start: the index of the first line being indexed, so lines appended to a growing file can be indexed
+        on their own (see log_follower.LogFollower)
+    :param end: the index of the last line being indexed (non-inclusive), the end of the lines by default
+    :return: a KeywordIndex holding the line numbers of every word
+    """
+    if current_kt is None:
+        current_kt = kt()
+    if end is None:
+        end = len(file_lines)
+    if not words or start >= end:
+        return current_kt
+    matcher = get_keyword_matcher(words)
+    token_starts = matcher.find_token_starts(file_lines.buffer, int(file_lines.offsets[start]), int(file_lines.offsets[end]))
+    line_indices = np.unique(np.searchsorted(file_lines.offsets, token_starts, side="right") - 1).tolist()
+    # Replaced lines shadow the buffer so they are checked on their own text
+    line_indices = sorted(set(line_indices) | {current_index for current_index in file_lines.replaced_lines
+                                               if start <= current_index < end})
+    for current_index in line_indices:
+        words_of_line = file_lines[current_index].split()
+        if not is_keyword_line(words_of_line):
+            continue
+        for current_word in words_of_line:
+            for matched_word in matcher.get_matched_words(current_word):
+                current_kt.insert(matched_word, current_index + 1)
+    return current_kt
+
+
+def get_opener(filename):
+    """
+    Returns the function opening a compressed file with the extension of the given file, None if it isn't compressed.
+    """
+    return COMPRESSED_OPENERS.get(os.path.splitext(filename)[1].lower())
 
 
-def read_gaussian(filename):
+def strip_compression(filename) -> str:
+    """
+    Returns the given path without its compression extension, for example "water.log" for "water.log.gz".
+    """
+    if get_opener(filename) is None:
+        return filename
+    return os.path.splitext(filename)[0]
+
+
+def map_file(filename, start: int = 0, end: int = None):
+    opener = get_opener(filename)
+    if opener is not None:
+        # Compressed files are decompressed into memory, a byte range is a range of the decompressed text
+        try:
+            with opener(filename, "rb") as stream:
+                file_lines = ls.read_stream(stream)
+        except FileNotFoundError:
+            raise OSError("The file with the given path cannot be opened. Please try again.")
+        except (OSError, EOFError, lzma.LZMAError):
+            raise OSError("The compressed file with the given path cannot be decompressed. Please check if it is complete.")
+        if start != 0 or end is not None:
+            file_lines = ls.LineStore(file_lines.buffer, ls.find_line_offsets(file_lines.buffer, start, end))
+        return file_lines
     try:
-        with open(filename, "r") as f:
-            list_of_key_tries = []
-            list_of_lines_list = []
-            current_kt = kt()
-            current_lines = []
-            for line in f:
-                # Check for read-in coordinates (iop 1/29 = 6 or 7) to standardize text format
-                if "Redundant internal coordinates found in file" in line or "Z-Matrix found in chk file" in line:
-                    line = "Symbolic Z-matrix:"
-                if "Recover connectivity data from disk" in line:
-                    line = ""
-                check_line(line, current_kt, current_lines)
-                if "Normal termination" in line:
-                    list_of_key_tries.append(current_kt)
-                    list_of_lines_list.append(current_lines)
-                    current_kt = kt()
-                    current_lines = []
-            if len(current_lines) > 0:
-                list_of_key_tries.append(current_kt)
-                list_of_lines_list.append(current_lines)
+        return ls.map_file(filename, start, end)
     except OSError:
         raise OSError("The file with the given path cannot be opened. Please try again.")
-    else:
-        for current_line_list in list_of_lines_list:
-            if "Normal termination" not in current_line_list[-1]:
-                warnings.warn("This file was not terminated normally. Check if this is the intended .log file.")
+
+
+def split_gaussian_jobs(file_lines) -> list:
+    """
+    Splits the lines of a .log file into one LineStore per job, each ending at a "Normal termination" line.
+    :param file_lines: all the lines of the .log file
+    :return: a list containing the lines of every job in file order
+    """
+    list_of_lines_list = []
+    job_start = 0
+    for termination_index in file_lines.find_lines_containing(b"Normal termination"):
+        list_of_lines_list.append(file_lines.view(job_start, termination_index + 1))
+        job_start = termination_index + 1
+    if job_start < len(file_lines):
+        list_of_lines_list.append(file_lines.view(job_start, len(file_lines)))
+    return list_of_lines_list
+
+
+def find_gaussian_jobs(filename) -> list:
+    """
+    Finds the byte range of every job in a .log file without indexing any of them.
+    :param filename: the path of the .log file
+    :return: a list containing a (start, end) byte offset pair for every job in file order
+    """
+    list_of_lines_list = split_gaussian_jobs(map_file(filename))
+    check_gaussian_termination(list_of_lines_list)
+    return [(int(current_lines.offsets[0]), int(current_lines.offsets[-1])) for current_lines in list_of_lines_list]
+
+
+def index_gaussian_job(file_lines, words: frozenset, current_kt: kt = None, start: int = 0, end: int = None):
+    """
+    Builds the KeywordIndex of a single job, standardizing the lines that need it first.
+    :param file_lines: all the lines of the current job
+    :param words: the words being indexed (see parse_gaussian.get_words)
+    :param current_kt: a KeywordIndex of the lines before start to add to, a new one by default (see index_keywords)
+    :param start: the index of the first line being standardized and indexed
+    :param end: the index of the last line being standardized and indexed (non-inclusive), the end of the lines by
+        default
+    :return: the KeywordIndex of the current job
+    """
+    if end is None:
+        end = len(file_lines)
+    new_lines = file_lines.view(start, end)
+    for pattern, replacement in GAUSSIAN_REPLACED_LINES.items():
+        for current_index in new_lines.find_lines_containing(pattern):
+            file_lines[start + current_index] = replacement
+    return index_keywords(file_lines, words, current_kt, start, end)
+
+
+def check_gaussian_termination(list_of_lines_list):
+    for current_line_list in list_of_lines_list:
+        if "Normal termination" not in current_line_list[-1]:
+            warnings.warn("This file was not terminated normally. Check if this is the intended .log file.")
+
+
+def read_gaussian_job(filename, start: int, end: int, words: frozenset):
+    """
+    Reads and indexes a single job of a .log file given its byte range (see find_gaussian_jobs).
+    :param words: the words being indexed (see parse_gaussian.get_words)
+    :return: the KeywordIndex and the lines of the job
+    """
+    file_lines = map_file(filename, start, end)
+    return index_gaussian_job(file_lines, words), file_lines
+
+
+def read_gaussian(filename, words: frozenset):
+    list_of_lines_list = split_gaussian_jobs(map_file(filename))
+    list_of_key_tries = [index_gaussian_job(current_lines, words) for current_lines in list_of_lines_list]
+    check_gaussian_termination(list_of_lines_list)
     return list_of_key_tries, list_of_lines_list
 
 
 def read_chronus(filename):
-    try:
-        with open(filename, "r") as f:
-            list_of_key_tries = []
-            list_of_lines_list = []
+    file_lines = map_file(filename)
+    list_of_key_tries = []
+    list_of_lines_list = []
+    current_kt = kt()
+    job_start = 0
+    parsed = False
+    found = False
+    start = 0
+    job_complete = False
+    job_complete_counter = 0
+    for current_index, line in enumerate(file_lines):
+        current_line_number = current_index - job_start
+        if job_complete:
+            job_complete_counter += 1
+        temp_line = line
+        # Checks if file has passed user input section of Chronus .out file
+        if not found and "Input File" in line:
+            found = True
+            start = current_line_number + 2
+        # Uppercase lines for standardization in user input section
+        if not parsed and found and start <= current_line_number:
+            temp_line = temp_line.upper()
+            file_lines[current_index] = temp_line
+            # Checks if arrived at the end of user input section
+            if "====" in line:
+                parsed = True
+        check_line(temp_line, current_kt, current_line_number + 1)
+        if "ChronusQ Job Ended" in line:
+            job_complete = True
+        if job_complete_counter == 2:
+            list_of_key_tries.append(current_kt)
+            list_of_lines_list.append(file_lines.view(job_start, current_index + 1))
             current_kt = kt()
-            current_lines = []
-            parsed = False
-            found = False
-            start = 0
-            job_complete = False
-            job_complete_counter = 0
-            for line in f:
-                if job_complete:
-                    job_complete_counter += 1
-                temp_line = line
-                # Checks if file has passed user input section of Chronus .out file
-                if not found and "Input File" in line:
-                    found = True
-                    start = len(current_lines) + 2
-                # Uppercase lines for standardization in user input section
-                if not parsed and found and start <= len(current_lines):
-                    temp_line = temp_line.upper()
-                    # Checks if arrived at the end of user input section
-                    if "====" in line:
-                        parsed = True
-                check_line(temp_line, current_kt, current_lines)
-                if "ChronusQ Job Ended" in line:
-                    job_complete = True
-                if job_complete_counter == 2:
-                    list_of_key_tries.append(current_kt)
-                    list_of_lines_list.append(current_lines)
-                    current_kt = kt()
-                    current_lines = []
-            if len(current_lines) > 0:
-                list_of_key_tries.append(current_kt)
-                list_of_lines_list.append(current_lines)
-    except OSError:
-        raise OSError("The file with the given path cannot be opened. Please try again.")
-    else:
-        for current_line_list in list_of_lines_list:
-            if "ChronusQ Job Ended" not in current_line_list[-3]:
-                warnings.warn("This file was not terminated normally. Check if this is the intended .out file.")
+            job_start = current_index + 1
+    if job_start < len(file_lines):
+        list_of_key_tries.append(current_kt)
+        list_of_lines_list.append(file_lines.view(job_start, len(file_lines)))
+    for current_line_list in list_of_lines_list:
+        if "ChronusQ Job Ended" not in current_line_list[-3]:
+            warnings.warn("This file was not terminated normally. Check if this is the intended .out file.")
     return list_of_key_tries, list_of_lines_list
 
 
-def read(filename):
-    if filename.endswith('.log'):
-        list_of_key_tries, list_of_lines_list = read_gaussian(filename)
+def read(filename, words: frozenset = None):
+    """
+    Reads and indexes every job of a Gaussian .log or ChronusQ .out file, which may be compressed
+    (.gz, .bz2 or .xz, for example water.log.gz).
+    :param words: the words indexed in a Gaussian job (see parse_gaussian.get_words), required for .log files
+    :return: a list of KeywordIndex objects, a list of the lines of every job and the type of the file
+    """
+    base_name = strip_compression(filename)
+    if base_name.endswith('.log'):
+        if words is None:
+            raise ValueError("The words to index in a Gaussian job are required, see parse_gaussian.get_words.")
+        list_of_key_tries, list_of_lines_list = read_gaussian(filename, words)
         file_type = "Gaussian"
-    elif filename.endswith('.out'):
+    elif base_name.endswith('.out'):
         list_of_key_tries, list_of_lines_list = read_chronus(filename)
         file_type = "ChronusQ"
     return list_of_key_tries, list_of_lines_list, file_type
@@ -1,32 +1,36 @@
-class KeywordTrie:
-    """
-    A dictionary that uses a trie to store important keyword strings along with
-    the line-numbers that these strings and their prefixes appear in.
+from bisect import bisect_left
+from array import array
+import numpy as np
 
-    Attributes:
-        root: the root node of the dictionary.
+# Keys every parser module looks up with KeywordIndex.find, grouped by the section of a file the module parses.
+# Readers only index the lines holding a word of a registered key, so a parser must register every key it finds
+REGISTERED_KEYS = {}
+
+
+class KeywordIndex:
     """
-    class HashTrieNode:
-        """
-        An object that represents a single character in an important keyword.
+    A compact dictionary that stores important keyword strings along with the line-numbers that
+    these strings and their prefixes appear in.
 
-        Attributes:
-            pointers: a dictionary with a character as a key and another HashTrieNode as a value
-            line_number: a set containing all the line numbers (based on vim) that contains the current prefix
-                (all the characters from root node to current node)
-        """
-        def __init__(self):
-            """
-            Constructs a HashTrieNode object
-            """
-            self.pointers = {}
-            self.line_number = set()
+    Tokens are interned once and every (token, line number) occurrence is appended to two flat integer arrays.
+    On the first lookup these are compacted into a sorted token table with one sorted block of line numbers
+    per token, so a prefix query is a bisect into the token table followed by a slice of the line number array.
 
+    Attributes:
+        token_ids: a dictionary with an inserted token as a key and its insertion id as a value
+        occurrence_ids: the token id of every inserted occurrence
+        occurrence_lines: the line number (based on vim) of every inserted occurrence
+    """
     def __init__(self):
         """
-        Initializes the root node of a HashTrieMap dictionary
+        Initializes an empty KeywordIndex dictionary
         """
-        self.root = self.HashTrieNode()
+        self.token_ids = {}
+        self.occurrence_ids = array('q')
+        self.occurrence_lines = array('q')
+        self._sorted_tokens = None
+        self._offsets = None
+        self._lines = None
 
     def find(self, key: str):
         """
@@ -39,22 +43,22 @@ class KeywordTrie:
 
         :return: a list of line numbers of the lines with all the desired keywords in the given key string
         """
-        key = key
-        temp_string = key.split()
-        intersection_set = None
+        intersection = None
 
-        for current_word in temp_string:
-            current_set = self.find_helper(current_word)
+        for current_word in key.split():
+            current_lines = self.find_lines(current_word)
 
-            if not current_set:
+            if current_lines is None:
                 return None
 
-            if not intersection_set:
-                intersection_set = current_set
+            if intersection is None:
+                intersection = current_lines
             else:
-                intersection_set = intersection_set & current_set
+                intersection = np.intersect1d(intersection, current_lines, assume_unique=True)
 
-        return sorted(intersection_set)
+        if intersection is None:
+            return None
+        return intersection.tolist()
 
     def find_helper(self, keyword: str):
         """
@@ -62,25 +66,40 @@ class KeywordTrie:
 
         :param keyword: the keyword desired in a line
 
-        :return: a list of line numbers of lines with the desired keyword
+        :return: a set of line numbers of lines with the desired keyword
         """
-        if keyword is None:
-            raise ValueError("Cannot find null value.")
+        current_lines = self.find_lines(keyword)
+        if current_lines is None:
+            return None
+        return set(current_lines.tolist())
+
+    def find_lines(self, keyword: str):
+        """
+        Returns a sorted numpy array of the line numbers of the lines that contain a token starting with the given keyword.
 
-        current_node = self.root
+        :param keyword: the keyword desired in a line
 
-        if len(keyword) != 0:
-            for current_char in keyword:
-                current_node = current_node.pointers.get(current_char)
+        :return: a sorted numpy array of line numbers, None if no token starts with the keyword
+        """
+        if keyword is None:
+            raise ValueError("Cannot find null value.")
+        if len(keyword) == 0:
+            return None
 
-                if current_node is None:
-                    return None
+        self.compact()
+        start = bisect_left(self._sorted_tokens, keyword)
+        end = bisect_left(self._sorted_tokens, keyword + chr(0x10FFFF), lo=start)
+        if start == end:
+            return None
 
-        return current_node.line_number
+        current_lines = self._lines[self._offsets[start]: self._offsets[end]]
+        if end - start > 1:
+            current_lines = np.unique(current_lines)
+        return current_lines
 
     def insert(self, key: str, value: int):
         """
-        Inserts a keyword into the HashTrieMap dictionary.
+        Inserts a keyword into the KeywordIndex dictionary.
 
         :param key: the keyword being added
 
@@ -91,11 +110,62 @@ class KeywordTrie:
         if key is None or value is None:
             raise ValueError("Cannot insert null values.")
 
-        current_node = self.root
+        token_id = self.token_ids.get(key)
+        if token_id is None:
+            token_id = len(self.token_ids)
+            self.token_ids[key] = token_id
+        self.occurrence_ids.append(token_id)
+        self.occurrence_lines.append(value)
+        self._sorted_tokens = None
+
+    def compact(self):
+        """
+        Sorts the inserted tokens and groups their line numbers into one sorted, duplicate-free block per token.
+        Called automatically by the first lookup after an insert.
+
+        :return:
+        """
+        if self._sorted_tokens is not None:
+            return
+        sorted_tokens = sorted(self.token_ids)
+        rank = np.empty(len(sorted_tokens), dtype=np.int64)
+        rank[[self.token_ids[token] for token in sorted_tokens]] = np.arange(len(sorted_tokens))
+
+        occurrence_ranks = rank[np.frombuffer(self.occurrence_ids, dtype=np.int64)]
+        occurrence_lines = np.frombuffer(self.occurrence_lines, dtype=np.int64)
+        order = np.lexsort((occurrence_lines, occurrence_ranks))
+        occurrence_ranks = occurrence_ranks[order]
+        occurrence_lines = occurrence_lines[order]
+
+        # A token repeated on the same line is only kept once
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = (occurrence_ranks[1:] != occurrence_ranks[:-1]) | (occurrence_lines[1:] != occurrence_lines[:-1])
+        occurrence_ranks = occurrence_ranks[keep]
+
+        self._lines = occurrence_lines[keep]
+        self._offsets = np.searchsorted(occurrence_ranks, np.arange(len(sorted_tokens) + 1))
+        self._sorted_tokens = sorted_tokens
+
+
+def register_keys(section: str, keys: list):
+    """
+    Registers the keys that the parser of the given section looks up with KeywordIndex.find.
+    :param section: the name of the section, for example "td"
+    :param keys: the key strings passed to KeywordIndex.find
+    :return:
+    """
+    REGISTERED_KEYS.setdefault(section, set()).update(keys)
+
+
+def get_registered_words(sections=None) -> frozenset:
+    """
+    Returns every word of the keys registered for the given sections.
+    :param sections: an iterable of section names, None for every section
+    :return: a frozenset of the words that need to be indexed
+    """
+    if sections is None:
+        sections = REGISTERED_KEYS
+    return frozenset(word for section in sections for key in REGISTERED_KEYS.get(section, ()) for word in key.split())
 
-        for current_char in key:
-            if current_char not in current_node.pointers.keys():
-                current_node.pointers.update({current_char: self.HashTrieNode()})
 
-            current_node = current_node.pointers.get(current_char)
-            current_node.line_number.add(value)
+KeywordTrie = KeywordIndex
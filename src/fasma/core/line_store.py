@@ -0,0 +1,190 @@
+from operator import index as as_index
+import numpy as np
+import mmap
+
+# Size of the pieces the newline scan works on so multi-GB files never need a file-sized temporary array
+SCAN_CHUNK_SIZE = 1 << 26
+
+
+class LineStore:
+    """
+    A read-only list of the lines of a file, backed by a byte buffer (usually a memory-mapped file) and a numpy
+    array of line-start offsets. Lines are only decoded into Python strings when they are accessed.
+
+    Lines that are rewritten after reading (for example by parse_functions.replace_d) are kept in a small
+    dictionary of replaced lines that shadows the buffer.
+
+    Attributes:
+        buffer: the bytes-like object holding the text of the file
+        offsets: a numpy array with the byte offset of the start of every line followed by the end of the last line
+        replaced_lines: a dictionary with a line index as a key and the line that replaces it as a value
+        encoding: the encoding used to decode the lines
+    """
+    def __init__(self, buffer, offsets: np.ndarray, replaced_lines: dict = None, encoding: str = "utf-8"):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.replaced_lines = {} if replaced_lines is None else replaced_lines
+        self.encoding = encoding
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.get_line(current_index) for current_index in range(*item.indices(len(self)))]
+        return self.get_line(self.check_index(item))
+
+    def __setitem__(self, item, line: str):
+        self.replaced_lines[self.check_index(item)] = line
+
+    def __iter__(self):
+        for current_index in range(len(self)):
+            yield self.get_line(current_index)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["buffer"] = bytes(self.buffer[self.offsets[0]: self.offsets[-1]])
+        state["offsets"] = self.offsets - self.offsets[0]
+        return state
+
+    def check_index(self, item) -> int:
+        current_index = as_index(item)
+        if current_index < 0:
+            current_index += len(self)
+        if not 0 <= current_index < len(self):
+            raise IndexError("line index out of range")
+        return current_index
+
+    def get_line(self, current_index: int) -> str:
+        """
+        Decodes and returns a single line (including its newline character).
+        :param current_index: the index of the line in this LineStore (based on Python, starting at 0)
+        :return: the decoded line
+        """
+        line = self.replaced_lines.get(current_index)
+        if line is None:
+            line = self.get_bytes(current_index, current_index + 1).decode(self.encoding, errors="replace")
+            if line.endswith("\r\n"):
+                line = line[:-2] + "\n"
+        return line
+
+    def get_bytes(self, start: int, end: int) -> bytes:
+        """
+        Returns the raw bytes of a range of lines, ignoring any replaced lines.
+        :param start: the index of the first line (inclusive)
+        :param end: the index of the last line (non-inclusive)
+        :return: the raw bytes of the given lines
+        """
+        return self.buffer[self.offsets[start]: self.offsets[end]]
+
+    def find_lines_containing(self, pattern: bytes) -> np.ndarray:
+        """
+        Finds the lines whose raw bytes contain the given pattern, ignoring any replaced lines.
+        :param pattern: the byte string being searched for
+        :return: a sorted numpy array of the indices of the lines containing the pattern
+        """
+        line_indices = []
+        position = self.buffer.find(pattern, self.offsets[0], self.offsets[-1])
+        while position != -1:
+            current_index = int(np.searchsorted(self.offsets, position, side="right")) - 1
+            line_indices.append(current_index)
+            position = self.buffer.find(pattern, self.offsets[current_index + 1], self.offsets[-1])
+        return np.array(line_indices, dtype=np.int64)
+
+    def view(self, start: int, end: int):
+        """
+        Returns a LineStore over a range of lines sharing the same buffer, with line indices starting at 0.
+        :param start: the index of the first line (inclusive)
+        :param end: the index of the last line (non-inclusive)
+        :return: a LineStore of the given lines
+        """
+        replaced_lines = {current_index - start: line for current_index, line in self.replaced_lines.items()
+                          if start <= current_index < end}
+        return LineStore(self.buffer, self.offsets[start: end + 1], replaced_lines, self.encoding)
+
+
+def find_line_offsets(buffer, start: int = 0, end: int = None) -> np.ndarray:
+    """
+    Finds the byte offset of the start of every line in a range of a buffer.
+    :param buffer: a bytes-like object
+    :param start: the byte offset where the range starts, expected to be the start of a line
+    :param end: the byte offset where the range ends (non-inclusive), the end of the buffer by default
+    :return: a numpy array with the start of every line in the range followed by the end of the range
+    """
+    if end is None:
+        end = len(buffer)
+    line_ends = [np.array([start], dtype=np.int64)]
+    for chunk_start in range(start, end, SCAN_CHUNK_SIZE):
+        chunk = np.frombuffer(buffer, dtype=np.uint8, count=min(SCAN_CHUNK_SIZE, end - chunk_start), offset=chunk_start)
+        line_ends.append(np.flatnonzero(chunk == ord("\n")).astype(np.int64) + chunk_start + 1)
+    offsets = np.concatenate(line_ends)
+    if offsets[-1] != end:
+        offsets = np.append(offsets, end)
+    return offsets
+
+
+def get_buffer(file_lines, start: int, end: int):
+    """
+    Returns the raw text of a range of lines for parsers that search many lines at once. The buffer of a LineStore is
+    used as is unless a line of the range was replaced, otherwise the lines are encoded and joined.
+    :param file_lines: a LineStore or a list of lines
+    :param start: the index of the first line (inclusive)
+    :param end: the index of the last line (non-inclusive)
+    :return: a bytes-like object and a numpy array with the offset of every line of the range in it followed by the end
+        of the last line
+    """
+    if isinstance(file_lines, LineStore) and not any(start <= current_index < end for current_index in file_lines.replaced_lines):
+        return file_lines.buffer, file_lines.offsets[start: end + 1]
+    # Replaced lines may be given without their newline character
+    lines = [line.encode() if line.endswith("\n") else line.encode() + b"\n" for line in file_lines[start: end]]
+    offsets = np.concatenate([[0], np.cumsum([len(line) for line in lines], dtype=np.int64)])
+    return b"".join(lines), offsets
+
+
+def read_stream(stream) -> LineStore:
+    """
+    Reads a binary stream (for example a decompressing file object) into a LineStore held in memory. The stream is
+    read in pieces and the line offsets of every piece are found as it arrives, so the text is only scanned once
+    and never held twice.
+    :param stream: a binary file-like object
+    :return: a LineStore backed by a bytearray of the whole stream
+    """
+    buffer = bytearray()
+    line_ends = [np.zeros(1, dtype=np.int64)]
+    while True:
+        chunk = stream.read(SCAN_CHUNK_SIZE)
+        if not chunk:
+            break
+        chunk_start = len(buffer)
+        buffer += chunk
+        line_ends.append(np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == ord("\n")).astype(np.int64) + chunk_start + 1)
+    offsets = np.concatenate(line_ends)
+    if offsets[-1] != len(buffer):
+        offsets = np.append(offsets, len(buffer))
+    return LineStore(buffer, offsets)
+
+
+def map_buffer(filename):
+    """
+    Memory-maps a whole file for reading.
+    :param filename: the path of the file
+    :return: the memory-mapped file, or an empty bytes object for an empty file
+    """
+    with open(filename, "rb") as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be memory-mapped
+            return b""
+
+
+def map_file(filename, start: int = 0, end: int = None) -> LineStore:
+    """
+    Memory-maps a text file and returns a LineStore over all of its lines, or the lines of a byte range of it.
+    :param filename: the path of the file
+    :param start: the byte offset where the range starts, expected to be the start of a line
+    :param end: the byte offset where the range ends (non-inclusive), the end of the file by default
+    :return: a LineStore backed by the memory-mapped file
+    """
+    buffer = map_buffer(filename)
+    return LineStore(buffer, find_line_offsets(buffer, start, end))
@@ -0,0 +1,144 @@
+from fasma.core.keyword_trie import KeywordIndex as kt
+from fasma.core import file_reader as fr
+from fasma.core import line_store as ls
+from fasma.core import precision
+from fasma.gaussian import parse_gaussian as pg
+import numpy as np
+import time
+
+
+class LogFollower:
+    """
+    Follows a Gaussian .log file that is still being written. Every update only reads the bytes appended since the
+    previous one: the new complete lines are added to the lines and keyword index of the running job, every job
+    that terminated normally in them is parsed into a Box once. The running job is parsed (see parse_gaussian.parse
+    with partial set) once its basic data is printed, after which only the excited states or CAS roots printed
+    since the previous update are parsed and appended to its spectra data.
+
+    Only the lines of the running job are kept, so the memory held does not grow with the finished jobs.
+
+    Attributes:
+        filename: the path of the followed .log file
+        sections: the sections parsed from every job (see parse_gaussian.SECTIONS), None for every section
+        sparse: if true, the delta diagonal matrices are scipy.sparse CSR matrices
+        dtype: the floating point type of the parsed matrices (see precision.get_dtype)
+        position: the byte offset of the end of the last complete line read
+        boxes: the Box of every job that terminated normally, in file order
+        file_lines: the lines of the running job read so far
+        key_trie: the KeywordIndex of the running job read so far
+        partial_box: the Box of the running job parsed so far, None if its basic data is not printed yet
+        n_partial_key: the number of lines holding every key of parse_gaussian.PARTIAL_KEYS when the spectra data
+            of partial_box was last parsed
+    """
+    def __init__(self, filename, sections=None, sparse: bool = False, dtype=None):
+        if fr.get_opener(filename) is not None or not filename.endswith(".log"):
+            raise ValueError("Only uncompressed Gaussian .log files can be followed.")
+        self.filename = filename
+        self.sections = pg.get_sections(sections)
+        self.sparse = sparse
+        self.dtype = precision.get_dtype(dtype)
+        self.words = pg.get_words(self.sections)
+        self.position = 0
+        self.boxes = []
+        self.start_job(ls.LineStore(b"", np.zeros(1, dtype=np.int64)))
+
+    def start_job(self, file_lines):
+        self.file_lines = file_lines
+        self.key_trie = kt()
+        self.partial_box = None
+        self.n_parsed_occurrence = 0
+        self.n_partial_key = None
+
+    def update(self) -> bool:
+        """
+        Reads and parses the complete lines appended to the file since the last update.
+        :raise OSError: the file cannot be opened or is shorter than the part already read
+        :return: true if new lines were read, false otherwise
+        """
+        try:
+            buffer = ls.map_buffer(self.filename)
+        except OSError:
+            raise OSError("The file with the given path cannot be opened. Please try again.")
+        if len(buffer) < self.position:
+            raise OSError("The followed file was truncated, it has to be followed again from the start.")
+        # A line is only read once its newline is written
+        end = buffer.rfind(b"\n", self.position) + 1
+        if end <= self.position:
+            return False
+        new_offsets = ls.find_line_offsets(buffer, self.position, end)
+        start = len(self.file_lines)
+        self.file_lines.buffer = buffer
+        self.file_lines.offsets = np.concatenate([self.file_lines.offsets[:-1], new_offsets])
+        self.position = end
+
+        termination_indices = self.file_lines.view(start, len(self.file_lines)).find_lines_containing(b"Normal termination")
+        # The lines of every finished job are split off, so the indices are shifted by the lines already split off
+        n_split_line = 0
+        for termination_index in termination_indices:
+            job_end = start + int(termination_index) + 1 - n_split_line
+            fr.index_gaussian_job(self.file_lines, self.words, self.key_trie, max(start - n_split_line, 0), job_end)
+            self.boxes.append(pg.parse(self.key_trie, self.file_lines.view(0, job_end), sections=self.sections,
+                                       sparse=self.sparse, dtype=self.dtype))
+            self.start_job(self.file_lines.view(job_end, len(self.file_lines)))
+            n_split_line += job_end
+        start = max(start - n_split_line, 0)
+        fr.index_gaussian_job(self.file_lines, self.words, self.key_trie, start)
+        self.update_partial_box()
+        return True
+
+    def update_partial_box(self):
+        """
+        Parses the running job if a keyword was found in it since it was last parsed and its basic data is not
+        parsed yet. Once it is, only the excited states or CAS roots printed since they were last parsed are parsed,
+        when a key they depend on (see parse_gaussian.PARTIAL_KEYS) was found again.
+        """
+        if self.partial_box is None:
+            n_occurrence = len(self.key_trie.occurrence_ids)
+            if n_occurrence == self.n_parsed_occurrence:
+                return
+            self.n_parsed_occurrence = n_occurrence
+            try:
+                self.partial_box = pg.parse(self.key_trie, self.file_lines, sections=self.sections, sparse=self.sparse,
+                                            partial=True, dtype=self.dtype)
+            except pg.PARTIAL_ERRORS:
+                # The basic data of the running job is not printed yet
+                return
+            self.n_partial_key = self.count_partial_keys()
+            return
+        n_partial_key = self.count_partial_keys()
+        if n_partial_key == self.n_partial_key:
+            return
+        spectra_data = pg.parse_spectra(self.partial_box.basic_data, self.key_trie, self.file_lines, self.sections,
+                                        self.sparse, partial=True, dtype=self.dtype,
+                                        previous=self.partial_box.spectra_data)
+        # A root whose lines are only partly printed yet is parsed again on the next update
+        if spectra_data is not None:
+            self.partial_box.spectra_data = spectra_data
+            self.n_partial_key = n_partial_key
+
+    def count_partial_keys(self) -> tuple:
+        return tuple(len(self.key_trie.find(key) or []) for key in pg.PARTIAL_KEYS)
+
+    def get_boxes(self) -> list:
+        """
+        Returns the Box of every finished job followed by the partial Box of the running job, if it has one.
+        """
+        if self.partial_box is None:
+            return list(self.boxes)
+        return self.boxes + [self.partial_box]
+
+    def follow(self, interval: float = 10.0, timeout: float = None):
+        """
+        Polls the file for new lines and yields the Box objects parsed so far (see get_boxes) every time some are read.
+        :param interval: the number of seconds between two polls
+        :param timeout: the number of seconds without new lines after which the generator returns, never by default
+        :return: a generator of lists of Box objects
+        """
+        last_change = time.monotonic()
+        while True:
+            if self.update():
+                last_change = time.monotonic()
+                yield self.get_boxes()
+            elif timeout is not None and time.monotonic() - last_change >= timeout:
+                return
+            time.sleep(interval)
@@ -0,0 +1,158 @@
+from importlib import metadata
+import hashlib
+import pickle
+import mmap
+import os
+
+# Default upper bound on the total size of the cached parse results before the least recently used are evicted
+DEFAULT_MAX_SIZE = 5 * 1024 ** 3
+HASH_CHUNK_SIZE = 1 << 24
+
+
+def get_version() -> str:
+    try:
+        return metadata.version("fasma")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def get_default_cache_dir() -> str:
+    cache_dir = os.environ.get("FASMA_CACHE_DIR")
+    if cache_dir is None:
+        cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+        cache_dir = os.path.join(cache_home, "fasma")
+    return cache_dir
+
+
+def hash_file(filename) -> str:
+    """
+    Returns the BLAKE2b digest of the content of a file.
+    :param filename: the path of the file
+    :return: the hexadecimal digest of the file content
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(filename, "rb") as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be memory-mapped
+            return digest.hexdigest()
+        with buffer:
+            for start in range(0, len(buffer), HASH_CHUNK_SIZE):
+                digest.update(buffer[start: start + HASH_CHUNK_SIZE])
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """
+    An on-disk cache of parsed Box objects keyed by the content hash of the parsed file, the fasma version
+    and the parse options. Entries are pickled and the least recently used are evicted once the total size
+    of the cache goes over max_size.
+
+    Hashing a large file is the only expensive part of a cache hit, so the content hash of a path is also
+    remembered together with the size and modification time the path had when it was hashed.
+
+    Attributes:
+        cache_dir: the directory holding the cached entries
+        max_size: the maximum total size of the cached entries in bytes
+    """
+    def __init__(self, cache_dir: str = None, max_size: int = DEFAULT_MAX_SIZE):
+        if cache_dir is None:
+            cache_dir = get_default_cache_dir()
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.entry_dir = os.path.join(cache_dir, "entries")
+        self.stat_dir = os.path.join(cache_dir, "stat")
+        os.makedirs(self.entry_dir, exist_ok=True)
+        os.makedirs(self.stat_dir, exist_ok=True)
+
+    def get_content_hash(self, filename) -> str:
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        stat_key = f"{stat.st_size} {stat.st_mtime_ns}"
+        stat_path = os.path.join(self.stat_dir, hashlib.blake2b(path.encode(), digest_size=20).hexdigest())
+        try:
+            with open(stat_path, "r") as f:
+                cached_stat_key, content_hash = f.read().rsplit(" ", 1)
+            if cached_stat_key == stat_key:
+                return content_hash
+        except (OSError, ValueError):
+            pass
+        content_hash = hash_file(path)
+        self.write(stat_path, (stat_key + " " + content_hash).encode())
+        return content_hash
+
+    def get_key(self, filename, **options) -> str:
+        """
+        Returns the cache key of a file parsed with the given options.
+        :param filename: the path of the file
+        :param options: the parse options that change the parsed result
+        :return: the cache key
+        """
+        key = repr((self.get_content_hash(filename), get_version(), sorted(options.items())))
+        return hashlib.blake2b(key.encode(), digest_size=20).hexdigest()
+
+    def load(self, key: str):
+        """
+        Returns the cached result for a key, or None on a cache miss.
+        """
+        entry_path = os.path.join(self.entry_dir, key + ".pkl")
+        try:
+            with open(entry_path, "rb") as handle:
+                item = pickle.load(handle)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        # Mark the entry as recently used
+        os.utime(entry_path)
+        return item
+
+    def store(self, key: str, item):
+        """
+        Caches a result under a key and evicts the least recently used entries if the cache is over its size limit.
+        """
+        self.write(os.path.join(self.entry_dir, key + ".pkl"), pickle.dumps(item, pickle.HIGHEST_PROTOCOL))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.entry_dir):
+            if entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+
+    def clear(self):
+        for directory in [self.entry_dir, self.stat_dir]:
+            for entry in os.scandir(directory):
+                os.remove(entry.path)
+
+    @staticmethod
+    def write(path: str, data: bytes):
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as output:
+            output.write(data)
+        os.replace(temp_path, path)
+
+
+def get_cache(cache):
+    """
+    Converts the cache argument of file_compressor.parse into a ParseCache.
+    :param cache: None or False for no cache, True for the default cache, a cache directory, or a ParseCache
+    :return: a ParseCache, None if caching is disabled
+    """
+    if cache is None or cache is False:
+        return None
+    if cache is True:
+        return ParseCache()
+    if isinstance(cache, ParseCache):
+        return cache
+    return ParseCache(os.fspath(cache))
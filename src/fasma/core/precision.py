@@ -0,0 +1,48 @@
+import numpy as np
+
+# The floating point types the parsed matrices can be stored in. Gaussian prints them with 5 to 6 significant
+# digits, which single precision holds at half the memory of double precision
+REAL_DTYPES = (np.dtype(np.float32), np.dtype(np.float64))
+default_dtype = np.dtype(np.float64)
+
+
+def set_default_dtype(dtype):
+    """
+    Sets the floating point type of the matrices parsed without a dtype of their own (see file_compressor.parse).
+    :param dtype: np.float32 or np.float64
+    """
+    global default_dtype
+    default_dtype = get_dtype(dtype)
+
+
+def get_dtype(dtype=None) -> np.dtype:
+    """
+    Checks the dtype argument of the parsers.
+    :param dtype: np.float32 or np.float64 (or their names), None for the default set with set_default_dtype
+    :return: the real numpy dtype of the parsed matrices
+    """
+    if dtype is None:
+        return default_dtype
+    try:
+        dtype = np.dtype(dtype)
+    except TypeError:
+        dtype = None
+    # Comparing a dtype with None compares it with float64, so unknown types are checked first
+    if dtype is None or dtype not in REAL_DTYPES:
+        raise ValueError("Unsupported dtype. Valid dtypes are: float32, float64")
+    return dtype
+
+
+def get_complex_dtype(dtype) -> np.dtype:
+    """
+    Returns the complex type matching a real type, complex64 for float32 and complex128 for float64.
+    """
+    return np.result_type(dtype, np.complex64)
+
+
+def get_accumulator_dtype(dtype) -> np.dtype:
+    """
+    Returns the type sums over matrices of the given type are accumulated in, so long rows of single precision
+    values do not lose digits to rounding.
+    """
+    return np.result_type(dtype, np.float64)
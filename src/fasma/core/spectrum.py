@@ -14,23 +14,29 @@ class Spectrum:
 
 @dataclass
 class RTimeSpectrum(Spectrum):
-    def gen_spect(self, damp: float = 0.0001, wlim: tuple = (0, 4/27), res: float = 400000, every_step: int = 100, meth: str = "pade"):
+    freq: np.ndarray = field(init=False)
+    spect: np.ndarray = field(init=False)
+
+    def gen_spect(self, damp: float = 0.0001, wlim: tuple = (0, 4/27), res: float = 400000, every_step: int = 1, meth: str = "pade"):
+        """
+        :param every_step: only every every_step-th of the time steps held is transformed. The steps of a
+            RealTimeData are already thinned out by its own every_step, so this stride comes on top of it
+        """
         meth = meth.lower()
+        if meth == "pade":
+            transformer = functional.pade_tx
+        elif meth == "gaussian":
+            transformer = functional.fourier_tx
+        else:
+            raise ValueError('Unsupported distribution "{0}" specified'.format(meth))
         chosen_times = self.x[::every_step]
-        chosen_dipoles = self.x[::every_step]
+        chosen_dipoles = self.y[::every_step]
         step_size = chosen_times[1] - chosen_times[0]
+        damping = np.exp(-damp * chosen_times)
         spects = []
         for x in range(3):
-            s = chosen_dipoles[:, x]
-            s -= s[0]
-            s *= np.exp[-damp * chosen_times]
-            if meth == "pade":
-                transformer = functional.pade_tx
-            elif meth == "gaussian":
-                transformer = functional.fourier_tx
-            else:
-                raise ValueError('Unsupported distribution "{0}" specified'.format(meth))
-            self.freq, f = transformer(s, step_size, wlim, res)
+            s = (chosen_dipoles[:, x] - chosen_dipoles[0, x]) * damping
+            self.freq, f = transformer(s, step_size, wlim=wlim, res=res)
             spects.append(f)
         self.spect = sum([f.imag for f in spects]) / 3
         self.spect *= -self.freq
@@ -1,6 +1,9 @@
 from fasma.core import boxes as bx
+from fasma.core import keyword_trie
 from fasma.gaussian import parse_functions
 
+keyword_trie.register_keys("basic", ["Symbolic Z-matrix", "NAtoms", "SCF Done", "alpha", "#", "1/", "3/"])
+
 
 def get_basic(file_keyword_trie, file_lines):
     """
@@ -1,19 +1,33 @@
 from fasma.core import boxes as bx
 from fasma.core import messages as msg
+from fasma.core import keyword_trie
 from fasma.gaussian import parse_excitation
 from fasma.gaussian import parse_functions
 from fasma.gaussian import parse_matrices
+from scipy import sparse as sps
 import numpy as np
 
+keyword_trie.register_keys("cas", ["NDet=", "diagonals of 1PDM for State: ", "Energy (Hartree)",
+                                   "Oscillator Strength For States", "orbitals", "MCSCF", "#", "9/"])
 
-def check_cas(basic, file_keyword_trie, file_lines) -> bool:
+
+def check_cas(basic, file_keyword_trie, file_lines, sparse: bool = False, partial: bool = False,
+              dtype=np.float64, previous=None) -> bool:
     """
     Checks if .log contains a CAS calculation.
     If yes, initializes and returns a CASData object.
     :param file_keyword_trie: the KeyWordTrie object of the current file
     :param file_lines: all the lines of this current file
     :param basic: the BasicData object for this current file
-    :return: CASData object if this .log file contains a CAS calculation, none otherwise
+    :param sparse: if true, the delta diagonal matrix is a scipy.sparse CSR matrix
+    :param partial: if true, the job is still running and only the roots printed so far are parsed, with NaN
+        oscillator strengths for the excitations whose strength is not printed yet
+    :param dtype: the floating point type of the delta diagonal matrix (see precision.get_dtype)
+    :param previous: the CASData of the same running job parsed before, whose excitations are kept up to the first
+        one without an oscillator strength. The excitations of a job with several ground states are interleaved, so
+        they are all parsed again
+    :return: CASData object if this .log file contains a CAS calculation, none otherwise (or if no excited root
+        was printed yet when partial is true)
     """
     try:
         temp_list = parse_functions.find_iop(file_keyword_trie, file_lines, "9", ["6", "7", "13", "17", "19"])
@@ -38,6 +52,12 @@ def check_cas(basic, file_keyword_trie, file_lines) -> bool:
                 n_root = front + back
             final_state_full = n_root
 
+        if partial:
+            n_root = min(n_root, len(file_keyword_trie.find("diagonals of 1PDM for State: ") or []),
+                         len(file_keyword_trie.find("Energy (Hartree)") or []))
+            if n_root <= n_ground_state:
+                return None
+
         final_state = n_root
         n_excitation_full = int((final_state_full * n_ground_state) - (n_ground_state * (n_ground_state + 1) / 2))
 
@@ -53,31 +73,53 @@ def check_cas(basic, file_keyword_trie, file_lines) -> bool:
                                      n_active_space_mo=n_active_space_mo,
                                      n_active_space_electron=n_active_space_electron,
                                      active_space_start=active_space_start, methodology_data=cas_data)
-        excitation_matrix, delta_diagonal_matrix = parse_excitation.get_excitation_matrix(*get_excitations_cas(file_keyword_trie, file_lines, excitation_data))
+        first_excitation = 0
+        if previous is not None and n_ground_state == 1:
+            missing_oscillations = np.flatnonzero(np.isnan(previous.excitation_matrix[:, 3]))
+            first_excitation = int(missing_oscillations[0]) if len(missing_oscillations) > 0 else previous.n_excitation
+        excitation_matrix, delta_diagonal_matrix = parse_excitation.get_excitation_matrix(*get_excitations_cas(file_keyword_trie, file_lines, excitation_data, partial, first_excitation))
+        delta_diagonal_matrix = delta_diagonal_matrix.astype(dtype, copy=False)
+        if sparse:
+            delta_diagonal_matrix = sps.csr_matrix(delta_diagonal_matrix)
+        if first_excitation > 0:
+            excitation_matrix = np.vstack((previous.excitation_matrix[:first_excitation], excitation_matrix))
+            delta_diagonal_matrix = parse_excitation.stack_rows(previous.delta_diagonal_matrix[:first_excitation],
+                                                                delta_diagonal_matrix)
         excitation_data.add_excitation_matrix(excitation_matrix)
         excitation_data.add_delta_diagonal_matrix(delta_diagonal_matrix)
         return excitation_data
 
 
-def get_excitations_cas(file_keyword_trie, file_lines, excitation_data):
+def get_excitations_cas(file_keyword_trie, file_lines, excitation_data, partial=False, first_excitation=0):
+    """
+    :param first_excitation: the index of the first excitation parsed (based on Python, starting at 0), the
+        excitations before it are left out. Only for a single ground state
+    """
     ground_state_list, excited_state_list, delta_energy_list, oscillations, delta_diagonal_list = parse_excitation.initialize_excitation_fields(
-        excitation_data.n_excitation)
-    num_of_results = 0
-    diag_lines, energy_lines, osc_lines = verify_cas_completeness(file_keyword_trie, excitation_data.methodology_data.n_root,
-                                                                  excitation_data.methodology_data.n_excitation_full)
+        excitation_data.n_excitation - first_excitation)
+    num_of_results = first_excitation
+    if partial:
+        diag_lines = file_keyword_trie.find("diagonals of 1PDM for State: ")
+        energy_lines = file_keyword_trie.find("Energy (Hartree)")
+        osc_lines = file_keyword_trie.find("Oscillator Strength For States") or []
+    else:
+        diag_lines, energy_lines, osc_lines = verify_cas_completeness(file_keyword_trie, excitation_data.methodology_data.n_root,
+                                                                      excitation_data.methodology_data.n_excitation_full)
     for x in range(excitation_data.n_ground_state):
         current_degenerate_state = x + 1
         current_degenerate_diag = dm_get_diag(file_lines, diag_lines[x], excitation_data.n_active_space_mo)
         current_degenerate_energy = dm_get_hartree(file_lines, energy_lines[x])
-        for y in range(excitation_data.final_state - 1 - x):
+        for y in range(first_excitation, excitation_data.final_state - 1 - x):
             current_excited_state = x + y + 2
-            ground_state_list[num_of_results] = current_degenerate_state
-            excited_state_list[num_of_results] = current_excited_state
-            delta_diagonal_list[num_of_results], delta_energy_list[num_of_results], oscillations[
-                num_of_results] = cas_get_excited_state(file_lines, current_degenerate_diag, current_degenerate_energy,
+            current_row = num_of_results - first_excitation
+            ground_state_list[current_row] = current_degenerate_state
+            excited_state_list[current_row] = current_excited_state
+            delta_diagonal_list[current_row], delta_energy_list[current_row], oscillations[
+                current_row] = cas_get_excited_state(file_lines, current_degenerate_diag, current_degenerate_energy,
                                                         diag_lines[current_excited_state - 1],
                                                         energy_lines[current_excited_state - 1],
-                                                        osc_lines[num_of_results], excitation_data.n_active_space_mo)
+                                                        osc_lines[num_of_results] if num_of_results < len(osc_lines) else None,
+                                                        excitation_data.n_active_space_mo)
             num_of_results += 1
     return ground_state_list, excited_state_list, delta_energy_list, oscillations, delta_diagonal_list
 
@@ -101,7 +143,8 @@ def verify_cas_completeness(file_keyword_trie, n_root, n_excitation):
 def cas_get_excited_state(file_lines, ground_diag, ground_energy, diag_line_num, energy_line_num, osc_line_num, n_active_space_mo):
     delta_diagonal = dm_get_diag(file_lines, diag_line_num, n_active_space_mo) - ground_diag
     energy_value = dm_get_hartree(file_lines, energy_line_num) - ground_energy
-    osc_value = float(file_lines[osc_line_num - 1].split()[8])
+    # The oscillator strengths are printed after every root, so a running job may not have them yet
+    osc_value = np.nan if osc_line_num is None else float(file_lines[osc_line_num - 1].split()[8])
 
     return delta_diagonal, energy_value, osc_value
 
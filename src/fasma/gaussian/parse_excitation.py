@@ -1,3 +1,4 @@
+from scipy import sparse as sps
 import numpy as np
 
 
@@ -31,3 +32,12 @@ def get_excitation_matrix(ground_state_list, excited_state_list, delta_energy_li
     return excitation_matrix, delta_diagonal_matrix
 
 
+
+
+def stack_rows(matrix, new_matrix):
+    """
+    Appends the rows of new_matrix to those of matrix, keeping scipy.sparse matrices as CSR matrices.
+    """
+    if sps.issparse(new_matrix):
+        return sps.vstack((matrix, new_matrix), format="csr")
+    return np.vstack((matrix, new_matrix))
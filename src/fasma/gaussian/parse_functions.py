@@ -7,7 +7,8 @@ def overlay_search(file_keyword_trie, file_lines, overlay_string: str) -> int:
     Find and return the line number of given overlay in the Gaussian Link section of the .log file.
     :param file_keyword_trie: the KeyWordTrie object of the current file
     :param file_lines: all the lines of this current file
-    :param overlay_string: the desired overlay with a "/"  (overlay string for overlay 9 would be "9/")
+    :param overlay_string: the desired overlay with a "/"  (overlay string for overlay 9 would be "9/"), which the
+        calling parser registers along with "#" (see keyword_trie.register_keys)
     :raise ValueError: the given overlay string cannot be found in the current .log file.
     :return: the line number of given overlay in the Gaussian Link section of the .log file.
     """
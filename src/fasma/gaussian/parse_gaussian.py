@@ -1,16 +1,100 @@
 from fasma.core import boxes as bx
+from fasma.core import keyword_trie
+from fasma.core import precision
 from fasma.gaussian import parse_basic
 from fasma.gaussian import parse_td
 from fasma.gaussian import parse_cas
 from fasma.gaussian import parse_pop
+import numpy as np
 
+# The sections of a Gaussian job that can be parsed separately. The basic data is always parsed since every
+# other section depends on it, and "pop" stands for every pop section
+POP_SECTIONS = frozenset(["pop.overlap", "pop.density", "pop.mo"])
+SECTIONS = frozenset(["basic", "td", "cas"]) | POP_SECTIONS
+# The errors raised by the parsers of a section that is only partly printed in a job that is still running
+PARTIAL_ERRORS = (ValueError, IndexError, TypeError)
+# The keys of the excited states and CAS roots, the only parts of a running job parsed again as it grows
+PARTIAL_KEYS = ["Excited State", "diagonals of 1PDM for State: ", "Energy (Hartree)", "Oscillator Strength For States"]
 
-def parse(file_keyword_trie, file_lines):
+
+def get_sections(sections):
+    """
+    Checks and expands the sections argument of file_compressor.parse.
+    :param sections: an iterable of section names (see SECTIONS), None for every section
+    :return: a frozenset of section names, None for every section
+    """
+    if sections is None:
+        return None
+    if isinstance(sections, str):
+        sections = [sections]
+    sections = set(sections)
+    if "pop" in sections:
+        sections.remove("pop")
+        sections |= POP_SECTIONS
+    unknown_sections = sections - SECTIONS
+    if unknown_sections:
+        raise ValueError("Unknown sections " + ", ".join(sorted(unknown_sections)) + ". Valid sections are: "
+                         + ", ".join(sorted(SECTIONS | {"pop"})))
+    return frozenset(sections | {"basic"})
+
+
+def get_words(sections=None) -> frozenset:
+    """
+    Returns the words of the keys that the parsers of the given sections of a Gaussian job look up, the words that
+    file_reader indexes.
+    :param sections: an iterable of section names (see SECTIONS), None for every section
+    """
+    return keyword_trie.get_registered_words(get_sections(sections))
+
+
+def parse(file_keyword_trie, file_lines, lazy: bool = False, sections=None, sparse: bool = False,
+          partial: bool = False, dtype=None):
+    """
+    Parses a single Gaussian job into a Box.
+    :param partial: if true, the job is still running (see log_follower.LogFollower). The excited states and CAS
+        roots printed so far are parsed, the population matrices are parsed lazily and the sections that cannot be
+        parsed yet are left as None. The basic data is required either way
+    :param dtype: the floating point type of the matrices (see precision.get_dtype)
+    """
+    sections = get_sections(sections)
+    dtype = precision.get_dtype(dtype)
     basic = parse_basic.get_basic(file_keyword_trie, file_lines)
-    spectra = parse_td.check_td(basic, file_keyword_trie, file_lines)
-    if spectra is None:
-        spectra = parse_cas.check_cas(basic, file_keyword_trie, file_lines)
-    pop = parse_pop.check_pop(basic, file_keyword_trie, file_lines, False)
+    spectra = parse_spectra(basic, file_keyword_trie, file_lines, sections, sparse, partial, dtype)
+    pop = None
+    if sections is None or sections & POP_SECTIONS:
+        pop = parse_section(partial, parse_pop.check_pop, basic, file_keyword_trie, file_lines, False,
+                            lazy=lazy or partial, sections=sections, dtype=dtype)
     box = bx.Box(basic_data=basic, spectra_data=spectra, pop_data=pop)
     return box
 
+
+def parse_spectra(basic, file_keyword_trie, file_lines, sections=None, sparse: bool = False, partial: bool = False,
+                  dtype=np.float64, previous=None):
+    """
+    Parses the excited states of a TD job or the roots of a CAS job.
+    :param sections: a frozenset of section names as returned by get_sections, None for every section
+    :param previous: the spectra data of the same running job parsed before (partial is then true), only the
+        excited states or roots printed since are parsed (see parse_td.check_td and parse_cas.check_cas)
+    :return: a TDData or CASData object, None if the job has neither section
+    """
+    spectra = None
+    if sections is None or "td" in sections:
+        spectra = parse_section(partial, parse_td.check_td, basic, file_keyword_trie, file_lines, sparse, partial=partial,
+                                dtype=dtype, previous=previous if isinstance(previous, bx.TDData) else None)
+    if spectra is None and (sections is None or "cas" in sections):
+        spectra = parse_section(partial, parse_cas.check_cas, basic, file_keyword_trie, file_lines, sparse, partial=partial,
+                                dtype=dtype, previous=previous if isinstance(previous, bx.CASData) else None)
+    return spectra
+
+
+def parse_section(running: bool, parser, *args, **kwargs):
+    """
+    Calls the parser of a section, returning None instead of raising when the section is only partly printed in a
+    job that is still running.
+    """
+    if not running:
+        return parser(*args, **kwargs)
+    try:
+        return parser(*args, **kwargs)
+    except PARTIAL_ERRORS:
+        return None
@@ -1,25 +1,36 @@
+from fasma.core import line_store as ls
+from fasma.core import precision
+from scipy import sparse as sps
 import numpy as np
 import math as m
 
+SPACE, STAR = (ord(character) for character in " *")
+# Number of lines converted at a time by parse_fixed_width_block
+GRID_CHUNK_ROWS = 8192
 
-def parse_mo_coefficient_matrix(basic, file_lines, start: int, last_string="S", space_skip=6, n_col=5, block_skip=3):
+
+def parse_mo_coefficient_matrix(basic, file_lines, start: int, last_string="S", space_skip=6, n_col=5, block_skip=3,
+                                dtype=np.float64):
     n_row_block = basic.n_mo
     if basic.scf_type == "GHF":
         n_row_block *= 2
         block_skip = 2
-    matrix = np.zeros((n_row_block, basic.n_mo))
+    matrix = np.zeros((n_row_block, basic.n_mo), dtype=dtype)
     cycles = m.ceil(basic.n_mo / n_col)
     n_col_block = n_col
     n_last_block_col = basic.n_mo % n_col
     skip_amount = file_lines[start - 1].rfind(last_string) + space_skip
 
+    block_starts, block_cols = [], []
     for current_block in range(cycles):  # Number of separated matrix blocks
         if current_block == cycles - 1 and n_last_block_col != 0:
             n_col_block = n_last_block_col
-        end = start + n_row_block
-        current_block_matrix = parse_matrix_block(file_lines, start, n_row_block, n_col_block, skip_amount)
-        matrix[:, (n_col * current_block): (n_col * current_block) + n_col_block] = current_block_matrix
-        start = end + block_skip
+        block_starts.append(start)
+        block_cols.append(n_col_block)
+        start = start + n_row_block + block_skip
+    block_matrices = parse_matrix_blocks(file_lines, block_starts, [n_row_block] * cycles, block_cols, skip_amount)
+    for current_block, current_block_matrix in enumerate(block_matrices):
+        matrix[:, (n_col * current_block): (n_col * current_block) + block_cols[current_block]] = current_block_matrix
     return matrix
 
 
@@ -42,24 +53,180 @@ def parse_matrix_line(current_line, skip_amount) -> np.array:
     else:
         line = line.replace("-", " -").split()
     try:
-        value_array = np.asarray(line, dtype=float)
+        return np.asarray(line, dtype=float)
     except ValueError:
-        print(current_line)
-    return value_array
+        raise ValueError("The matrix line " + repr(current_line) + " cannot be read as numbers.") from None
 
 
 def parse_matrix_block(file_lines, start, n_row, n_col, skip_amount):
-    block_matrix = np.zeros((n_row, n_col))
-    for current_row in range(n_row):  # Number of rows
-        line = file_lines[start - 1 + current_row]
-        line_values = parse_matrix_line(line, skip_amount)
-        block_matrix[current_row, : len(line_values)] = line_values
-    return block_matrix
+    return parse_matrix_blocks(file_lines, [start], [n_row], [n_col], skip_amount)[0]
+
+
+def parse_matrix_blocks(file_lines, block_starts, block_rows, block_cols, skip_amount) -> list:
+    """
+    Parses blocks of a matrix printout that share the same column layout with a single bulk conversion,
+    falling back to parsing line by line for blocks that are not laid out in fixed-width columns.
+    :param file_lines: all the lines of this current file
+    :param block_starts: the line number of the first line of every block (based on vim)
+    :param block_rows: the number of lines in every block
+    :param block_cols: the number of columns in every block
+    :param skip_amount: the number of characters skipped at the start of every line
+    :return: a list with a numpy array for every block
+    """
+    line_indices = np.concatenate([np.arange(start - 1, start - 1 + n_row, dtype=np.int64)
+                                   for start, n_row in zip(block_starts, block_rows)])
+    if len(line_indices) == 0:
+        return [np.zeros((n_row, n_col)) for n_row, n_col in zip(block_rows, block_cols)]
+    values = parse_fixed_width_block(get_lines_grid(file_lines, line_indices, skip_amount))
+    if values is not None and values.shape[1] <= max(block_cols):
+        if values.shape[1] < max(block_cols):
+            values = np.pad(values, ((0, 0), (0, max(block_cols) - values.shape[1])))
+        block_values = np.split(values, np.cumsum(block_rows)[:-1])
+        return [current_values[:, :n_col] for current_values, n_col in zip(block_values, block_cols)]
+    block_matrices = [np.zeros((n_row, n_col)) for n_row, n_col in zip(block_rows, block_cols)]
+    for block_matrix, start in zip(block_matrices, block_starts):
+        for current_row in range(block_matrix.shape[0]):  # Number of rows
+            line = file_lines[start - 1 + current_row]
+            line_values = parse_matrix_line(line, skip_amount)
+            block_matrix[current_row, : len(line_values)] = line_values
+    return block_matrices
+
+
+def get_lines_grid(file_lines, line_indices: np.array, skip_amount) -> np.array:
+    """
+    Returns the characters of the given lines past skip_amount as a 2D array of bytes, one row per line,
+    padded on the right with spaces.
+    :param file_lines: all the lines of this current file
+    :param line_indices: a sorted numpy array with the index of every line (based on Python, starting at 0)
+    :param skip_amount: the number of characters skipped at the start of every line
+    :return: a numpy uint8 array with a row for every line
+    """
+    replaced_indices = np.fromiter(getattr(file_lines, "replaced_lines", ()), dtype=np.int64)
+    positions = np.searchsorted(line_indices, replaced_indices).clip(max=len(line_indices) - 1)
+    if isinstance(file_lines, ls.LineStore) and not (line_indices[positions] == replaced_indices).any():
+        buffer = np.frombuffer(file_lines.buffer, dtype=np.uint8)
+        line_starts = file_lines.offsets[line_indices]
+        line_lengths = file_lines.offsets[line_indices + 1] - line_starts
+    else:
+        lines = [file_lines[current_index].encode() for current_index in line_indices.tolist()]
+        buffer = np.frombuffer(b"".join(lines), dtype=np.uint8)
+        line_lengths = np.array([len(line) for line in lines], dtype=np.int64)
+        line_starts = np.cumsum(line_lengths) - line_lengths
+
+    # Line endings are left out of the grid
+    line_ends = line_starts + line_lengths
+    has_newline = (line_lengths > 0) & (buffer[np.maximum(line_ends - 1, 0)] == ord("\n"))
+    has_carriage_return = has_newline & (line_lengths > 1) & (buffer[np.maximum(line_ends - 2, 0)] == ord("\r"))
+    text_lengths = line_lengths - has_newline - has_carriage_return
+
+    # Runs of adjacent lines of equal length are copied over as 2D arrays
+    run_breaks = (line_starts[1:] != line_ends[:-1]) | (line_lengths[1:] != line_lengths[:-1]) | \
+                 (text_lengths[1:] != text_lengths[:-1])
+    run_starts = np.concatenate([[0], np.flatnonzero(run_breaks) + 1, [len(line_indices)]]).tolist()
+    grid = np.full((len(line_indices), max(int(text_lengths.max()) - skip_amount, 1)), SPACE, dtype=np.uint8)
+    for first, last in zip(run_starts[:-1], run_starts[1:]):
+        line_length = int(line_lengths[first])
+        run = buffer[line_starts[first]: line_starts[first] + (last - first) * line_length]
+        run = run.reshape((last - first, line_length))[:, skip_amount: text_lengths[first]]
+        grid[first: last, :run.shape[1]] = run
+    return grid
+
+
+def parse_fixed_width_block(grid: np.array):
+    """
+    Converts a block of right-aligned, fixed-width numeric columns (such as Gaussian's "0.98322" or "0.100000D+01"
+    matrix printouts) into floats in bulk. Columns are found from where the numbers end, so numbers that run
+    into each other are still separated. Overflowed fields ("**********") become nan and empty fields become 0.
+    :param grid: the block as returned by get_lines_grid
+    :return: a numpy array with a column for every field, None if the block is not laid out in fixed-width fields
+    """
+    n_row, n_character = grid.shape
+    # Large blocks are worked through in chunks of rows that fit in the CPU cache
+    chunk_starts = range(0, n_row, GRID_CHUNK_ROWS)
+    end_columns = find_field_ends(grid[:GRID_CHUNK_ROWS])
+    if len(end_columns) == 0 or end_columns[-1] != n_character - 1:
+        # The first chunk doesn't reach the widest line, so every line has to be looked at. Otherwise every field
+        # is checked against the layout when it is converted, which catches any line that doesn't follow it.
+        end_columns = np.unique(np.concatenate([find_field_ends(grid[chunk_start: chunk_start + GRID_CHUNK_ROWS])
+                                                for chunk_start in chunk_starts]))
+    if len(end_columns) == 0:
+        return np.zeros((n_row, 0))
+    widths = np.diff(end_columns)
+    width = widths[0] if len(widths) else end_columns[0] + 1
+    if (widths != width).any():
+        return None
+    # Pad on the left so the first field is as wide as the others, anything left of it has to be blank
+    padding = width - 1 - end_columns[0]
+    if padding < 0:
+        if (grid[:, :-padding] != SPACE).any():
+            return None
+        grid = grid[:, -padding:]
+    n_field = len(end_columns)
+
+    values = np.empty((n_row, n_field))
+    for chunk_start in chunk_starts:
+        chunk = grid[chunk_start: chunk_start + GRID_CHUNK_ROWS, :n_field * width - max(padding, 0)]
+        # The fields of every line are copied next to each other so their text can be converted as fixed-size strings
+        characters = np.full((chunk.shape[0], n_field * width), SPACE, dtype=np.uint8)
+        characters[:, max(padding, 0):] = chunk
+        chunk_values = parse_numeric_fields(characters, width)
+        if chunk_values is None:
+            return None
+        values[chunk_start: chunk_start + GRID_CHUNK_ROWS] = chunk_values
+    return values
+
+
+def find_field_ends(grid: np.array) -> np.array:
+    """
+    Returns the columns of a block of lines that the end of a field falls on in at least one line.
+    :param grid: the block as returned by get_lines_grid
+    :return: a sorted numpy array of column indices
+    """
+    non_space = grid != SPACE
+    is_end = np.append((non_space[:, :-1] > non_space[:, 1:]).any(axis=0), non_space[:, -1].any())
+    return np.flatnonzero(is_end)
 
 
-def parse_matrix(file_lines, start: int, n_mo, last_string="1", space_skip=2, n_col=5, block_skip=1, triangular=False):
+def parse_numeric_fields(chunk: np.array, width: int):
+    """
+    Converts lines of right-aligned numbers, each in a field of the given width, into floats with a single
+    conversion of the text of every field. Fortran exponents ("0.100000D+01") are read as E exponents, overflowed
+    fields ("**********") become nan and empty fields become 0.
+    :param chunk: a numpy uint8 array with a row for every line and the characters of its fields one after another,
+        it is changed in place
+    :param width: the number of characters in every field
+    :return: a numpy array with a column for every field, None if a field is not a number
+    """
+    fields = chunk.reshape((chunk.shape[0], -1, width))
+    # Right-aligned numbers end with a digit, the fields that don't are either empty or overflowed
+    last_characters = fields[:, :, -1]
+    numbers = (last_characters >= ord("0")) & (last_characters <= ord("9"))
+    overflow = None
+    if not numbers.all():
+        others = ~numbers
+        other_fields = fields[others]
+        blank = (other_fields == SPACE).all(axis=1)
+        overflow = ((other_fields == STAR) | (other_fields == SPACE)).all(axis=1) & (other_fields[:, -1] == STAR)
+        if not (blank | overflow).all():
+            return None
+        other_fields[:, -1] = ord("0")
+        other_fields[:, :-1] = SPACE
+        fields[others] = other_fields
+        overflow = np.flatnonzero(others.ravel())[overflow]
+    chunk[chunk == ord("D")] = ord("E")
+    try:
+        values = chunk.view("S" + str(width)).astype(float)
+    except ValueError:
+        return None
+    if overflow is not None:
+        values.ravel()[overflow] = np.nan
+    return values
+
+
+def parse_matrix(file_lines, start: int, n_mo, last_string="1", space_skip=2, n_col=5, block_skip=1, triangular=False,
+                 dtype=np.float64):
     # Parse cartesian_axes, last_string="s", space_skip=6
-    matrix = np.zeros((n_mo, n_mo))
+    matrix = np.zeros((n_mo, n_mo), dtype=dtype)
     cycles = m.ceil(n_mo / n_col)
     n_row_block = n_mo
     n_col_block = n_col
@@ -69,20 +236,57 @@ def parse_matrix(file_lines, start: int, n_mo, last_string="1", space_skip=2, n_
     else:
         skip_amount = file_lines[start - 1].find(last_string) + space_skip
 
+    block_starts, block_rows, block_cols = [], [], []
     for current_block in range(cycles):  # Number of separated matrix blocks
         if triangular:
             n_row_block = n_mo - (current_block * n_col)
         if current_block == cycles - 1 and n_last_block_col != 0:
             n_col_block = n_last_block_col
-        end = start + n_row_block
-        current_block_matrix = parse_matrix_block(file_lines, start, n_row_block, n_col_block, skip_amount)
+        block_starts.append(start)
+        block_rows.append(n_row_block)
+        block_cols.append(n_col_block)
+        start = start + n_row_block + block_skip
+    block_matrices = parse_matrix_blocks(file_lines, block_starts, block_rows, block_cols, skip_amount)
+    for current_block, current_block_matrix in enumerate(block_matrices):
+        n_row_block, n_col_block = current_block_matrix.shape
         matrix[n_mo - n_row_block:, (n_col * current_block): (n_col * current_block) + n_col_block] = current_block_matrix
-        start = end + block_skip
     return matrix
 
 
 def combine_complex_matrix(real_matrix, imaginary_matrix):
-    return real_matrix + 1j * imaginary_matrix
+    # The complex matrix keeps the precision of its parts
+    complex_matrix = np.empty(real_matrix.shape, dtype=precision.get_complex_dtype(real_matrix.dtype))
+    complex_matrix.real = real_matrix
+    complex_matrix.imag = imaginary_matrix
+    return complex_matrix
+
+
+def get_ao_projection(overlap_matrix, mo_coefficient_matrix) -> np.array:
+    """
+    Returns the projection of every MO onto every AO, (S C) * conj(C).
+    For GHF the MO coefficients have a row for each spin of every basis function (alpha then beta) while the
+    overlap only has the basis functions, so both spins are multiplied by the real overlap at once. This is the same
+    as multiplying by np.kron(overlap_matrix, identity) without building the spin orbital overlap, whose spin blocks
+    are all either the overlap or zero.
+    :param overlap_matrix: the overlap matrix of the basis functions
+    :param mo_coefficient_matrix: the MO coefficient matrix or some of its columns, with a row for every AO (or spin
+        orbital for GHF)
+    :return: a numpy array with the same shape as the MO coefficient matrix
+    """
+    n_basis = overlap_matrix.shape[0]
+    n_row, n_col = mo_coefficient_matrix.shape
+    if n_row != 2 * n_basis:
+        product = np.dot(overlap_matrix, mo_coefficient_matrix)
+    else:
+        # Every row holds the alpha coefficients of a basis function followed by its beta coefficients
+        spin_blocks = mo_coefficient_matrix.reshape((n_basis, 2 * n_col))
+        if np.iscomplexobj(spin_blocks):
+            product = combine_complex_matrix(np.dot(overlap_matrix, spin_blocks.real),
+                                             np.dot(overlap_matrix, spin_blocks.imag))
+        else:
+            product = np.dot(overlap_matrix, spin_blocks)
+        product = product.reshape((n_row, n_col))
+    return np.multiply(product, np.conjugate(mo_coefficient_matrix))
 
 
 def convert_ao_projection_to_mo_transition(n_excitation, data):
@@ -93,14 +297,57 @@ def convert_mo_transition_to_ao_projection(n_mo, n_excitation, data):
     return np.tile(data, (1, n_mo)).reshape((n_excitation * n_mo, data.shape[1]))
 
 
+def get_sparse_ao_transition_matrix(ao_projection_matrix, delta_diagonal_matrix):
+    """
+    Returns the product of the AO projection of every AO with every row of a sparse delta diagonal matrix, the same
+    as np.multiply(convert_ao_projection_to_mo_transition(...), convert_mo_transition_to_ao_projection(...)) without
+    building either tiled matrix. Only the non-zero MOs of every excitation are stored.
+    :param ao_projection_matrix: a dense matrix with a row for every AO and a column for every active space MO
+    :param delta_diagonal_matrix: a scipy.sparse matrix with a row for every excitation
+    :return: a scipy.sparse CSR matrix with a row for every (excitation, AO) pair
+    """
+    delta_diagonal_matrix = sps.csr_matrix(delta_diagonal_matrix)
+    n_ao = ao_projection_matrix.shape[0]
+    row_nnz = np.diff(delta_diagonal_matrix.indptr)
+    # Every excitation gives a block of n_ao rows that all hold the non-zero MOs of the excitation
+    block_sizes = row_nnz * n_ao
+    positions = np.arange(block_sizes.sum()) - np.repeat(np.cumsum(block_sizes) - block_sizes, block_sizes)
+    entry_nnz = np.repeat(row_nnz, block_sizes)
+    sources = np.repeat(delta_diagonal_matrix.indptr[:-1], block_sizes) + positions % entry_nnz
+    columns = delta_diagonal_matrix.indices[sources]
+    data = ao_projection_matrix[positions // entry_nnz, columns] * delta_diagonal_matrix.data[sources]
+    indptr = np.concatenate([[0], np.cumsum(np.repeat(row_nnz, n_ao))])
+    return sps.csr_matrix((data, columns, indptr), shape=(delta_diagonal_matrix.shape[0] * n_ao, delta_diagonal_matrix.shape[1]))
+
+
 def summarize_matrix(matrix):
+    if sps.issparse(matrix):
+        return summarize_sparse_matrix(matrix)
     particle_diagonal_matrix = np.where(matrix[:, :] > 0, matrix[:, :], 0)
     hole_diagonal_matrix = np.where(matrix[:, :] < 0, matrix[:, :], 0)
 
+    # Single precision rows are summed in double precision
+    accumulator_dtype = precision.get_accumulator_dtype(matrix.dtype)
+    summary_matrix = np.ndarray((matrix.shape[0], 3))
+    summary_matrix[:, 0] = np.sum(matrix, axis=1, dtype=accumulator_dtype)
+    summary_matrix[:, 1] = np.sum(particle_diagonal_matrix, axis=1, dtype=accumulator_dtype)
+    summary_matrix[:, 2] = np.sum(hole_diagonal_matrix, axis=1, dtype=accumulator_dtype)
+
+    return summary_matrix
+
+
+def summarize_sparse_matrix(matrix):
+    matrix = sps.csr_matrix(matrix)
+    particle_diagonal_matrix = matrix.copy()
+    particle_diagonal_matrix.data = np.where(matrix.data > 0, matrix.data, 0)
+    hole_diagonal_matrix = matrix.copy()
+    hole_diagonal_matrix.data = np.where(matrix.data < 0, matrix.data, 0)
+
+    accumulator_dtype = precision.get_accumulator_dtype(matrix.dtype)
     summary_matrix = np.ndarray((matrix.shape[0], 3))
-    summary_matrix[:, 0] = np.sum(matrix, axis=1)
-    summary_matrix[:, 1] = np.sum(particle_diagonal_matrix, axis=1)
-    summary_matrix[:, 2] = np.sum(hole_diagonal_matrix, axis=1)
+    summary_matrix[:, 0] = np.asarray(matrix.sum(axis=1, dtype=accumulator_dtype)).ravel()
+    summary_matrix[:, 1] = np.asarray(particle_diagonal_matrix.sum(axis=1, dtype=accumulator_dtype)).ravel()
+    summary_matrix[:, 2] = np.asarray(hole_diagonal_matrix.sum(axis=1, dtype=accumulator_dtype)).ravel()
 
     return summary_matrix
 
@@ -1,15 +1,28 @@
 from fasma.core import boxes as bx
 from fasma.core import messages as msg
+from fasma.core import keyword_trie
 from fasma.gaussian import parse_functions
 from fasma.gaussian import parse_matrices
+from functools import partial
 import numpy as np
 import math as m
 
+keyword_trie.register_keys("pop.mo", ["Eigenvalues", "#", "3/"])
+keyword_trie.register_keys("pop.overlap", ["Overlap", "#", "3/"])
+keyword_trie.register_keys("pop.density", ["Density Matrix", "Alpha Density Matrix", "Beta Density Matrix", "Density matrix",
+                                           "#", "3/"])
 
-def check_pop(basic, file_keyword_trie, file_lines, cas_status: bool) -> bool:
+
+def check_pop(basic, file_keyword_trie, file_lines, cas_status: bool, lazy: bool = False, sections=None,
+              dtype=np.float64) -> bool:
     """
     Tests if .log contains a pop calculation.
     If yes, initializes necessary pop-related attributes with SCF type in consideration.
+    :param lazy: if true, the pop-related matrices are only parsed when they are first accessed
+    :param sections: the pop sections to parse (see parse_gaussian.SECTIONS), the matrices of the other sections
+        are left as None. Every section by default
+    :param dtype: the floating point type of the matrices (see precision.get_dtype), complex matrices use the
+        matching complex type
     :return: true if this .log contains a population calculation, false otherwise
     """
     try:
@@ -18,39 +31,114 @@ def check_pop(basic, file_keyword_trie, file_lines, cas_status: bool) -> bool:
         pass
     else:
         if temp_check[0] >= 1:
-            ao_matrix = get_ao_matrix(basic, file_keyword_trie, file_lines)
-            overlap_matrix = get_overlap_matrix(basic, file_keyword_trie, file_lines)
-            electron_data = get_alpha_electron_data(basic, file_keyword_trie, file_lines, cas_status)
-            calculate_ao_projection(overlap_matrix, electron_data)
+            if lazy:
+                return get_lazy_pop_data(basic, file_keyword_trie, file_lines, cas_status, sections, dtype)
+            ao_matrix = None
+            overlap_matrix = None
+            if has_section(sections, "pop.mo"):
+                ao_matrix = get_ao_matrix(basic, file_keyword_trie, file_lines)
+            if has_section(sections, "pop.overlap"):
+                overlap_matrix = get_overlap_matrix(basic, file_keyword_trie, file_lines, dtype)
+            electron_data = get_alpha_electron_data(basic, file_keyword_trie, file_lines, cas_status, sections, dtype)
             pop_data = bx.PopData(ao_matrix=ao_matrix, overlap_matrix=overlap_matrix, electron_data=electron_data)
+            calculate_ao_projection(pop_data)
             if (basic.scf_type == "ROHF" and cas_status) or basic.scf_type == "UHF":
-                beta_electron_data = get_beta_electron_data(basic, file_keyword_trie, file_lines, cas_status)
-                calculate_ao_projection(overlap_matrix, beta_electron_data)
+                beta_electron_data = get_beta_electron_data(basic, file_keyword_trie, file_lines, cas_status, sections, dtype)
                 pop_data.add_beta_electron_data(beta_electron_data)
+                calculate_ao_projection(pop_data, beta=True)
             return pop_data
     return
 
 
-def calculate_ao_projection(overlap_matrix, electron_data):
-    ao_projection_matrix = np.multiply(np.dot(overlap_matrix, electron_data.mo_coefficient_matrix), np.conjugate(electron_data.mo_coefficient_matrix))
-    electron_data.add_ao_projection_matrix(ao_projection_matrix)
+def has_section(sections, section: str) -> bool:
+    return sections is None or section in sections
+
+
+def get_lazy_pop_data(basic, file_keyword_trie, file_lines, cas_status, sections=None, dtype=np.float64):
+    """
+    Builds a LazyPopData whose matrices are parsed from the given lines the first time they are accessed.
+    The lines (and the file they map) are kept alive until every matrix has been parsed.
+    """
+    parse_mo = has_section(sections, "pop.mo")
+    parse_density = has_section(sections, "pop.density")
+    parse_overlap = has_section(sections, "pop.overlap")
+    pop_loaders = {}
+    alpha_loaders = {}
+    if parse_mo:
+        pop_loaders["ao_matrix"] = partial(get_ao_matrix, basic, file_keyword_trie, file_lines)
+        alpha_loaders["mo_coefficient_matrix"] = partial(get_mo_coefficient_matrix, basic, file_keyword_trie, file_lines, dtype=dtype)
+        alpha_loaders["eigenvalues"] = partial(get_eigenvalues, file_keyword_trie, file_lines, basic.n_mo)
+    if parse_overlap:
+        pop_loaders["overlap_matrix"] = partial(get_overlap_matrix, basic, file_keyword_trie, file_lines, dtype)
+    if parse_density:
+        alpha_loaders["density_matrix"] = partial(get_density_matrix, basic, file_keyword_trie, file_lines, cas_status, dtype=dtype)
+    pop_data = bx.LazyPopData(pop_loaders)
+    electron_data = bx.LazyElectronData(alpha_loaders)
+    if parse_mo and parse_overlap:
+        electron_data.set_loader("ao_projection_matrix", partial(get_ao_projection_matrix, pop_data), derived=True)
+    pop_data.electron_data = electron_data
+    if (basic.scf_type == "ROHF" and cas_status) or basic.scf_type == "UHF":
+        beta_loaders = {}
+        if parse_density:
+            beta_loaders["density_matrix"] = partial(get_density_matrix, basic, file_keyword_trie, file_lines, cas_status, beta=True,
+                                                     dtype=dtype)
+        if basic.scf_type == "UHF" and parse_mo:
+            beta_loaders["mo_coefficient_matrix"] = partial(get_mo_coefficient_matrix, basic, file_keyword_trie, file_lines, beta=True,
+                                                            dtype=dtype)
+            beta_loaders["eigenvalues"] = partial(get_eigenvalues, file_keyword_trie, file_lines, basic.n_mo, beta=True)
+        beta_electron_data = bx.LazyBetaData(beta_loaders)
+        if "mo_coefficient_matrix" in beta_loaders and parse_overlap:
+            beta_electron_data.set_loader("ao_projection_matrix", partial(get_ao_projection_matrix, pop_data, beta=True),
+                                          derived=True)
+        pop_data.beta_electron_data = beta_electron_data
+    return pop_data
+
+
+def get_ao_projection_matrix(pop_data, beta: bool = False):
+    """
+    Computes the whole AO projection matrix of a spin, which replaces the blocks of it computed so far.
+    """
+    electron_data = pop_data.beta_electron_data if beta else pop_data.electron_data
+    ao_projection_matrix = parse_matrices.get_ao_projection(pop_data.overlap_matrix, electron_data.mo_coefficient_matrix)
+    pop_data.drop_ao_projection_blocks(beta)
+    return ao_projection_matrix
+
+
+def calculate_ao_projection(pop_data, beta: bool = False):
+    """
+    Computes the AO projection matrix of the electron data of a spin. A lazy parse only computes it when it is first
+    accessed instead (see get_lazy_pop_data), since the AO transitions only need its active space columns (see
+    PopData.get_ao_projection_columns).
+    """
+    electron_data = pop_data.beta_electron_data if beta else pop_data.electron_data
+    if pop_data.overlap_matrix is None or electron_data.mo_coefficient_matrix is None:
+        return
+    electron_data.add_ao_projection_matrix(get_ao_projection_matrix(pop_data, beta))
 
 
-def get_alpha_electron_data(basic, file_keyword_trie, file_lines, cas_status):
-    density_matrix = get_density_matrix(basic=basic, file_keyword_trie=file_keyword_trie, file_lines=file_lines, cas_status=cas_status)
-    mo_coefficient_matrix = get_mo_coefficient_matrix(basic=basic, file_keyword_trie=file_keyword_trie, file_lines=file_lines)
-    eigenvalues = get_eigenvalues(file_keyword_trie=file_keyword_trie, file_lines=file_lines, n_mo=basic.n_mo)
-    return bx.ElectronData(density_matrix, mo_coefficient_matrix, eigenvalues)
+def get_alpha_electron_data(basic, file_keyword_trie, file_lines, cas_status, sections=None, dtype=np.float64):
+    density_matrix = None
+    mo_coefficient_matrix = None
+    eigenvalues = None
+    if has_section(sections, "pop.density"):
+        density_matrix = get_density_matrix(basic=basic, file_keyword_trie=file_keyword_trie, file_lines=file_lines, cas_status=cas_status, dtype=dtype)
+    if has_section(sections, "pop.mo"):
+        mo_coefficient_matrix = get_mo_coefficient_matrix(basic=basic, file_keyword_trie=file_keyword_trie, file_lines=file_lines, dtype=dtype)
+        eigenvalues = get_eigenvalues(file_keyword_trie=file_keyword_trie, file_lines=file_lines, n_mo=basic.n_mo)
+    return bx.ElectronData(density_matrix=density_matrix, mo_coefficient_matrix=mo_coefficient_matrix,
+                           eigenvalues=eigenvalues)
 
 
-def get_beta_electron_data(basic, file_keyword_trie, file_lines, cas_status):
-    density_matrix = get_density_matrix(basic=basic, file_keyword_trie=file_keyword_trie, file_lines=file_lines, cas_status=cas_status, beta=True)
+def get_beta_electron_data(basic, file_keyword_trie, file_lines, cas_status, sections=None, dtype=np.float64):
+    density_matrix = None
+    if has_section(sections, "pop.density"):
+        density_matrix = get_density_matrix(basic=basic, file_keyword_trie=file_keyword_trie, file_lines=file_lines, cas_status=cas_status, beta=True, dtype=dtype)
     beta_electron_data = bx.BetaData(density_matrix=density_matrix)
-    if basic.scf_type == "UHF":
-        mo_coefficient_matrix = get_mo_coefficient_matrix(basic=basic, file_keyword_trie=file_keyword_trie, file_lines=file_lines, beta=True)
+    if basic.scf_type == "UHF" and has_section(sections, "pop.mo"):
+        mo_coefficient_matrix = get_mo_coefficient_matrix(basic=basic, file_keyword_trie=file_keyword_trie, file_lines=file_lines, beta=True, dtype=dtype)
         eigenvalues = get_eigenvalues(file_keyword_trie=file_keyword_trie, file_lines=file_lines, n_mo=basic.n_mo, beta=True)
-    beta_electron_data.add_beta_mo_coefficient_matrix(mo_coefficient_matrix)
-    beta_electron_data.add_beta_eigenvalues(eigenvalues)
+        beta_electron_data.add_beta_mo_coefficient_matrix(mo_coefficient_matrix)
+        beta_electron_data.add_beta_eigenvalues(eigenvalues)
     return beta_electron_data
 
 
@@ -95,10 +183,13 @@ def parse_ao_line(current_line, subshell_position):
 
 
 def get_ao_matrix(basic, file_keyword_trie, file_lines):
+    """
+    Parses the labels of the AOs printed in front of the MO coefficients.
+    :return: an AOTable with a row for every MO, the rows that are not printed are left blank
+    """
     start = file_keyword_trie.find("Eigenvalues")[0] + 1
-    ao_matrix = np.empty((basic.n_mo, 5), dtype='<U12')
+    ao_rows = []
     subshell_position = file_lines[start - 1].rfind('S')
-    counter = 0
     n_lines = basic.n_mo
     if basic.scf_type == "GHF":
         n_lines *= 2
@@ -111,40 +202,36 @@ def get_ao_matrix(basic, file_keyword_trie, file_lines):
             atom_info = ao_row[0:2]
         else:
             ao_row = atom_info + ao_row
-        ao_row = np.array(ao_row, dtype='<U12')
-        ao_matrix[counter, :] = ao_row
-        counter += 1
-    return ao_matrix
+        ao_rows.append(ao_row)
+    ao_rows += [[""] * len(bx.AOTable.COLUMNS)] * (basic.n_mo - len(ao_rows))
+    return bx.AOTable.from_rows(ao_rows)
 
-def get_overlap_matrix(basic, file_keyword_trie, file_lines) -> np.array:
+def get_overlap_matrix(basic, file_keyword_trie, file_lines, dtype=np.float64) -> np.array:
     """
     Builds and returns a numpy array containing the Overlap matrix contained in the given .log file
-    and converts it to square matrix form
+    and converts it to square matrix form. For GHF this is the real overlap of the basis functions: the spin
+    orbital overlap only repeats it for each spin, so it is never expanded (see parse_matrices.get_ao_projection)
     :return: a numpy array containing the Overlap matrix contained in the given .log file in square matrix form
     """
     overlap_matrix_state_line_num = file_keyword_trie.find("Overlap")[0] + 2
-    triangular_overlap_matrix = parse_matrices.parse_matrix(file_lines, start=overlap_matrix_state_line_num, n_mo=basic.n_basis, triangular=True)
+    triangular_overlap_matrix = parse_matrices.parse_matrix(file_lines, start=overlap_matrix_state_line_num, n_mo=basic.n_basis, triangular=True,
+                                                            dtype=dtype)
     overlap_matrix = parse_matrices.square_trig_matrix(triangular_overlap_matrix)
-
-    if basic.scf_type == "GHF":
-        identity = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.complex128)
-        overlap_matrix = np.kron(overlap_matrix, identity)
-
     return overlap_matrix
 
 
-def get_ghf_density_matrix(basic, file_keyword_trie, file_lines):
+def get_ghf_density_matrix(basic, file_keyword_trie, file_lines, dtype=np.float64):
     temp = file_keyword_trie.find("Density matrix")[0:2]
     real_matrix_start = temp[0] + 2
     imaginary_matrix_start = temp[1] + 2
-    real_matrix = parse_matrices.parse_matrix(file_lines, start=real_matrix_start, n_mo=basic.n_mo, triangular=True)
-    imaginary_matrix = parse_matrices.parse_matrix(file_lines, start=imaginary_matrix_start, n_mo=basic.n_mo, triangular=True)
+    real_matrix = parse_matrices.parse_matrix(file_lines, start=real_matrix_start, n_mo=basic.n_mo, triangular=True, dtype=dtype)
+    imaginary_matrix = parse_matrices.parse_matrix(file_lines, start=imaginary_matrix_start, n_mo=basic.n_mo, triangular=True, dtype=dtype)
     return parse_matrices.combine_complex_matrix(real_matrix, imaginary_matrix)
 
 
-def get_density_matrix(basic, file_keyword_trie, file_lines, cas_status=False, beta=False):
+def get_density_matrix(basic, file_keyword_trie, file_lines, cas_status=False, beta=False, dtype=np.float64):
     if basic.scf_type == "GHF":
-        return get_ghf_density_matrix(basic, file_keyword_trie, file_lines)
+        return get_ghf_density_matrix(basic, file_keyword_trie, file_lines, dtype)
     elif beta:
         keyword = "Beta Density Matrix"
     elif basic.scf_type == "RHF" or (basic.scf_type == "ROHF" and cas_status):
@@ -152,16 +239,17 @@ def get_density_matrix(basic, file_keyword_trie, file_lines, cas_status=False, b
     else:
         keyword = "Alpha Density Matrix"
     start = file_keyword_trie.find(keyword)[-1] + 2
-    return parse_matrices.parse_matrix(file_lines, start=start, n_mo=basic.n_mo, last_string="S", space_skip=6, triangular=True)
+    return parse_matrices.parse_matrix(file_lines, start=start, n_mo=basic.n_mo, last_string="S", space_skip=6, triangular=True,
+                                       dtype=dtype)
 
 
-def get_mo_coefficient_matrix(basic, file_keyword_trie, file_lines, n_col=5, beta=False):
+def get_mo_coefficient_matrix(basic, file_keyword_trie, file_lines, n_col=5, beta=False, dtype=np.float64):
     if beta:
         index = m.ceil(basic.n_mo / n_col)
     else:
         index = 0
     start = file_keyword_trie.find("Eigenvalues")[index] + 1
-    mo_coefficient_matrix = parse_matrices.parse_mo_coefficient_matrix(basic, file_lines, start=start)
+    mo_coefficient_matrix = parse_matrices.parse_mo_coefficient_matrix(basic, file_lines, start=start, dtype=dtype)
     if basic.scf_type == "GHF":
         real_matrix = mo_coefficient_matrix[0::2]
         imaginary_matrix = mo_coefficient_matrix[1::2]
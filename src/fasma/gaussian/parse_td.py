@@ -1,19 +1,40 @@
 from fasma.core import boxes as bx
 from fasma.core import messages as msg
+from fasma.core import keyword_trie
+from fasma.core import line_store as ls
+from fasma.core import precision
 from fasma.gaussian import parse_excitation
 from fasma.gaussian import parse_functions
 from fasma.gaussian import parse_matrices
+from scipy import sparse as sps
 import numpy as np
+import re
 
+keyword_trie.register_keys("td", ["Excited State", "Rotatory Strength", "#", "9/"])
 
-def check_td(basic, file_keyword_trie, file_lines) -> bool:
+# The configurations of an excited state are listed on the lines holding "->" or "<-" right after its "Excited State"
+# line, like "5 ->  6   0.70435", "5B -> 7B  -0.10224" for UHF or "5 ->  6  0.70434  0.00012" for GHF
+AMPLITUDE_LINES_PATTERN = re.compile(rb"(?:[^\n]*(?:->|<-)[^\n]*(?:\n|$))*")
+AMPLITUDE_PATTERN = re.compile(rb"(\d+)([AB]?)\s*(?:->|<-)\s*(\d+)([AB]?)\s+(\S+)(?:[ \t]+(\S+))?")
+# Each configuration moves twice its squared amplitude for RHF and ROHF, where both spins share its MOs
+TD_MULTIPLIERS = {"RHF": 2, "ROHF": 2, "UHF": 1, "GHF": 1}
+
+
+def check_td(basic, file_keyword_trie, file_lines, sparse: bool = False, partial: bool = False,
+             dtype=np.float64, previous=None) -> bool:
     """
     Checks if .log contains a TD calculation.
     If yes, initializes and returns a CASData object.
     :param file_keyword_trie: the KeyWordTrie object of the current file
     :param file_lines: all the lines of this current file
     :param basic: the BasicData object for this current file
-    :return: TDData object if .log file contains a TD calculation, none otherwise
+    :param sparse: if true, the delta diagonal matrices are scipy.sparse CSR matrices
+    :param partial: if true, the job is still running and only the excited states printed so far are parsed
+    :param dtype: the floating point type of the delta diagonal matrices (see precision.get_dtype)
+    :param previous: the TDData of the same running job parsed before, whose excited states are kept. Only the
+        states printed since and the last one of previous, whose configurations may have been cut, are parsed
+    :return: TDData object if .log file contains a TD calculation, none otherwise (or if no excited state was
+        printed yet when partial is true)
     """
     try:
         temp_check = parse_functions.find_iop(file_keyword_trie, file_lines, "9", ["42", "41"])
@@ -22,52 +43,65 @@ def check_td(basic, file_keyword_trie, file_lines) -> bool:
     else:
         if temp_check[0] == 1:
             n_excited_state = temp_check[1]
+            if partial:
+                n_excited_state = min(n_excited_state, len(file_keyword_trie.find("Excited State") or []))
+                if n_excited_state == 0:
+                    return None
+            first_state = 0 if previous is None else max(previous.n_excited_state - 1, 0)
             n_active_space_mo = basic.n_mo
             n_active_space_electron = basic.n_electron
 
             excitation_data = bx.TDData(n_excited_state=n_excited_state, n_active_space_mo=n_active_space_mo,
                                         n_active_space_electron=n_active_space_electron)
-            ground_state_list, excited_state_list, delta_energy_list, oscillations, alpha_delta_diagonal_list, beta_delta_diagonal_list = get_excitations_td(basic, file_keyword_trie, file_lines, excitation_data)
-            excitation_matrix, delta_diagonal_matrix = parse_excitation.get_excitation_matrix(ground_state_list,
-                                                                                              excited_state_list,
-                                                                                              delta_energy_list,
-                                                                                              oscillations,
-                                                                                              alpha_delta_diagonal_list)
-            rotatory_velocity, rotatory_length = get_rotatory_strength(file_keyword_trie, file_lines, n_excited_state)
+            ground_state_list, excited_state_list, delta_energy_list, oscillations, delta_diagonal_matrix, beta_delta_diagonal_matrix = get_excitations_td(basic, file_keyword_trie, file_lines, excitation_data, sparse, dtype, first_state)
+            excitation_matrix = np.column_stack((ground_state_list, excited_state_list, delta_energy_list, oscillations))
+            rotatory_velocity, rotatory_length = get_rotatory_strength(file_keyword_trie, file_lines, n_excited_state, first_state)
             excitation_matrix = np.insert(excitation_matrix, 4, rotatory_velocity, axis=1)
             excitation_matrix = np.insert(excitation_matrix, 5, rotatory_length, axis=1)
+            if first_state > 0:
+                excitation_matrix = np.vstack((previous.excitation_matrix[:first_state], excitation_matrix))
+                delta_diagonal_matrix = parse_excitation.stack_rows(previous.delta_diagonal_matrix[:first_state],
+                                                                    delta_diagonal_matrix)
+                if basic.scf_type == "UHF":
+                    beta_delta_diagonal_matrix = parse_excitation.stack_rows(
+                        previous.beta_delta_diagonal_matrix[:first_state], beta_delta_diagonal_matrix)
             excitation_data.add_excitation_matrix(excitation_matrix)
             excitation_data.add_delta_diagonal_matrix(delta_diagonal_matrix)
             if basic.scf_type == "UHF":
-                beta_delta_diagonal_matrix = np.vstack(beta_delta_diagonal_list)
                 excitation_data.add_beta_delta_diagonal_matrix(beta_delta_diagonal_matrix)
             return excitation_data
 
 
-def get_rotatory_strength(file_keyword_trie, file_lines, n_excited_state):
+def get_rotatory_strength(file_keyword_trie, file_lines, n_excited_state, first_state=0):
     rotatory_lines = file_keyword_trie.find("Rotatory Strength")
-    rotatory_velocity = parse_matrices.parse_matrix_block(file_lines, rotatory_lines[0] + 2, n_excited_state, 6, 10)[:, 4]
-    rotatory_length = parse_matrices.parse_matrix_block(file_lines, rotatory_lines[1] + 2, n_excited_state, 6, 10)[:, 4]
+    n_row = n_excited_state - first_state
+    rotatory_velocity = parse_matrices.parse_matrix_block(file_lines, rotatory_lines[0] + 2 + first_state, n_row, 6, 10)[:, 4]
+    rotatory_length = parse_matrices.parse_matrix_block(file_lines, rotatory_lines[1] + 2 + first_state, n_row, 6, 10)[:, 4]
     return rotatory_velocity, rotatory_length
 
 
-def get_excitations_td(basic, file_keyword_trie, file_lines, excitation_data):
-    ground_state_list, excited_state_list, delta_energy_list, oscillations, alpha_delta_diagonal_list = parse_excitation.initialize_excitation_fields(
-        excitation_data.n_excitation)
-    beta_delta_diagonal_list = np.empty(excitation_data.n_excitation, dtype=np.ndarray)
+def get_excitations_td(basic, file_keyword_trie, file_lines, excitation_data, sparse=False, dtype=np.float64,
+                       first_state=0):
+    """
+    :param first_state: the index of the first excited state parsed (based on Python, starting at 0), the excitations
+        of the states before it are left out
+    """
+    ground_state_list, excited_state_list, delta_energy_list, oscillations, _ = parse_excitation.initialize_excitation_fields(
+        excitation_data.n_excitation - first_state)
     num_of_results = 0
-    state_lines = verify_td_completeness(file_keyword_trie, excitation_data.n_excitation)
+    state_lines = verify_td_completeness(file_keyword_trie, excitation_data.n_excitation)[first_state:]
     for x in range(excitation_data.n_ground_state):
         current_degenerate_state = x + 1
-        for y in range(excitation_data.final_state - 1 - x):
+        for y in range(first_state, excitation_data.final_state - 1 - x):
             current_excited_state = x + y + 2
             ground_state_list[num_of_results] = current_degenerate_state
             excited_state_list[num_of_results] = current_excited_state
-
-            alpha_delta_diagonal_list[num_of_results], beta_delta_diagonal_list[num_of_results], delta_energy_list[num_of_results], oscillations[
-                num_of_results] = td_get_excited_state(basic, file_lines, state_lines[num_of_results], excitation_data.n_active_space_mo)
+            delta_energy_list[num_of_results], oscillations[num_of_results] = td_get_excited_state(file_lines, state_lines[num_of_results])
             num_of_results += 1
-    return ground_state_list, excited_state_list, delta_energy_list, oscillations, alpha_delta_diagonal_list, beta_delta_diagonal_list
+    amplitudes = get_td_amplitudes(basic, file_lines, state_lines)
+    alpha_delta_diagonal_matrix, beta_delta_diagonal_matrix = get_td_delta_diagonal_matrices(
+        basic, amplitudes, len(state_lines), excitation_data.n_active_space_mo, sparse, dtype)
+    return ground_state_list, excited_state_list, delta_energy_list, oscillations, alpha_delta_diagonal_matrix, beta_delta_diagonal_matrix
 
 
 def verify_td_completeness(file_keyword_trie, n_excitation):
@@ -78,42 +112,68 @@ def verify_td_completeness(file_keyword_trie, n_excitation):
     return state_lines
 
 
-def td_get_excited_state(basic, file_lines, line_num, n_active_space_mo):
+def td_get_excited_state(file_lines, line_num):
     current_line = file_lines[line_num - 1].split()
-    if basic.scf_type == "GHF":
-        imag_arg = {"dtype": complex}
-    else:
-        imag_arg = {}
-    alpha_delta_diagonal = np.zeros(n_active_space_mo, **imag_arg)
-    beta_delta_diagonal = np.zeros(n_active_space_mo, **imag_arg)
     energy_value = float(current_line[current_line.index("eV") - 1])
     if "f" in current_line:
         osc_value = float(current_line[7])
     else:
         osc_value = float(current_line[8][2:])
+    return energy_value, osc_value
 
-    line_num += 1
-
-    while "->" in file_lines[line_num - 1] or "<-" in file_lines[line_num - 1]:
-        current_line = file_lines[line_num - 1].replace("<-", "->").replace(">", "> ").split()
-        if basic.scf_type == "GHF":
-            transfer_value = complex(float(current_line[3]), float(current_line[4]))
-        else:
-            transfer_value = float(current_line[3])
-        if "B" in current_line[0]:
-            from_mo = int(current_line[0].replace("B", "")) - 1
-            to_mo = int(current_line[2].replace("B", "")) - 1
-            current_delta_diag = beta_delta_diagonal
-        else:
-            from_mo = int(current_line[0].replace("A", "")) - 1
-            to_mo = int(current_line[2].replace("A", "")) - 1
-            current_delta_diag = alpha_delta_diagonal
-        if basic.scf_type in ["RHF", "ROHF"]:
-            multiplier = 2
-        elif basic.scf_type in ["UHF", "GHF"]:
-            multiplier = 1
-        current_delta_diag[from_mo] -= multiplier * np.dot(transfer_value, np.conjugate(transfer_value))
-        current_delta_diag[to_mo] += multiplier * np.dot(transfer_value, np.conjugate(transfer_value))
-        line_num += 1
-    return alpha_delta_diagonal, beta_delta_diagonal, energy_value, osc_value
 
+def get_td_amplitudes(basic, file_lines, state_lines):
+    """
+    Pulls the configurations listed under every excited state (the lines holding "->" or "<-" right after its
+    "Excited State" line) out of the raw text of the states in one pass.
+    :param state_lines: the line number of the "Excited State" line of every state (based on vim)
+    :return: flat numpy arrays with the state index (based on Python, starting at 0), the from and to MO indices,
+        whether it is a beta configuration and the amplitude (complex for GHF) of every configuration
+    """
+    buffer, line_starts = ls.get_buffer(file_lines, state_lines[0], len(file_lines))
+    first_line = state_lines[0]
+    state_indices = []
+    configurations = []
+    for current_state, line_num in enumerate(state_lines):
+        block_start = int(line_starts[line_num - first_line])
+        block_end = AMPLITUDE_LINES_PATTERN.match(buffer, block_start, int(line_starts[-1])).end()
+        current_configurations = AMPLITUDE_PATTERN.findall(buffer[block_start: block_end])
+        state_indices.extend([current_state] * len(current_configurations))
+        configurations.extend(current_configurations)
+    if not configurations:
+        configurations = np.zeros((0, 6), dtype="S1")
+    configurations = np.array(configurations, dtype=bytes)
+    from_mo = configurations[:, 0].astype(np.int64) - 1
+    to_mo = configurations[:, 2].astype(np.int64) - 1
+    beta = configurations[:, 1] == b"B"
+    amplitudes = configurations[:, 4].astype(float)
+    if basic.scf_type == "GHF":
+        amplitudes = amplitudes + 1j * configurations[:, 5].astype(float)
+    return np.array(state_indices, dtype=np.int64), from_mo, to_mo, beta, amplitudes
+
+
+def get_td_delta_diagonal_matrices(basic, amplitudes, n_excitation, n_active_space_mo, sparse=False, dtype=np.float64):
+    """
+    Accumulates the change in the occupation of every MO for every excited state with a single scatter-add.
+    :param amplitudes: the flat configuration arrays returned by get_td_amplitudes
+    :param sparse: if true, the matrices are built as scipy.sparse CSR matrices holding only the MOs of the
+        configurations of every state
+    :param dtype: the floating point type of the matrices, the weights are summed in double precision either way
+    :return: the alpha and beta delta diagonal matrices, with a row for every excited state
+    """
+    state_indices, from_mo, to_mo, beta, amplitudes = amplitudes
+    weights = (TD_MULTIPLIERS[basic.scf_type] * (np.square(amplitudes.real) + np.square(amplitudes.imag))).astype(amplitudes.dtype)
+    # Every configuration moves its weight from its from MO to its to MO, in the order of the .log file
+    rows = np.column_stack((beta * n_excitation + state_indices, beta * n_excitation + state_indices)).ravel()
+    columns = np.column_stack((from_mo, to_mo)).ravel()
+    values = np.column_stack((-weights, weights)).ravel()
+    if np.iscomplexobj(amplitudes):
+        dtype = precision.get_complex_dtype(dtype)
+    if sparse:
+        delta_diagonal_matrices = sps.csr_matrix((values, (rows, columns)), shape=(2 * n_excitation, n_active_space_mo))
+        delta_diagonal_matrices = delta_diagonal_matrices.astype(dtype, copy=False)
+        return delta_diagonal_matrices[:n_excitation], delta_diagonal_matrices[n_excitation:]
+    delta_diagonal_matrices = np.zeros((2 * n_excitation, n_active_space_mo), dtype=amplitudes.dtype)
+    np.add.at(delta_diagonal_matrices, (rows, columns), values)
+    delta_diagonal_matrices = delta_diagonal_matrices.astype(dtype, copy=False)
+    return delta_diagonal_matrices[:n_excitation], delta_diagonal_matrices[n_excitation:]
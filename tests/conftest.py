@@ -0,0 +1,32 @@
+import synthetic_logs
+import pytest
+import os
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "doc", "data")
+SAMPLE_LOGS = ["water_td-rhf", "Na_uhf", "ammonia_casscf_pop"]
+
+
+def get_sample_log(name: str) -> str:
+    return os.path.join(DATA_DIR, name + ".log")
+
+
+@pytest.fixture(scope="session")
+def synthetic_log_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp("logs")
+
+
+@pytest.fixture(scope="session")
+def td_jobs_log(synthetic_log_dir):
+    """
+    A finished Gaussian log of 3 TD jobs.
+    """
+    return synthetic_logs.write_log(str(synthetic_log_dir / "water_td_jobs.log"), template="water_td-rhf",
+                                    n_excited_state=20, n_job=3)
+
+
+@pytest.fixture(scope="session")
+def cas_log(synthetic_log_dir):
+    """
+    A finished Gaussian log of a CAS job, no sample CAS log with roots is available.
+    """
+    return synthetic_logs.write_log(str(synthetic_log_dir / "water_cas.log"), template="water_td-rhf", n_cas_root=6)
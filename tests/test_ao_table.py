@@ -0,0 +1,69 @@
+from fasma.core import boxes as bx
+from fasma.core import df_filters as dff
+from fasma.core import df_generators as dfg
+from fasma.core import file_compressor as fc
+from conftest import get_sample_log
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(scope="module")
+def water_box():
+    return fc.parse(get_sample_log("water_td-rhf"))
+
+
+def test_ao_table_round_trip():
+    rows = [["1", "O", "1", "S", "S"], ["1", "O", "2", "P", "PX"], ["2", "H", "1", "S", "S"], ["1", "O", "2", "P", "PY"]]
+    ao_table = bx.AOTable.from_rows(rows)
+    assert ao_table.shape == (4, 5)
+    np.testing.assert_array_equal(ao_table.to_array(), np.array(rows))
+    np.testing.assert_array_equal(ao_table.tile(3).to_array(), np.tile(np.array(rows), (3, 1)))
+    # Categories are kept in the order they first appear
+    assert list(ao_table.get_column("Atom Type").categories) == ["O", "H"]
+
+
+def test_get_ao_dataframe_of_array(water_box):
+    ao_table = water_box.pop_data.ao_matrix
+    ao_df = dfg.get_ao_dataframe(ao_table)
+    array_ao_df = dfg.get_ao_dataframe(ao_table.to_array())
+    assert list(array_ao_df.columns) == list(bx.AOTable.COLUMNS)
+    assert not any(isinstance(dtype, pd.CategoricalDtype) for dtype in array_ao_df.dtypes)
+    pd.testing.assert_frame_equal(ao_df.astype(str), array_ao_df.astype(str))
+
+
+def test_ao_transition_dataframe_of_array(water_box):
+    spectra_data = water_box.spectra_data
+    ao_table = water_box.pop_data.ao_matrix
+    ao_transition_tensor = water_box.generate_ao_transition_tensor()
+    for long_format in (False, True):
+        ao_df = dfg.get_ao_transition_dataframe(spectra_data.methodology, spectra_data.excitation_matrix, ao_table,
+                                                ao_transition_tensor, long_format)
+        array_ao_df = dfg.get_ao_transition_dataframe(spectra_data.methodology, spectra_data.excitation_matrix,
+                                                      ao_table.to_array(), ao_transition_tensor, long_format)
+        ao_columns = list(bx.AOTable.COLUMNS)
+        ao_df, array_ao_df = ao_df.reset_index(), array_ao_df.reset_index()
+        ao_df[ao_columns] = ao_df[ao_columns].astype(str)
+        array_ao_df[ao_columns] = array_ao_df[ao_columns].astype(str)
+        pd.testing.assert_frame_equal(ao_df, array_ao_df)
+
+
+@pytest.mark.parametrize("index", [["Atom Type"], ["Atom Number", "Atom Type"], ["Atom Type", "Subshell"]])
+def test_categorical_levels_keep_observed_groups(water_box, index):
+    ao_df = water_box.generate_ao_transition_analysis()
+    # The same analysis with plain string levels, as before the levels were categorical
+    string_ao_df = ao_df.copy()
+    string_ao_df.index = pd.MultiIndex.from_arrays(
+        [level.astype(str) if name in bx.AOTable.COLUMNS else level
+         for name, level in zip(ao_df.index.names, (ao_df.index.get_level_values(i) for i in range(ao_df.index.nlevels)))],
+        names=ao_df.index.names)
+    plotting_df = dfg.get_plotting_dataframe(dff.filter_transition_rows(ao_df, index), mo_breakdown=True)
+    string_plotting_df = dfg.get_plotting_dataframe(dff.filter_transition_rows(string_ao_df, index), mo_breakdown=True)
+    # Combinations of labels that never occur are left out whatever the default of observed in groupby
+    assert len(plotting_df) == len(string_plotting_df)
+    assert not plotting_df.isna().any().any()
+    spectra_dict = dfg.get_spectra_dict(plotting_df)
+    string_spectra_dict = dfg.get_spectra_dict(string_plotting_df)
+    assert list(spectra_dict) == list(string_spectra_dict)
+    for name, spectrum in spectra_dict.items():
+        np.testing.assert_allclose(spectrum.y, string_spectra_dict[name].y)
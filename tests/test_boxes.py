@@ -0,0 +1,40 @@
+from fasma.core import file_compressor as fc
+from conftest import get_sample_log
+import pytest
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+@pytest.mark.parametrize("sections, method, missing_section", [
+    ({"basic", "td"}, "generate_ao_transition_analysis", "pop.mo"),
+    ({"basic", "td"}, "generate_mo_analysis", "pop.mo"),
+    ({"basic", "pop.overlap"}, "generate_mo_analysis", "pop.mo"),
+    ({"basic", "pop.mo"}, "generate_mo_analysis", "pop.overlap"),
+    ({"basic", "td", "pop.mo"}, "generate_ao_transition_analysis", "pop.overlap"),
+    ({"basic", "td", "pop.overlap"}, "generate_ao_transition_analysis", "pop.mo"),
+    ({"basic", "pop.mo", "pop.overlap"}, "generate_ao_transition_analysis", "td or cas"),
+    ({"basic", "pop.mo", "pop.overlap"}, "generate_mo_transition_analysis", "td or cas"),
+    ({"basic", "pop.density"}, "generate_merged_mo_transition_analysis", "td or cas"),
+])
+def test_missing_sections(sections, method, missing_section, lazy):
+    box = fc.parse(get_sample_log("water_td-rhf"), lazy=lazy, sections=sections)
+    with pytest.raises(ValueError, match=f"matrices of the {missing_section} section"):
+        getattr(box, method)()
+
+
+@pytest.mark.parametrize("sections, method", [
+    ({"basic", "td"}, "generate_mo_transition_analysis"),
+    ({"basic", "pop.mo", "pop.overlap"}, "generate_mo_analysis"),
+    ({"basic", "td", "pop.mo", "pop.overlap"}, "generate_ao_transition_analysis"),
+])
+def test_section_subsets(sections, method):
+    box = fc.parse(get_sample_log("water_td-rhf"), sections=sections)
+    assert getattr(box, method)().equals(getattr(fc.parse(get_sample_log("water_td-rhf")), method)())
+
+
+def test_missing_beta_data():
+    box = fc.parse(get_sample_log("water_td-rhf"))
+    # An RHF job has no beta delta diagonals nor beta MO coefficients
+    with pytest.raises(ValueError, match="beta matrices of the td or cas section"):
+        box.generate_ao_transition_analysis("beta")
+    # The MO analysis of the beta electrons of an RHF job is the one of the alpha electrons
+    assert box.generate_mo_analysis("beta").equals(box.generate_mo_analysis())
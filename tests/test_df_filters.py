@@ -0,0 +1,39 @@
+from fasma.core import file_compressor as fc
+from fasma.core import df_filters as dff
+from conftest import get_sample_log
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def water_box():
+    return fc.parse(get_sample_log("water_td-rhf"))
+
+
+@pytest.mark.parametrize("custom_mo", [{"lone pair": [5], "antibonding": [6, 7]}, [4, 6], {}])
+def test_long_transition_columns(water_box, custom_mo):
+    wide_df = dff.filter_transition_columns(water_box.generate_mo_transition_analysis(), custom_mo,
+                                            water_box.basic_data)
+    long_df = dff.filter_long_transition_columns(water_box.generate_mo_transition_analysis(long_format=True),
+                                                 custom_mo, water_box.basic_data)
+    # The long frame only holds the groups of the non-zero MOs of every transition
+    group_columns = wide_df.columns[wide_df.columns.get_loc("core"):]
+    assert list(long_df.index.get_level_values("MO Group").categories) == list(group_columns)
+    long_values = long_df["value"].unstack("MO Group").reindex(index=wide_df.index, columns=group_columns)
+    np.testing.assert_allclose(long_values.fillna(0).to_numpy(), wide_df[group_columns].to_numpy(), rtol=0,
+                               atol=1e-12)
+    attribute_columns = [column for column in long_df.columns if column != "value"]
+    long_attributes = long_df[attribute_columns].groupby(level=[0, 1]).first()
+    assert long_attributes.equals(wide_df.loc[long_attributes.index, attribute_columns])
+
+
+def test_long_nonzero_mo(water_box):
+    assert dff.get_long_nonzero_mo(water_box.generate_mo_transition_analysis(long_format=True)) == \
+           dff.get_nonzero_mo(water_box.generate_mo_transition_analysis())
+
+
+@pytest.mark.parametrize("custom_mo", [{"outside": [5, 14]}, [0], [-1]])
+def test_long_transition_columns_out_of_range(water_box, custom_mo):
+    long_df = water_box.generate_mo_transition_analysis(long_format=True)
+    with pytest.raises(ValueError, match="are not between 1 and 13"):
+        dff.filter_long_transition_columns(long_df, custom_mo, water_box.basic_data)
@@ -0,0 +1,121 @@
+from fasma.core.keyword_trie import KeywordIndex as kt
+from fasma.core import file_reader as fr
+from fasma.core import keyword_trie
+from fasma.core import line_store as ls
+from fasma.gaussian import parse_gaussian as pg
+from conftest import SAMPLE_LOGS, get_sample_log
+import numpy as np
+import pytest
+
+WORDS = frozenset(["Eigenvalues", "Excited", "State", "NDet=", "#", "9/", "Overlap"])
+TEXT = (b"#p td\n Excited State   1:  Singlet-A1  7.8 eV\n\tState=2 #N 9/10=1\n Alpha  occ. Eigenvalues --  -20.5\n"
+        b" x\x01Excited Stat\x0bState Eig 9 9/ NDet=  12\nOverlap\r\n1.0 2.0\n#")
+
+
+def get_line_store(buffer) -> ls.LineStore:
+    return ls.LineStore(buffer, ls.find_line_offsets(buffer))
+
+
+def find_reference_token_starts(buffer, words) -> list:
+    """
+    Finds the tokens starting with the first two bytes of a word (or a word of one byte) one token at a time.
+    """
+    prefixes = {word.encode()[:2] for word in words}
+    token_starts = []
+    for position in range(len(buffer)):
+        if position > 0 and buffer[position - 1: position] not in b" \t\n\r\v\f":
+            continue
+        if buffer[position: position + 1] in b" \t\n\r\v\f":
+            continue
+        token = buffer[position:].split()[0]
+        if token[:2] in prefixes or token[:1] in prefixes:
+            token_starts.append(position)
+    return token_starts
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5, 13, 1 << 26])
+def test_find_token_starts(chunk_size, monkeypatch):
+    monkeypatch.setattr(ls, "SCAN_CHUNK_SIZE", chunk_size)
+    matcher = fr.KeywordMatcher(WORDS)
+    np.testing.assert_array_equal(matcher.find_token_starts(TEXT, 0, len(TEXT)), find_reference_token_starts(TEXT, WORDS))
+    # A range of the buffer
+    start = TEXT.index(b"\tState")
+    expected = [position for position in find_reference_token_starts(TEXT, WORDS) if start <= position < len(TEXT) - 10]
+    np.testing.assert_array_equal(matcher.find_token_starts(TEXT, start, len(TEXT) - 10), expected)
+
+
+def test_get_matched_words():
+    matcher = fr.KeywordMatcher(frozenset(["Eigen", "Eigenvalues", "E", "State"]))
+    assert matcher.get_matched_words("Eigenvalues--") == ["Eigenvalues", "Eigen", "E"]
+    assert matcher.get_matched_words("Stat") == []
+    assert matcher.get_matched_words("State=2") == ["State"]
+
+
+def index_lines(file_lines) -> kt:
+    """
+    Indexes every token of every keyword line, as the Gaussian reader did before it only indexed registered words.
+    """
+    current_kt = kt()
+    for current_index in range(len(file_lines)):
+        fr.check_line(file_lines[current_index], current_kt, current_index + 1)
+    return current_kt
+
+
+def assert_same_keys(current_kt, reference_kt, sections=None):
+    for section, keys in keyword_trie.REGISTERED_KEYS.items():
+        if sections is None or section in sections:
+            for key in keys:
+                assert current_kt.find(key) == reference_kt.find(key), key
+
+
+def test_index_keywords():
+    file_lines = get_line_store(TEXT)
+    current_kt = fr.index_keywords(file_lines, WORDS)
+    reference_kt = index_lines(file_lines)
+    for key in ["Excited State", "State", "Eigenvalues", "NDet=", "#", "9/", "Overlap", "State Excited"]:
+        assert current_kt.find(key) == reference_kt.find(key), key
+    assert current_kt.find("Singlet-A1") is None
+
+
+@pytest.mark.parametrize("name", SAMPLE_LOGS)
+def test_index_gaussian_job_matches_every_token(name):
+    for file_lines in fr.split_gaussian_jobs(fr.map_file(get_sample_log(name))):
+        current_kt = fr.index_gaussian_job(file_lines, pg.get_words())
+        assert_same_keys(current_kt, index_lines(file_lines))
+
+
+def test_index_synthetic_logs(td_jobs_log, cas_log):
+    for filename in (td_jobs_log, cas_log):
+        for file_lines in fr.split_gaussian_jobs(fr.map_file(filename)):
+            current_kt = fr.index_gaussian_job(file_lines, pg.get_words())
+            assert_same_keys(current_kt, index_lines(file_lines))
+
+
+def test_index_sections():
+    file_lines = fr.split_gaussian_jobs(fr.map_file(get_sample_log("water_td-rhf")))[0]
+    current_kt = fr.index_gaussian_job(file_lines, pg.get_words({"basic", "td"}))
+    assert_same_keys(current_kt, index_lines(file_lines), {"basic", "td"})
+    assert current_kt.find("Eigenvalues") is None
+
+
+def test_index_in_parts():
+    file_lines = fr.split_gaussian_jobs(fr.map_file(get_sample_log("water_td-rhf")))[0]
+    middle = len(file_lines) // 2
+    current_kt = fr.index_gaussian_job(file_lines, pg.get_words(), end=middle)
+    current_kt = fr.index_gaussian_job(file_lines, pg.get_words(), current_kt, start=middle)
+    assert_same_keys(current_kt, index_lines(file_lines))
+
+
+def test_get_registered_words():
+    assert {"Excited", "State", "Rotatory", "Strength"} <= pg.get_words({"td"})
+    assert "Eigenvalues" not in pg.get_words({"td"})
+    assert pg.get_words({"td"}) | pg.get_words({"pop.mo"}) == pg.get_words({"td", "pop.mo"})
+    assert pg.get_words() == keyword_trie.get_registered_words()
+
+
+def test_read_requires_gaussian_words():
+    with pytest.raises(ValueError):
+        fr.read(get_sample_log("water_td-rhf"))
+    key_tries, _, file_type = fr.read(get_sample_log("water_td-rhf"), pg.get_words({"td"}))
+    assert file_type == "Gaussian"
+    assert key_tries[0].find("Excited State") is not None and key_tries[0].find("Eigenvalues") is None
@@ -0,0 +1,94 @@
+from fasma.core import boxes as bx
+from fasma.core import file_compressor as fc
+from conftest import get_sample_log
+from dataclasses import fields
+import numpy as np
+import pickle
+import pytest
+
+
+def is_loaded(data, name: str) -> bool:
+    return name in vars(data)
+
+
+def test_pickle_keeps_ao_projection_unloaded():
+    box = fc.parse(get_sample_log("Na_uhf"), lazy=True)
+    copy = pickle.loads(pickle.dumps(box))
+    for beta in (False, True):
+        electron_data = box.pop_data.beta_electron_data if beta else box.pop_data.electron_data
+        copy_electron_data = copy.pop_data.beta_electron_data if beta else copy.pop_data.electron_data
+        # Pickling computes neither the original projection nor the one of the copy
+        assert not is_loaded(electron_data, "ao_projection_matrix")
+        assert not is_loaded(copy_electron_data, "ao_projection_matrix")
+        np.testing.assert_array_equal(copy_electron_data.mo_coefficient_matrix, electron_data.mo_coefficient_matrix)
+        np.testing.assert_array_equal(copy_electron_data.ao_projection_matrix, electron_data.ao_projection_matrix)
+    # The loader of the copy refers to the copy
+    assert copy.pop_data.electron_data._loaders == {}
+    assert type(copy.pop_data) is bx.PopData
+
+
+def test_pickle_loaded_data_is_eager():
+    box = fc.parse(get_sample_log("water_td-rhf"), lazy=True)
+    box.pop_data.load()
+    box.pop_data.electron_data.load()
+    copy = pickle.loads(pickle.dumps(box))
+    assert type(copy.pop_data) is bx.PopData
+    assert type(copy.pop_data.electron_data) is bx.ElectronData
+    np.testing.assert_array_equal(copy.pop_data.electron_data.ao_projection_matrix,
+                                  box.pop_data.electron_data.ao_projection_matrix)
+
+
+def test_eager_data_is_plain():
+    pop_data = fc.parse(get_sample_log("Na_uhf")).pop_data
+    assert type(pop_data) is bx.PopData
+    assert type(pop_data.electron_data) is bx.ElectronData
+    assert type(pop_data.beta_electron_data) is bx.BetaData
+    # The eager parse computes the whole projection matrices
+    assert pop_data.electron_data.ao_projection_matrix is not None
+    assert pop_data.beta_electron_data.ao_projection_matrix is not None
+    assert "_ao_projection_blocks" not in [data_field.name for data_field in fields(pop_data)]
+    assert "_ao_projection_blocks" not in repr(pop_data)
+
+
+def test_ao_projection_blocks():
+    box = fc.parse(get_sample_log("water_td-rhf"), lazy=True)
+    pop_data = box.pop_data
+    mo_indices = [0, 4, 3]
+    columns = pop_data.get_ao_projection_columns(mo_indices)
+    assert pop_data._ao_projection_blocks
+    # The blocks are not pickled
+    assert pickle.loads(pickle.dumps(pop_data))._ao_projection_blocks == {}
+    ao_projection_matrix = pop_data.electron_data.ao_projection_matrix
+    # The blocks are dropped once the whole matrix is computed, which is sliced from then on
+    assert pop_data._ao_projection_blocks == {}
+    np.testing.assert_allclose(columns, ao_projection_matrix[:, mo_indices], atol=1e-12)
+    np.testing.assert_array_equal(pop_data.get_ao_projection_columns(mo_indices), ao_projection_matrix[:, mo_indices])
+    assert pop_data._ao_projection_blocks == {}
+
+
+def test_ao_projection_blocks_per_spin():
+    box = fc.parse(get_sample_log("Na_uhf"), lazy=True)
+    pop_data = box.pop_data
+    pop_data.get_ao_projection_columns([1], beta=False)
+    pop_data.get_ao_projection_columns([1], beta=True)
+    assert pop_data.beta_electron_data.ao_projection_matrix is not None
+    assert {beta for beta, _ in pop_data._ao_projection_blocks} == {False}
+
+
+def test_set_loader():
+    electron_data = bx.LazyElectronData(eigenvalues=np.arange(3))
+    electron_data.set_loader("eigenvalues", lambda: np.zeros(3))
+    # A loaded field keeps its value
+    np.testing.assert_array_equal(electron_data.eigenvalues, np.arange(3))
+    electron_data.set_loader("density_matrix", lambda: np.eye(2))
+    np.testing.assert_array_equal(electron_data.density_matrix, np.eye(2))
+    assert electron_data.ao_projection_matrix is None
+
+
+def test_parse_cache_keeps_ao_projection(tmp_path):
+    filename = get_sample_log("water_td-rhf")
+    box = fc.parse(filename, cache=str(tmp_path), lazy=True)
+    cached_box = fc.parse(filename, cache=str(tmp_path), lazy=True)
+    assert not is_loaded(cached_box.pop_data.electron_data, "ao_projection_matrix")
+    np.testing.assert_array_equal(cached_box.pop_data.electron_data.ao_projection_matrix,
+                                  box.pop_data.electron_data.ao_projection_matrix)
@@ -0,0 +1,160 @@
+from fasma.core import file_compressor as fc
+from fasma.core import log_follower as lf
+from conftest import get_sample_log
+import numpy as np
+import pytest
+
+
+def assert_same_box(box, expected_box):
+    assert box.basic_data == expected_box.basic_data
+    if expected_box.spectra_data is None:
+        assert box.spectra_data is None
+    else:
+        np.testing.assert_allclose(box.spectra_data.excitation_matrix, expected_box.spectra_data.excitation_matrix)
+        np.testing.assert_allclose(box.spectra_data.delta_diagonal_matrix, expected_box.spectra_data.delta_diagonal_matrix)
+
+
+def append_in_chunks(source, target, n_chunk):
+    with open(source, "rb") as f:
+        data = f.read()
+    bounds = np.linspace(0, len(data), n_chunk + 1).astype(int)
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        with open(target, "ab") as f:
+            f.write(data[start: end])
+        yield
+
+
+def test_finished_multi_job_log_in_one_poll(td_jobs_log):
+    follower = lf.LogFollower(td_jobs_log)
+    assert follower.update()
+    expected_boxes = fc.parse(td_jobs_log)
+    assert len(follower.boxes) == len(expected_boxes) == 3
+    for box, expected_box in zip(follower.boxes, expected_boxes):
+        assert_same_box(box, expected_box)
+    assert follower.partial_box is None
+    assert not follower.update()
+
+
+@pytest.mark.parametrize("n_chunk", [2, 7, 50])
+def test_log_written_in_chunks(td_jobs_log, tmp_path, n_chunk):
+    target = str(tmp_path / "running.log")
+    open(target, "wb").close()
+    follower = lf.LogFollower(target)
+    for _ in append_in_chunks(td_jobs_log, target, n_chunk):
+        follower.update()
+        # Only the finished jobs are in boxes, the running one is partial
+        assert len(follower.get_boxes()) <= 3
+    for box, expected_box in zip(follower.boxes, fc.parse(td_jobs_log)):
+        assert_same_box(box, expected_box)
+    assert len(follower.boxes) == 3
+
+
+def test_partial_box_holds_the_states_printed_so_far(tmp_path):
+    source = get_sample_log("water_td-rhf")
+    with open(source, "rb") as f:
+        lines = f.read().split(b"\n")
+    # Cut the job after the third excited state
+    cut = [index for index, line in enumerate(lines) if line.startswith(b" Excited State")][3]
+    target = str(tmp_path / "running.log")
+    with open(target, "wb") as f:
+        f.write(b"\n".join(lines[:cut]) + b"\n")
+    follower = lf.LogFollower(target)
+    follower.update()
+    assert follower.boxes == []
+    partial_excitation_matrix = follower.partial_box.spectra_data.excitation_matrix
+    assert len(partial_excitation_matrix) == 3
+    expected_excitation_matrix = fc.parse(source).spectra_data.excitation_matrix
+    np.testing.assert_allclose(partial_excitation_matrix, expected_excitation_matrix[:3])
+
+
+def test_truncated_file_raises(td_jobs_log, tmp_path):
+    target = str(tmp_path / "running.log")
+    with open(td_jobs_log, "rb") as f:
+        data = f.read()
+    with open(target, "wb") as f:
+        f.write(data[:len(data) // 2])
+    follower = lf.LogFollower(target)
+    follower.update()
+    with open(target, "wb") as f:
+        f.write(data[:100])
+    with pytest.raises(OSError):
+        follower.update()
+
+
+def test_only_uncompressed_logs_can_be_followed():
+    with pytest.raises(ValueError):
+        lf.LogFollower("job.log.gz")
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+@pytest.mark.parametrize("log_name", ["td_jobs_log", "cas_log"])
+def test_partial_box_grows_with_the_log(log_name, sparse, tmp_path, request):
+    source = request.getfixturevalue(log_name)
+    expected_boxes = fc.parse(source, sparse=sparse)
+    expected_boxes = expected_boxes if isinstance(expected_boxes, list) else [expected_boxes]
+    target = str(tmp_path / "running.log")
+    open(target, "wb").close()
+    follower = lf.LogFollower(target, sparse=sparse)
+    n_checked = 0
+    for _ in append_in_chunks(source, target, 200):
+        follower.update()
+        if follower.partial_box is None or follower.partial_box.spectra_data is None:
+            continue
+        spectra_data = follower.partial_box.spectra_data
+        expected_spectra_data = expected_boxes[len(follower.boxes)].spectra_data
+        n_excitation = len(spectra_data.excitation_matrix)
+        expected_excitation_matrix = expected_spectra_data.excitation_matrix[:n_excitation]
+        # The oscillator strengths of the last CAS roots may not be printed yet
+        np.testing.assert_allclose(spectra_data.excitation_matrix[:, :3], expected_excitation_matrix[:, :3])
+        printed = ~np.isnan(spectra_data.excitation_matrix[:, 3])
+        np.testing.assert_allclose(spectra_data.excitation_matrix[printed, 3:], expected_excitation_matrix[printed, 3:])
+        delta_diagonal_matrix = spectra_data.delta_diagonal_matrix
+        expected_delta_diagonal_matrix = expected_spectra_data.delta_diagonal_matrix
+        if sparse:
+            assert isinstance(delta_diagonal_matrix, type(expected_delta_diagonal_matrix))
+            delta_diagonal_matrix, expected_delta_diagonal_matrix = (delta_diagonal_matrix.toarray(),
+                                                                     expected_delta_diagonal_matrix.toarray())
+        # The configurations of the last excited state may not be printed completely yet
+        np.testing.assert_allclose(delta_diagonal_matrix[:-1], expected_delta_diagonal_matrix[:n_excitation - 1],
+                                   atol=1e-14)
+        n_checked += 1
+    assert n_checked > 0
+
+
+def test_running_job_only_parses_new_states(tmp_path, monkeypatch):
+    source = get_sample_log("water_td-rhf")
+    n_parsed_state = []
+    get_td_amplitudes = lf.pg.parse_td.get_td_amplitudes
+
+    def count_states(basic, file_lines, state_lines):
+        n_parsed_state.append(len(state_lines))
+        return get_td_amplitudes(basic, file_lines, state_lines)
+
+    monkeypatch.setattr(lf.pg.parse_td, "get_td_amplitudes", count_states)
+    target = str(tmp_path / "running.log")
+    open(target, "wb").close()
+    follower = lf.LogFollower(target)
+    chunks = append_in_chunks(source, target, 100)
+    while follower.partial_box is None:
+        next(chunks)
+        follower.update()
+    parse = lf.pg.parse
+
+    def parse_finished_job(*args, partial=False, **kwargs):
+        # Once the basic data is parsed, the running job is never parsed as a whole again
+        assert not partial
+        return parse(*args, **kwargs)
+
+    monkeypatch.setattr(lf.pg, "parse", parse_finished_job)
+    n_update = 0
+    for _ in chunks:
+        follower.update()
+        if follower.boxes:
+            # The states of the finished job are all parsed once
+            assert n_parsed_state.pop() == len(follower.boxes[0].spectra_data.excitation_matrix)
+            break
+        n_update += 1
+    n_state = len(follower.boxes[0].spectra_data.excitation_matrix)
+    # Every update parses the new states and the last one parsed before
+    assert sum(n_parsed_state) == n_state + len(n_parsed_state) - 1
+    assert len(n_parsed_state) < n_update
@@ -0,0 +1,112 @@
+from fasma.core import file_compressor as fc
+from fasma.core import file_reader as fr
+from fasma.core import parse_cache as pc
+from conftest import get_sample_log
+import numpy as np
+import hashlib
+import shutil
+import os
+import pytest
+
+
+def get_entry_path(cache, key):
+    return os.path.join(cache.entry_dir, key + ".pkl")
+
+
+@pytest.mark.parametrize("chunk_size", [7, 1 << 24])
+def test_hash_file(tmp_path, chunk_size, monkeypatch):
+    monkeypatch.setattr(pc, "HASH_CHUNK_SIZE", chunk_size)
+    data = os.urandom(1000)
+    filename = tmp_path / "data.log"
+    filename.write_bytes(data)
+    assert pc.hash_file(filename) == hashlib.blake2b(data, digest_size=20).hexdigest()
+    empty_filename = tmp_path / "empty.log"
+    empty_filename.write_bytes(b"")
+    assert pc.hash_file(empty_filename) == hashlib.blake2b(digest_size=20).hexdigest()
+
+
+def test_content_hash_remembered(tmp_path, monkeypatch):
+    cache = pc.ParseCache(str(tmp_path / "cache"))
+    filename = tmp_path / "data.log"
+    filename.write_bytes(b"first")
+    content_hash = cache.get_content_hash(filename)
+    # The hash of an unchanged path is not computed again
+    monkeypatch.setattr(pc, "hash_file", lambda filename: pytest.fail("the file was hashed again"))
+    assert cache.get_content_hash(filename) == content_hash
+    monkeypatch.undo()
+    filename.write_bytes(b"second")
+    os.utime(filename, ns=(0, 10 ** 9))
+    assert cache.get_content_hash(filename) == pc.hash_file(filename) != content_hash
+
+
+def test_get_key(tmp_path):
+    cache = pc.ParseCache(str(tmp_path / "cache"))
+    filename = tmp_path / "data.log"
+    filename.write_bytes(b"content")
+    copy_filename = tmp_path / "copy.log"
+    shutil.copy(filename, copy_filename)
+    key = cache.get_key(filename, sections=None)
+    # Keys depend on the content and the options, not on the path or the order of the options
+    assert cache.get_key(copy_filename, sections=None) == key
+    assert cache.get_key(filename, sections=["td"]) != key
+    assert cache.get_key(filename, sections=None, sparse=True) == cache.get_key(filename, sparse=True, sections=None)
+    copy_filename.write_bytes(b"other content")
+    assert cache.get_key(copy_filename, sections=None) != key
+
+
+def test_store_and_load(tmp_path):
+    cache = pc.ParseCache(str(tmp_path / "cache"))
+    assert cache.load("missing") is None
+    item = {"matrix": np.arange(6).reshape(2, 3)}
+    cache.store("key", item)
+    np.testing.assert_array_equal(cache.load("key")["matrix"], item["matrix"])
+    # A broken entry is a cache miss
+    with open(get_entry_path(cache, "key"), "wb") as f:
+        f.write(b"not a pickle")
+    assert cache.load("key") is None
+    cache.clear()
+    assert os.listdir(cache.entry_dir) == [] and os.listdir(cache.stat_dir) == []
+
+
+def test_evict_least_recently_used(tmp_path):
+    cache = pc.ParseCache(str(tmp_path / "cache"))
+    keys = ["a", "b", "c"]
+    for mtime, key in enumerate(keys, start=1):
+        cache.store(key, b"x" * 1000)
+        os.utime(get_entry_path(cache, key), ns=(mtime * 10 ** 9, mtime * 10 ** 9))
+    entry_size = os.path.getsize(get_entry_path(cache, "a"))
+    cache.max_size = 3 * entry_size
+    # Loading "a" makes "b" the least recently used entry
+    assert cache.load("a") == b"x" * 1000
+    cache.store("d", b"x" * 1000)
+    assert sorted(os.listdir(cache.entry_dir)) == ["a.pkl", "c.pkl", "d.pkl"]
+    cache.max_size = entry_size
+    cache.evict()
+    assert os.listdir(cache.entry_dir) == ["d.pkl"]
+
+
+def test_get_cache(tmp_path, monkeypatch):
+    assert pc.get_cache(None) is None
+    assert pc.get_cache(False) is None
+    cache = pc.ParseCache(str(tmp_path / "cache"))
+    assert pc.get_cache(cache) is cache
+    assert pc.get_cache(tmp_path / "other").cache_dir == str(tmp_path / "other")
+    monkeypatch.setenv("FASMA_CACHE_DIR", str(tmp_path / "default"))
+    assert pc.get_cache(True).cache_dir == str(tmp_path / "default")
+
+
+def test_parse_with_cache(tmp_path, monkeypatch):
+    filename = get_sample_log("water_td-rhf")
+    box = fc.parse(filename, cache=str(tmp_path))
+    real_read = fr.read
+    # A cache hit reads nothing
+    monkeypatch.setattr(fr, "read", lambda *args, **kwargs: pytest.fail("the file was parsed again"))
+    cached_box = fc.parse(filename, cache=str(tmp_path))
+    np.testing.assert_array_equal(cached_box.spectra_data.excitation_matrix, box.spectra_data.excitation_matrix)
+    np.testing.assert_array_equal(cached_box.pop_data.electron_data.mo_coefficient_matrix,
+                                  box.pop_data.electron_data.mo_coefficient_matrix)
+    # Other options are cached apart
+    monkeypatch.setattr(fr, "read", real_read)
+    td_box = fc.parse(filename, cache=str(tmp_path), sections={"basic", "td"})
+    assert td_box.pop_data is None
+    assert fc.parse(filename, cache=str(tmp_path)).pop_data is not None
@@ -0,0 +1,104 @@
+from fasma.core import file_compressor as fc
+from fasma.core import boxes as bx
+from conftest import SAMPLE_LOGS, get_sample_log
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import os
+import pytest
+
+MAIN_PID = os.getpid()
+
+
+class CrashingPath(os.PathLike):
+    """
+    A path that kills the worker process parsing it, like a file that runs a worker out of memory.
+    """
+    def __fspath__(self):
+        if os.getpid() != MAIN_PID:
+            os._exit(1)
+        return "crashing.log"
+
+    def __repr__(self):
+        return "CrashingPath()"
+
+
+def get_paths(tmp_path) -> list:
+    missing_path = str(tmp_path / "missing.log")
+    return [get_sample_log(name) for name in SAMPLE_LOGS] * 2 + [missing_path]
+
+
+def check_results(results, paths):
+    assert sorted(map(repr, (path for path, _ in results))) == sorted(map(repr, paths))
+    for path, result in results:
+        if isinstance(path, CrashingPath):
+            assert isinstance(result, BrokenProcessPool)
+        elif "missing" in os.fspath(path):
+            assert isinstance(result, OSError)
+        else:
+            assert isinstance(result, bx.Box), result
+
+
+@pytest.mark.parametrize("chunksize", [1, 2])
+def test_parse_many_failure_isolation(tmp_path, chunksize):
+    paths = get_paths(tmp_path)
+    results = list(fc.parse_many(paths, n_workers=2, chunksize=chunksize))
+    check_results(results, paths)
+
+
+def test_parse_many_crashing_worker(tmp_path):
+    paths = get_paths(tmp_path)
+    paths.insert(1, CrashingPath())
+    results = list(fc.parse_many(paths, n_workers=2))
+    # Only the file that killed its worker is lost, the files after it are still parsed
+    check_results(results, paths)
+    assert sum(isinstance(result, BrokenProcessPool) for _, result in results) == 1
+
+
+def test_parse_many_crashing_chunk(tmp_path):
+    paths = get_paths(tmp_path)
+    paths.insert(4, CrashingPath())
+    results = list(fc.parse_many(paths, n_workers=2, chunksize=2))
+    # The other file of the chunk of the crashing one is lost with it
+    assert sorted(map(repr, (path for path, _ in results))) == sorted(map(repr, paths))
+    assert sum(isinstance(result, BrokenProcessPool) for _, result in results) == 2
+
+
+def test_parse_many_max_in_flight(tmp_path, monkeypatch):
+    paths = get_paths(tmp_path) * 2
+    n_yielded = [0]
+    in_flight = []
+
+    class CountingExecutor(ProcessPoolExecutor):
+        n_submitted = 0
+
+        def submit(self, *args, **kwargs):
+            CountingExecutor.n_submitted += 1
+            in_flight.append(CountingExecutor.n_submitted - n_yielded[0])
+            return super().submit(*args, **kwargs)
+
+    monkeypatch.setattr(fc, "ProcessPoolExecutor", CountingExecutor)
+    results = []
+    for result in fc.parse_many(paths, n_workers=2, max_in_flight=3):
+        results.append(result)
+        n_yielded[0] += 1
+    check_results(results, paths)
+    assert max(in_flight) == 3
+
+
+def test_parse_many_directory(tmp_path):
+    for name in SAMPLE_LOGS:
+        os.symlink(get_sample_log(name), tmp_path / (name + ".log"))
+    (tmp_path / "notes.txt").write_text("not a log")
+    results = dict(fc.parse_many(str(tmp_path), n_workers=2))
+    assert sorted(results) == sorted(str(tmp_path / (name + ".log")) for name in SAMPLE_LOGS)
+
+
+def test_parse_parallel(td_jobs_log):
+    box_list = fc.parse(td_jobs_log)
+    parallel_box_list = fc.parse(td_jobs_log, n_workers=2)
+    assert len(parallel_box_list) == len(box_list) == 3
+    for box, parallel_box in zip(box_list, parallel_box_list):
+        np.testing.assert_array_equal(parallel_box.spectra_data.excitation_matrix, box.spectra_data.excitation_matrix)
+        np.testing.assert_array_equal(parallel_box.spectra_data.delta_diagonal_matrix,
+                                      box.spectra_data.delta_diagonal_matrix)
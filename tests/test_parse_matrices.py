@@ -0,0 +1,102 @@
+from fasma.core import file_compressor as fc
+from fasma.gaussian import parse_matrices
+from conftest import SAMPLE_LOGS, get_sample_log
+import numpy as np
+import pytest
+
+
+def get_grid(lines):
+    return parse_matrices.get_lines_grid(lines, np.arange(len(lines)), 0)
+
+
+def parse_fields(lines, width):
+    """
+    Parses fixed-width fields one at a time with float(), the reference for parse_fixed_width_block.
+    """
+    n_field = max(len(line) for line in lines) // width
+    values = np.zeros((len(lines), n_field))
+    for row, line in enumerate(lines):
+        for column in range(n_field):
+            text = line[column * width: (column + 1) * width].strip()
+            if text.startswith("*"):
+                values[row, column] = np.nan
+            elif text:
+                values[row, column] = float(text.replace("D", "E"))
+    return values
+
+
+@pytest.mark.parametrize("number_format, width", [("{:10.5f}", 10), ("{:12.6f}", 12), ("{:14.6E}", 14),
+                                                  ("{:15.8E}", 15), ("{:13.6E}", 13)])
+def test_parse_fixed_width_block(number_format, width):
+    rng = np.random.default_rng(width)
+    numbers = rng.standard_normal((40, 5)) * 10.0 ** rng.integers(-6, 3, (40, 5))
+    lines = ["".join(number_format.format(number) for number in row) for row in numbers]
+    lines = [line.replace("E", "D") if width == 14 else line for line in lines]
+    # Exactly the same rounding as float() on the text of every field
+    np.testing.assert_array_equal(parse_matrices.parse_fixed_width_block(get_grid(lines)), parse_fields(lines, width))
+
+
+def test_parse_fixed_width_block_run_together_fields():
+    # Fields filled to the left edge run into the field before them, the other lines give the field ends
+    lines = ["-123.45678-234.56789   0.12345", "   1.00000-999.99999  -0.00001", "   1.00000   2.00000   3.00000"]
+    values = parse_matrices.parse_fixed_width_block(get_grid(lines))
+    np.testing.assert_array_equal(values, parse_fields(lines, 10))
+    assert values[0, 1] == -234.56789
+
+
+def test_parse_fixed_width_block_overflow_and_blank():
+    lines = ["   0.12345**********   2.00000", "   1.00000", "  -3.00000             4.00000"]
+    values = parse_matrices.parse_fixed_width_block(get_grid(lines))
+    expected = np.array([[0.12345, np.nan, 2.0], [1.0, 0.0, 0.0], [-3.0, 0.0, 4.0]])
+    np.testing.assert_array_equal(values, expected)
+
+
+def test_parse_fixed_width_block_mixed_decimals():
+    lines = ["  1.0  2.00", "  3.0 -4.00", "    5-0.125"]
+    np.testing.assert_array_equal(parse_matrices.parse_fixed_width_block(get_grid(lines)),
+                                  [[1.0, 2.0], [3.0, -4.0], [5.0, -0.125]])
+
+
+@pytest.mark.parametrize("lines", [["  1.0  2.00", "  3.0  4.0 "], ["  1.0   2.0", "  1.0   abc"], ["  1.0   2.0", "  1.0   1-2"],
+                                   ["1.2.3 4.5"]])
+def test_parse_fixed_width_block_other_layouts(lines):
+    assert parse_matrices.parse_fixed_width_block(get_grid(lines)) is None
+
+
+def test_parse_fixed_width_block_chunks(monkeypatch):
+    rng = np.random.default_rng(0)
+    lines = ["".join("{:10.5f}".format(number) for number in row) for row in rng.standard_normal((50, 5))]
+    # The widest line only comes after the first chunk
+    lines[:7] = [line[:20] for line in lines[:7]]
+    expected = parse_fields(lines, 10)
+    monkeypatch.setattr(parse_matrices, "GRID_CHUNK_ROWS", 7)
+    np.testing.assert_array_equal(parse_matrices.parse_fixed_width_block(get_grid(lines)), expected)
+
+
+def test_parse_matrix_line():
+    np.testing.assert_array_equal(parse_matrices.parse_matrix_line("  1  0.1D+01 -0.2D+00**********", 3),
+                                  [1.0, -0.2, np.nan])
+    with pytest.raises(ValueError, match="cannot be read"):
+        parse_matrices.parse_matrix_line("  1  0.1  abc", 3)
+
+
+def get_arrays(data, prefix=""):
+    arrays = {}
+    for name, value in vars(data).items():
+        if isinstance(value, np.ndarray):
+            arrays[prefix + name] = value
+        elif hasattr(value, "__dataclass_fields__") and not name.startswith("_"):
+            arrays.update(get_arrays(value, prefix + name + "."))
+    return arrays
+
+
+@pytest.mark.parametrize("name", SAMPLE_LOGS)
+def test_bulk_matrices_match_line_by_line(name, monkeypatch):
+    box = fc.parse(get_sample_log(name))
+    # Without the bulk conversion every block is parsed line by line
+    monkeypatch.setattr(parse_matrices, "parse_fixed_width_block", lambda grid: None)
+    line_box = fc.parse(get_sample_log(name))
+    arrays, line_arrays = get_arrays(box.pop_data), get_arrays(line_box.pop_data)
+    assert arrays.keys() == line_arrays.keys()
+    for key, array in arrays.items():
+        np.testing.assert_array_equal(array, line_arrays[key], err_msg=key)
@@ -0,0 +1,31 @@
+from fasma.core import file_compressor as fc
+from fasma.gaussian import parse_matrices
+from conftest import get_sample_log
+import numpy as np
+
+
+def test_ghf_spin_orbital_overlap():
+    overlap_matrix = np.array([[1.0, 0.2], [0.2, 1.0]])
+    rng = np.random.default_rng(0)
+    mo_coefficient_matrix = rng.standard_normal((4, 4)) + 1j * rng.standard_normal((4, 4))
+    spin_orbital_overlap_matrix = np.kron(overlap_matrix, np.eye(2))
+    # The spin-free projection matches the projection with the spin orbital overlap
+    np.testing.assert_allclose(parse_matrices.get_ao_projection(overlap_matrix, mo_coefficient_matrix),
+                               np.dot(spin_orbital_overlap_matrix, mo_coefficient_matrix) * np.conj(mo_coefficient_matrix))
+
+
+def test_get_spin_orbital_overlap_matrix():
+    box = fc.parse(get_sample_log("ammonia_casscf_pop"))
+    assert box.basic_data.scf_type == "GHF"
+    overlap_matrix = box.pop_data.overlap_matrix
+    spin_orbital_overlap_matrix = box.pop_data.get_spin_orbital_overlap_matrix()
+    assert spin_orbital_overlap_matrix.shape == (2 * len(overlap_matrix), 2 * len(overlap_matrix))
+    assert np.iscomplexobj(spin_orbital_overlap_matrix)
+    np.testing.assert_array_equal(spin_orbital_overlap_matrix[::2, ::2], overlap_matrix)
+    np.testing.assert_array_equal(spin_orbital_overlap_matrix[1::2, 1::2], overlap_matrix)
+    np.testing.assert_array_equal(spin_orbital_overlap_matrix[::2, 1::2], 0)
+    # The AO projections are the ones of the spin orbital overlap
+    mo_coefficient_matrix = box.pop_data.electron_data.mo_coefficient_matrix
+    np.testing.assert_allclose(box.pop_data.electron_data.ao_projection_matrix,
+                               np.dot(spin_orbital_overlap_matrix, mo_coefficient_matrix) * np.conj(mo_coefficient_matrix),
+                               atol=1e-12)
@@ -0,0 +1,105 @@
+from fasma.chronus import parse_rt
+from fasma.core import file_compressor as fc
+import numpy as np
+import pytest
+import gzip
+
+HEADER = ("ChronusQ header\n  [RT]\n ====\n\n"
+          "  Step       Time (AU)         Energy (Eh)       Dipole X (AU)       Dipole Y (AU)       Dipole Z (AU)\n"
+          "  " + "-" * 100 + "\n")
+FOOTER = "\n  ChronusQ Job Ended\n"
+
+
+def get_trajectory(n_step: int):
+    time = np.arange(n_step) * 0.05
+    dipole = np.column_stack([1e-3 * np.sin(time), 1e-3 * np.cos(time), 0.5 + 1e-4 * time])
+    return time, dipole
+
+
+def write_rt_file(filename, n_step: int):
+    time, dipole = get_trajectory(n_step)
+    rows = ["{:8d} {:16.8f} {:20.12f} {:20.12e} {:20.12e} {:20.12e}".format(step, time[step], -76.0, *dipole[step])
+            for step in range(n_step)]
+    text = HEADER + "\n".join(rows) + "\n" + FOOTER
+    opener = gzip.open if filename.endswith(".gz") else open
+    with opener(filename, "wt") as f:
+        f.write(text)
+    return filename
+
+
+def read_rt_lines(filename):
+    """
+    The line by line reading of the step table the streaming reader replaced.
+    """
+    opener = gzip.open if filename.endswith(".gz") else open
+    with opener(filename, "rt") as f:
+        lines = f.read().split("\n")
+    start = next(index for index, line in enumerate(lines) if "Time (AU)" in line) + 2
+    rows = []
+    for line in lines[start:]:
+        words = line.split()
+        if not words or not words[0].isdigit():
+            break
+        rows.append([float(words[column]) for column in parse_rt.RT_COLUMNS])
+    rows = np.array(rows)
+    return len(rows), rows[:, 0], rows[:, 1:]
+
+
+@pytest.fixture
+def rt_file(tmp_path):
+    return write_rt_file(str(tmp_path / "rt.out"), 1003)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 113, 4096, parse_rt.READ_CHUNK_SIZE])
+def test_chunk_boundaries(rt_file, chunk_size):
+    n_step, time, dipole = parse_rt.read_rt_steps(rt_file, chunk_size=chunk_size)
+    expected_n_step, expected_time, expected_dipole = read_rt_lines(rt_file)
+    assert n_step == expected_n_step == 1003
+    np.testing.assert_array_equal(time, expected_time)
+    np.testing.assert_array_equal(dipole, expected_dipole)
+
+
+@pytest.mark.parametrize("chunk_size", [53, 4096])
+@pytest.mark.parametrize("every_step", [1, 3, 10, 2000])
+def test_every_step(rt_file, chunk_size, every_step):
+    n_step, time, dipole = parse_rt.read_rt_steps(rt_file, every_step, chunk_size=chunk_size)
+    _, expected_time, expected_dipole = read_rt_lines(rt_file)
+    assert n_step == 1003
+    np.testing.assert_array_equal(time, expected_time[::every_step])
+    np.testing.assert_array_equal(dipole, expected_dipole[::every_step])
+
+
+def test_compressed_file(tmp_path):
+    compressed_file = write_rt_file(str(tmp_path / "rt.out.gz"), 500)
+    n_step, time, dipole = parse_rt.read_rt_steps(compressed_file, chunk_size=100)
+    expected_n_step, expected_time, expected_dipole = read_rt_lines(compressed_file)
+    assert n_step == expected_n_step
+    np.testing.assert_array_equal(time, expected_time)
+    np.testing.assert_array_equal(dipole, expected_dipole)
+
+
+def test_file_without_table(tmp_path):
+    filename = str(tmp_path / "empty.out")
+    with open(filename, "w") as f:
+        f.write(HEADER + FOOTER)
+    with pytest.raises(ValueError):
+        parse_rt.read_rt_steps(filename)
+    with pytest.raises(ValueError):
+        parse_rt.read_rt_steps(filename, every_step=0)
+
+
+def test_file_compressor_dispatch(rt_file):
+    box = fc.parse(rt_file, cache=False)
+    assert box.basic_data is None
+    assert box.spectra_data.n_step == 1003
+    assert len(box.spectra_data.time) == 1003
+
+
+def test_spectrum_is_not_thinned_out_twice(rt_file):
+    every_step_box = parse_rt.parse(rt_file, every_step=4)
+    every_step_spectrum = every_step_box.spectra_data.get_spectrum()
+    every_step_spectrum.gen_spect(res=200)
+    spectrum = parse_rt.parse(rt_file).spectra_data.get_spectrum()
+    spectrum.gen_spect(res=200, every_step=4)
+    np.testing.assert_allclose(every_step_spectrum.freq, spectrum.freq)
+    np.testing.assert_allclose(every_step_spectrum.spect, spectrum.spect)
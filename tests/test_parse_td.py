@@ -0,0 +1,150 @@
+from fasma.core import file_compressor as fc
+from fasma.core import line_store as ls
+from fasma.gaussian import parse_td
+from conftest import get_sample_log
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+N_MO = 40
+
+
+def get_excited_states_text(scf_type: str, n_state: int, seed: int = 0) -> bytes:
+    """
+    Writes the excited states of a TD job of the given SCF type, with configurations laid out the way Gaussian
+    prints them, "5 ->  6" for RHF, "5B -> 7B" for UHF and a real and an imaginary amplitude for GHF.
+    """
+    rng = np.random.default_rng(seed)
+    lines = []
+    for current_state in range(n_state):
+        lines.append(f" Excited State {current_state + 1:3d}:      Singlet-A1     {8 + current_state / 10:.4f} eV  "
+                     f"152.63 nm  f={rng.random():.4f}  <S**2>=0.000")
+        for _ in range(rng.integers(1, 8)):
+            from_mo, to_mo = rng.integers(1, N_MO // 2), rng.integers(N_MO // 2, N_MO + 1)
+            arrow = "->" if rng.random() < 0.8 else "<-"
+            amplitude = rng.uniform(-0.7, 0.7)
+            if scf_type == "UHF":
+                spin = "A" if rng.random() < 0.5 else "B"
+                lines.append(f"    {from_mo:3d}{spin} {arrow}{to_mo:3d}{spin}        {amplitude:8.5f}")
+            elif scf_type == "GHF":
+                lines.append(f"    {from_mo:5d} {arrow}{to_mo:5d}        {amplitude:8.5f}  {rng.uniform(-0.1, 0.1):8.5f}")
+            else:
+                lines.append(f"    {from_mo:5d} {arrow}{to_mo:5d}        {amplitude:8.5f}")
+        if current_state == 0:
+            lines.append(" This state for optimization and/or second-order correction.")
+            lines.append(" Total Energy, E(TD-HF/TD-DFT) =  -75.9")
+        lines.append(" ")
+    lines.append(" SavETr:  write IOETrn=   770 NScale= 10 NData=  16 NLR=1 NState=    3 LETran=     118.")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def get_reference_delta_diagonals(scf_type, file_lines, line_num, n_active_space_mo):
+    """
+    The delta diagonals of an excited state read line by line, as td_get_excited_state did before the configurations
+    were parsed in one pass.
+    """
+    dtype = complex if scf_type == "GHF" else float
+    alpha_delta_diagonal = np.zeros(n_active_space_mo, dtype=dtype)
+    beta_delta_diagonal = np.zeros(n_active_space_mo, dtype=dtype)
+    line_num += 1
+    while "->" in file_lines[line_num - 1] or "<-" in file_lines[line_num - 1]:
+        current_line = file_lines[line_num - 1].replace("<-", "->").replace(">", "> ").split()
+        if scf_type == "GHF":
+            transfer_value = complex(float(current_line[3]), float(current_line[4]))
+        else:
+            transfer_value = float(current_line[3])
+        if "B" in current_line[0]:
+            from_mo = int(current_line[0].replace("B", "")) - 1
+            to_mo = int(current_line[2].replace("B", "")) - 1
+            current_delta_diag = beta_delta_diagonal
+        else:
+            from_mo = int(current_line[0].replace("A", "")) - 1
+            to_mo = int(current_line[2].replace("A", "")) - 1
+            current_delta_diag = alpha_delta_diagonal
+        multiplier = 2 if scf_type in ["RHF", "ROHF"] else 1
+        current_delta_diag[from_mo] -= multiplier * np.dot(transfer_value, np.conjugate(transfer_value))
+        current_delta_diag[to_mo] += multiplier * np.dot(transfer_value, np.conjugate(transfer_value))
+        line_num += 1
+    return alpha_delta_diagonal, beta_delta_diagonal
+
+
+def get_reference_delta_diagonal_matrices(scf_type, file_lines, state_lines, n_active_space_mo):
+    delta_diagonals = [get_reference_delta_diagonals(scf_type, file_lines, line_num, n_active_space_mo)
+                       for line_num in state_lines]
+    return np.array([alpha for alpha, _ in delta_diagonals]), np.array([beta for _, beta in delta_diagonals])
+
+
+def get_state_lines(file_lines) -> list:
+    return [current_index + 1 for current_index in range(len(file_lines)) if "Excited State" in file_lines[current_index]]
+
+
+@pytest.mark.parametrize("scf_type", ["RHF", "ROHF", "UHF", "GHF"])
+@pytest.mark.parametrize("sparse", [False, True])
+def test_td_delta_diagonal_matrices(scf_type, sparse):
+    text = get_excited_states_text(scf_type, 30, seed=len(scf_type))
+    file_lines = ls.LineStore(text, ls.find_line_offsets(text))
+    state_lines = get_state_lines(file_lines)
+    basic = SimpleNamespace(scf_type=scf_type)
+    amplitudes = parse_td.get_td_amplitudes(basic, file_lines, state_lines)
+    alpha_matrix, beta_matrix = parse_td.get_td_delta_diagonal_matrices(basic, amplitudes, len(state_lines), N_MO,
+                                                                        sparse=sparse)
+    reference_alpha_matrix, reference_beta_matrix = get_reference_delta_diagonal_matrices(scf_type, file_lines,
+                                                                                          state_lines, N_MO)
+    if sparse:
+        alpha_matrix, beta_matrix = alpha_matrix.toarray(), beta_matrix.toarray()
+        # The sparse matrices sum the weights of every MO in another order
+        np.testing.assert_allclose(alpha_matrix, reference_alpha_matrix, rtol=0, atol=1e-14)
+        np.testing.assert_allclose(beta_matrix, reference_beta_matrix, rtol=0, atol=1e-14)
+    else:
+        np.testing.assert_array_equal(alpha_matrix, reference_alpha_matrix)
+        np.testing.assert_array_equal(beta_matrix, reference_beta_matrix)
+    assert np.iscomplexobj(alpha_matrix) == (scf_type == "GHF")
+    assert beta_matrix.any() == (scf_type == "UHF")
+
+
+def test_td_amplitudes():
+    text = (b" Excited State   1:  Triplet-A  1.0 eV  1240.0 nm  f=0.0000  <S**2>=2.000\n"
+            b"      5B ->  7B        -0.10224\n      12A <- 13A   0.5\n\n"
+            b" Excited State   2:  Triplet-A  2.0 eV  620.0 nm  f=0.0000  <S**2>=2.000\n      1B ->10B  0.25\n")
+    file_lines = ls.LineStore(text, ls.find_line_offsets(text))
+    state_indices, from_mo, to_mo, beta, amplitudes = parse_td.get_td_amplitudes(SimpleNamespace(scf_type="UHF"),
+                                                                                 file_lines, [1, 5])
+    np.testing.assert_array_equal(state_indices, [0, 0, 1])
+    np.testing.assert_array_equal(from_mo, [4, 11, 0])
+    np.testing.assert_array_equal(to_mo, [6, 12, 9])
+    np.testing.assert_array_equal(beta, [True, False, True])
+    np.testing.assert_array_equal(amplitudes, [-0.10224, 0.5, 0.25])
+    ghf_text = b" Excited State   1:  1.0 eV  f=0.0000\n      5 ->  6         0.70434  -0.00012\n"
+    file_lines = ls.LineStore(ghf_text, ls.find_line_offsets(ghf_text))
+    amplitudes = parse_td.get_td_amplitudes(SimpleNamespace(scf_type="GHF"), file_lines, [1])[-1]
+    np.testing.assert_array_equal(amplitudes, [0.70434 - 0.00012j])
+
+
+def test_td_replaced_lines():
+    text = get_excited_states_text("UHF", 5)
+    file_lines = ls.LineStore(text, ls.find_line_offsets(text))
+    state_lines = get_state_lines(file_lines)
+    # A replaced line is read from its new text instead of the buffer
+    file_lines[state_lines[1]] = "      1B ->  2B        0.50000"
+    basic = SimpleNamespace(scf_type="UHF")
+    amplitudes = parse_td.get_td_amplitudes(basic, file_lines, state_lines)
+    alpha_matrix, beta_matrix = parse_td.get_td_delta_diagonal_matrices(basic, amplitudes, len(state_lines), N_MO)
+    reference_alpha_matrix, reference_beta_matrix = get_reference_delta_diagonal_matrices("UHF", file_lines,
+                                                                                          state_lines, N_MO)
+    np.testing.assert_array_equal(alpha_matrix, reference_alpha_matrix)
+    np.testing.assert_array_equal(beta_matrix, reference_beta_matrix)
+
+
+def test_td_logs(td_jobs_log):
+    for filename in (get_sample_log("water_td-rhf"), td_jobs_log):
+        box_list = fc.parse(filename)
+        box_list = box_list if isinstance(box_list, list) else [box_list]
+        file_lines = ls.map_file(filename)
+        state_lines = get_state_lines(file_lines)
+        for box in box_list:
+            spectra_data = box.spectra_data
+            n_excitation = spectra_data.n_excitation
+            job_state_lines, state_lines = state_lines[:n_excitation], state_lines[n_excitation:]
+            reference_alpha_matrix, _ = get_reference_delta_diagonal_matrices(
+                box.basic_data.scf_type, file_lines, job_state_lines, spectra_data.n_active_space_mo)
+            np.testing.assert_array_equal(spectra_data.delta_diagonal_matrix, reference_alpha_matrix)
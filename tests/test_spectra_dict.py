@@ -0,0 +1,76 @@
+from fasma.core import df_filters as dff
+from fasma.core import df_generators as dfg
+from fasma.core import file_compressor as fc
+from conftest import get_sample_log
+import numpy as np
+import pytest
+import warnings
+
+INDEX_LISTS = [[], ["Atom Type"], ["Atom Number"], ["Atom Number", "Atom Type"], ["Principal Quantum Number"],
+               ["Atom Type", "Principal Quantum Number", "Subshell"], ["Atom Type", "Subshell", "Atomic Orbital"]]
+
+
+@pytest.fixture(scope="module")
+def water_box():
+    return fc.parse(get_sample_log("water_td-rhf"))
+
+
+@pytest.fixture(scope="module")
+def ao_transition_analyses(water_box):
+    return (water_box.generate_ao_transition_analysis(),
+            water_box.generate_ao_transition_analysis(long_format=True))
+
+
+def get_spectra_dicts(wide_df, long_df, state_breakdown):
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        plotting_df = dfg.get_plotting_dataframe(wide_df, state_breakdown=state_breakdown, mo_breakdown=True)
+        spectra_dict = dfg.get_spectra_dict(plotting_df)
+        n_wide_warning = len(caught)
+        long_spectra_dict = dfg.get_long_spectra_dict(long_df, state_breakdown=state_breakdown)
+        # Both warn the same way about a Subshell level next to an Atomic Orbital level
+        assert len(caught) == 2 * n_wide_warning
+    return spectra_dict, long_spectra_dict
+
+
+def assert_same_spectra(spectra_dict, long_spectra_dict):
+    assert set(long_spectra_dict) == set(spectra_dict)
+    for name, spectrum in spectra_dict.items():
+        long_spectrum = long_spectra_dict[name]
+        x, y = np.asarray(spectrum.x), np.asarray(spectrum.y)
+        long_x, long_y = np.asarray(long_spectrum.x), np.asarray(long_spectrum.y)
+        # The wide spectra keep the zero sticks at both ends of the transitions of their row
+        np.testing.assert_allclose(np.sort(long_x[long_y != 0]), np.sort(x[y != 0]))
+        np.testing.assert_allclose(long_y.sum(), y.sum())
+
+
+@pytest.mark.parametrize("state_breakdown", [False, True])
+@pytest.mark.parametrize("index", INDEX_LISTS)
+def test_long_spectra_dict_matches_wide(ao_transition_analyses, index, state_breakdown):
+    wide_df, long_df = ao_transition_analyses
+    spectra_dict, long_spectra_dict = get_spectra_dicts(dff.filter_transition_rows(wide_df, index),
+                                                        dff.filter_long_transition_rows(long_df, index), state_breakdown)
+    assert spectra_dict
+    assert_same_spectra(spectra_dict, long_spectra_dict)
+
+
+def test_long_spectra_dict_names(ao_transition_analyses):
+    _, long_df = ao_transition_analyses
+    names = dfg.get_long_spectra_dict(dff.filter_long_transition_rows(long_df, ["Atom Type"]), spectra_name="water")
+    assert "water AS MO 6 H" in names
+    names = dfg.get_long_spectra_dict(dff.filter_long_transition_rows(long_df, ["Atom Number"]))
+    assert "AS MO 6 Atom 2" in names
+    names = dfg.get_long_spectra_dict(dff.filter_long_transition_rows(long_df, ["Principal Quantum Number"]))
+    assert "AS MO 5 PQN 2" in names
+
+
+def test_long_spectra_dict_mo_groups(water_box, ao_transition_analyses):
+    wide_df, long_df = ao_transition_analyses
+    basic_data = water_box.basic_data
+    custom_mo_dict = {"homo": [basic_data.homo]}
+    wide_df = dff.filter_transition_columns(dff.filter_transition_rows(wide_df, ["Atom Type"]), custom_mo_dict, basic_data)
+    long_df = dff.filter_long_transition_columns(dff.filter_long_transition_rows(long_df, ["Atom Type"]), custom_mo_dict,
+                                                 basic_data)
+    spectra_dict, long_spectra_dict = get_spectra_dicts(wide_df, long_df, False)
+    assert "homo O" in spectra_dict
+    assert_same_spectra(spectra_dict, long_spectra_dict)